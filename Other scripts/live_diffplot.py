@@ -47,8 +47,6 @@ try:
             wlens = Wlen.getter()
             spec1 = np.array(spec1, dtype = 'uint16')
             energies = convert_nm_eV(np.array(wlens))
-            
-            mp._plot_windows[plabel].xdata = energies
         else :
             spec1 = Spec.getter().data
             time.sleep(0.1)
@@ -62,8 +60,7 @@ try:
         spec2 = Spec.getter().data
         spec2 = np.array(spec2,dtype = 'uint16').mean(axis=0)[:]
         
-        mp._plot_windows[plabel].ydata = (spec1 - spec2) #/ (spec2)
-        mp._plot_windows[plabel].update_plot()
+        mp._plot_windows[plabel].set_data(energies, spec1 - spec2) #/ (spec2)
         
         time.sleep(1)
     mp.close()
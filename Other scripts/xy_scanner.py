@@ -75,15 +75,12 @@ try:
                     wlens = Wlen.getter()
                     spec = np.array(spec, dtype = 'uint16')
                     energies = convert_nm_eV(np.array(wlens))
-            
-                    mp._plot_windows[plabel].xdata = wlens
                 else:
                     spec = Spec.getter().data
                     time.sleep(0.1)
         
                 spec = np.array(spec,dtype = 'uint16').mean(axis=0)[:]
-                mp._plot_windows[plabel].ydata = spec
-                mp._plot_windows[plabel].update_plot()
+                mp._plot_windows[plabel].set_data(wlens, spec)
 
                 if any(spec > count_thr):
                     print(f"Scanner stopped at ({x}, {y}): count exceeded {count_thr}")
@@ -94,8 +91,7 @@ try:
                     while threshold_exceeded:
                         spec = Spec.getter().data
                         spec = np.array(spec, dtype='uint16').mean(axis=0)[:]
-                        mp._plot_windows[plabel].ydata = spec
-                        mp._plot_windows[plabel].update_plot()
+                        mp._plot_windows[plabel].set_data(wlens, spec)
                         time.sleep(1) 
                         
                         if user_input == 'y': threshold_exceeded = False
@@ -124,7 +120,8 @@ mp = MultiPlotter()
 def plot(mp):
     mp.initialize()
     plabel = "APD counts"
-    pwindow = PlotWindow("Counts vs Time", "Time (s)", r"APD counts")
+    # last 10^5 points, the redraw does not slow down however long it runs
+    pwindow = PlotWindow("Counts vs Time", "Time (s)", r"APD counts", max_points = 100000)
     mp.add_plot(plabel, pwindow)
     mp.main_loop()
 
@@ -135,20 +132,14 @@ time.sleep(0.1)
 
 # Live update loop
 start_time = time.time()
-time_data, counts_data = [], []
 
 try:
     while True:
         current_time = time.time() - start_time  # Time elapsed since start
         counts = c_APD.getter()
         
-        time_data.append(current_time)
-        counts_data.append(counts)
-        
-        # Update plot
-        mp._plot_windows["APD counts"].xdata = time_data
-        mp._plot_windows["APD counts"].ydata = counts_data
-        mp._plot_windows["APD counts"].update_plot()
+        # Plotted by the plot thread
+        mp._plot_windows["APD counts"].update_xy(current_time, counts)
         
 except Exception as e:
     print("Exception caught. Closing.")
@@ -163,7 +154,8 @@ mp = MultiPlotter()
 def power_plot(mp):
     mp.initialize()
     plabel = "Power"
-    pwindow = PlotWindow("Power vs Time", "Time (s)", r"Power ($\mu$W)")
+    # last 10^5 points, the redraw does not slow down however long it runs
+    pwindow = PlotWindow("Power vs Time", "Time (s)", r"Power ($\mu$W)", max_points = 100000)
     mp.add_plot(plabel, pwindow)
     mp.main_loop()
 
@@ -174,25 +166,14 @@ time.sleep(0.1)
 
 # Live update loop
 start_time = time.time()
-time_data, power_data = [], []
 
 try:
     while True:
         current_time = time.time() - start_time  # Time elapsed since start
         power = P_det.getter()
         
-        time_data.append(current_time)
-        power_data.append(power)
-        
-        # Keep only the last 100 points to avoid overcrowding
-        # if len(time_data) > 100:
-        #     time_data.pop(0)
-        #     power_data.pop(0)
-        
-        # Update plot
-        mp._plot_windows["Power"].xdata = time_data
-        mp._plot_windows["Power"].ydata = power_data
-        mp._plot_windows["Power"].update_plot()
+        # Plotted by the plot thread
+        mp._plot_windows["Power"].update_xy(current_time, power)
         
 except Exception as e:
     print("Exception caught. Closing.")
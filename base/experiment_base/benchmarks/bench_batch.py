@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:31:49 2026
+
+@author: zerui
+
+The setter / getter sequences of main.py call by call and as one
+pyro_batch.Batch, on the simulated instruments served over a local Pyro
+nameserver (zq_drivers/sim_server). Per sequence the median time (ms)
+and the number of round trips:
+
+    v_134      hp.SMUn.set_voltage for SMU1, 3, 4 (v_134_setter)
+    wlen       exposure_time / num_frames saved, set, a short spectrum,
+               restored (wlen_getter)
+
+On localhost a round trip costs ~0.1 ms, over the network it is the
+link latency, --latency sets the simulated instrument time per call.
+
+    python bench_batch.py --repeat 50 --latency 1e-4
+"""
+
+import os, sys, time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'zq_drivers'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'zq_drivers', 'pyro_nw'))
+from sim_server import SimDevices
+from pyro_batch import Batch
+
+
+def v_134_calls(hp, val):
+    for smu in ('SMU1', 'SMU3', 'SMU4'):
+        getattr(hp, smu).set_voltage(val)
+
+def v_134_batch(hp, val):
+    b = Batch(hp)
+    for smu in ('SMU1', 'SMU3', 'SMU4'):
+        b.call(smu + '.set_voltage', val)
+    b.execute()
+
+def wlen_calls(ws):
+    curr_exp, curr_frames = ws.exposure_time, ws.num_frames
+    ws.exposure_time, ws.num_frames = 0.01, 1
+    spectra, wl = ws.get_spectrum(wlen = True)
+    ws.exposure_time, ws.num_frames = curr_exp, curr_frames
+    return wl
+
+def wlen_batch(ws):
+    b = Batch(ws)
+    b.get('exposure_time').get('num_frames')
+    b.set('exposure_time', 0.01).set('num_frames', 1)
+    b.call('get_spectrum', wlen = True)
+    curr_exp, curr_frames, _, _, (spectra, wl) = b.execute()
+    b.set('exposure_time', curr_exp).set('num_frames', curr_frames)
+    b.execute()
+    return wl
+
+def median_ms(call, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - t0)
+    return np.median(times) * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type = int, default = 50)
+    parser.add_argument('--latency', type = float, default = 1e-4, help = 'instrument time per call (s)')
+    args = parser.parse_args()
+
+    with SimDevices(mode = 'pyro', latency = args.latency, ws = dict(readout_time = 0.)) as dev:
+        hp, ws = dev.hp, dev.ws
+        for smu in ('SMU1', 'SMU3', 'SMU4'):
+            getattr(hp, smu).set_voltage_safe_step(10)
+        # same effect both ways
+        v_134_batch(hp, 0.2)
+        assert all(abs(getattr(hp, smu).get_voltage() - 0.2) < 1e-3 for smu in ('SMU1', 'SMU3', 'SMU4'))
+        assert np.array_equal(wlen_calls(ws), wlen_batch(ws))
+
+        rows = [('v_134', 'calls', 6, lambda: v_134_calls(hp, 0.1)),
+                ('v_134', 'batch', 1, lambda: v_134_batch(hp, 0.1)),
+                ('wlen', 'calls', 7, lambda: wlen_calls(ws)),
+                ('wlen', 'batch', 2, lambda: wlen_batch(ws))]
+        print(f"{'sequence':>10}{'mode':>8}{'round trips':>13}{'ms':>10}")
+        for name, mode, round_trips, call in rows:
+            call()
+            print(f"{name:>10}{mode:>8}{round_trips:>13}{median_ms(call, args.repeat):>10.3f}")
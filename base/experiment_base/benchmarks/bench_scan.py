@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:07:16 2026
+
+@author: zerui
+
+Runs meas_scan end to end on the simulated instruments (zq_drivers/sim_server),
+in process or over a local Pyro nameserver. For every scenario it reports
+
+    pts/s      measured points per second
+    set, get   mean time per point in setters and getters (ms), from the
+               phase times of meas_scan (zq_diagnostics)
+    wait       waits and settle time per point of the scan plan (ms)
+    engine     time per point not spent in instruments or waits (ms), the
+               wall time minus the dry run model of meas_scan (zq_estimate)
+               fed with the getter / setter times of this run
+    write MB/s throughput of the data writer
+
+    python bench_scan.py --mode both --lines 10 --points 50 --latency 1e-3
+"""
+
+import os, sys, io
+import contextlib
+import shutil
+import tempfile
+import argparse
+import numpy as np
+import xarray as xr
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'zq_drivers'))
+from zq_experiment_base import Param, ParamGroup, meas_scan, DAQ_AO, DAQ_Counter, DAQ_AI, SafeStepRamp, RateRamp
+from sim_server import SimDevices
+
+
+def hp_params(dev, n_lines, n_points):
+    # hp.SMUn is a new proxy on every access over Pyro
+    SMU1, SMU3, SMU4 = dev.hp.SMU1, dev.hp.SMU3, dev.hp.SMU4
+    for smu in (SMU1, SMU3, SMU4):
+        smu.set_voltage_safe_step(0.025)
+    Vtg = Param('Vtg', units = 'V', setter = SMU1.set_voltage,
+                device = 'hp', ramp = SafeStepRamp(0.025))
+    VL = Param('VL', units = 'V', setter = SMU3.set_voltage,
+               device = 'hp', ramp = SafeStepRamp(0.025))
+    IL = Param('IL', units = 'nA', getter = lambda: SMU3.get_current()*1e9, device = 'hp')
+    IR = Param('IR', units = 'nA', getter = lambda: SMU4.get_current()*1e9, device = 'hp')
+    sweep = [(Vtg, np.linspace(0, 0.01*(n_lines - 1), n_lines)),
+             (VL, np.linspace(0, 0.01*(n_points - 1), n_points))]
+    return sweep, [IL, IR], {}
+
+def daq_params(dev, n_lines, n_points, dwell, hw_timed):
+    daq = dev.daq
+    SCx = Param('ScannerX', units = 'V', setter = lambda val: daq.set_ao1(val/15),
+                hw = DAQ_AO(daq, 'ao1', scale = 1/15), ramp = RateRamp(rate = 1, scale = 1/15), device = 'daq')
+    SCy = Param('ScannerY', units = 'V', setter = lambda val: daq.set_ao2(val/15),
+                hw = DAQ_AO(daq, 'ao2', scale = 1/15), ramp = RateRamp(rate = 1, scale = 1/15), device = 'daq')
+    c_APD = Param('Counts', units = 'counts',
+                  getter = lambda: daq.get_one_ctrate(sampling_rate = 3e4, acq_time = dwell),
+                  hw = DAQ_Counter(daq, 'ctr2', dwell = dwell, sampling_rate = 3e4), device = 'daq')
+    P_det = Param('Power', units = 'V',
+                  getter = lambda: daq.measure_ai(ai_channel = 1, rate = 3e4,
+                                                  nr_samples = max(int(dwell*3e4), 1))[0],
+                  hw = DAQ_AI(daq, 'ai1', dwell = dwell, sampling_rate = 3e4), device = 'daq')
+    sweep = [(SCy, np.linspace(0, 1.5, n_lines)), (SCx, np.linspace(0, 1.5, n_points))]
+    return sweep, [c_APD, P_det], dict(hw_timed_lines = hw_timed)
+
+def spectra_params(dev, n_lines, n_points, dwell):
+    SMU3, ws = dev.hp.SMU3, dev.ws
+    SMU3.set_voltage_safe_step(0.025)
+    ws.exposure_time = dwell
+    ws.num_frames = 1
+    wl = np.array(ws.wavelengths())
+    def spec_getter():
+        spectra = np.array(ws.get_spectrum(wlen = False)).astype('uint16')[:, :, 0]
+        return xr.DataArray(spectra, coords = {'Frame': np.arange(spectra.shape[0]).astype('uint16'),
+                                               'Wavelength': wl},
+                            dims = ('Frame', 'Wavelength'))
+    VL = Param('VL', units = 'V', setter = SMU3.set_voltage,
+               device = 'hp', ramp = SafeStepRamp(0.025))
+    Power = Param('Power', units = 'V', setter = lambda val: dev.daq.set_ao0(val, rate = 0),
+                  device = 'daq')
+    Spec = Param('Spec', units = 'counts', getter = spec_getter, device = 'ws')
+    IL = Param('IL', units = 'nA', getter = lambda: SMU3.get_current()*1e9, device = 'hp')
+    sweep = [(Power, np.linspace(0, 1, n_lines)), (VL, np.linspace(0, 0.01*(n_points - 1), n_points))]
+    return sweep, [Spec, IL], {}
+
+def lockin_params(dev, n_lines, n_points, snapshot = False):
+    sr, daq = dev.sr, dev.daq
+    Vac = Param('Vac', units = 'V', setter = lambda val: daq.set_ao0(val, rate = 0), device = 'daq')
+    Freq = Param('Freq', units = 'Hz', setter = lambda val: setattr(sr, 'frequency', val),
+                 device = 'sr')
+    X = Param('X', units = 'V', getter = sr.get_X, device = 'sr')
+    Y = Param('Y', units = 'V', getter = sr.get_Y, device = 'sr')
+    if snapshot:
+        ParamGroup([X, Y], getter = lambda: sr.snapshot('X', 'Y'))
+    sweep = [(Vac, np.linspace(0, 1, n_lines)), (Freq, np.linspace(10, 100, n_points))]
+    return sweep, [X, Y], {}
+
+SCENARIOS = ('hp_iv', 'daq_map', 'daq_map_hw', 'spectra', 'lockin', 'lockin_snap')
+
+def make_scenario(name, dev, args):
+    if name == 'hp_iv':
+        return hp_params(dev, args.lines, args.points)
+    if name == 'daq_map':
+        return daq_params(dev, args.lines, args.points, args.dwell, hw_timed = False)
+    if name == 'daq_map_hw':
+        return daq_params(dev, args.lines, args.points, args.dwell, hw_timed = True)
+    if name == 'spectra':
+        return spectra_params(dev, args.lines, args.points, args.dwell)
+    if name == 'lockin':
+        return lockin_params(dev, args.lines, args.points)
+    if name == 'lockin_snap':
+        return lockin_params(dev, args.lines, args.points, snapshot = True)
+    raise ValueError(f"Unknown scenario {name}, choose from {SCENARIOS}")
+
+def data_nbytes(filename):
+    with xr.open_dataset(filename, group = 'main_data') as ds:
+        return sum(ds[name].nbytes for name in ds.data_vars)
+
+def run(name, mode, args, tmpdir):
+    measdatapath = os.path.join(tmpdir, f'{name}_{mode}')
+    os.makedirs(measdatapath)
+    with SimDevices(mode = mode, latency = args.latency) as dev:
+        sweep_params, meas_params, options = make_scenario(name, dev, args)
+        waits = dict(const_wait_time = 0, wait_before = args.wait, wait_after = 0,
+                     wait_scan_line = args.wait, wait_btw_measurements = 0)
+        start_values = [param.pv for param, _ in sweep_params]
+        result = meas_scan(sweep_params, meas_params = list(meas_params), measdatapath = measdatapath,
+                           script_path = os.path.abspath(__file__), storage_backend = args.backend,
+                           **waits, **options)
+        for (param, _), value in zip(sweep_params, start_values):
+            param.pv = value
+        with contextlib.redirect_stdout(io.StringIO()):
+            model = meas_scan(sweep_params, meas_params = list(meas_params), measdatapath = measdatapath,
+                              dry_run = True, **waits, **options)
+    n = result['n_points']
+    # setter / getter times of the diagnostics of meas_scan (zq_diagnostics)
+    phase_total = lambda prefix: sum(s['total'] for name, s in result['timing'].items()
+                                     if name.startswith(prefix))
+    writer = result['writer']
+    nbytes = data_nbytes(result['filename'])
+    write_time = writer['lines_written'] * writer['mean_write_time'] if writer else 0.
+    return dict(points = n, wall = result['elapsed'], pts_per_s = n / result['elapsed'],
+                set = phase_total('set_') / n * 1e3, get = phase_total('get_') / n * 1e3,
+                wait = (model['point_time']['wait'] + model['point_time']['settle']) * 1e3,
+                engine = (result['elapsed'] - model['total_time']) / n * 1e3,
+                write = nbytes / write_time / 1e6 if write_time > 0 else float('nan'),
+                mbytes = nbytes / 1e6)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', default = 'inprocess', choices = ('inprocess', 'pyro', 'both'))
+    parser.add_argument('--scenarios', nargs = '+', default = list(SCENARIOS), choices = SCENARIOS)
+    parser.add_argument('--lines', type = int, default = 5)
+    parser.add_argument('--points', type = int, default = 20)
+    parser.add_argument('--latency', type = float, default = 1e-3, help = 'latency of every instrument call (s)')
+    parser.add_argument('--dwell', type = float, default = 5e-3, help = 'acquisition time per point (s)')
+    parser.add_argument('--wait', type = float, default = 0., help = 'wait_before and wait_scan_line (s)')
+    parser.add_argument('--backend', default = 'netcdf4')
+    args = parser.parse_args()
+
+    modes = ('inprocess', 'pyro') if args.mode == 'both' else (args.mode,)
+    tmpdir = tempfile.mkdtemp(prefix = 'bench_scan_')
+    rows = []
+    try:
+        for mode in modes:
+            for name in args.scenarios:
+                rows.append((name, mode, run(name, mode, args, tmpdir)))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors = True)
+
+    print('\n{:<12}{:<11}{:>8}{:>9}{:>9}{:>9}{:>9}{:>11}{:>12}{:>9}'.format(
+        'scenario', 'mode', 'points', 'pts/s', 'set ms', 'get ms', 'wait ms', 'engine ms', 'write MB/s', 'MB'))
+    for name, mode, r in rows:
+        print('{:<12}{:<11}{:>8d}{:>9.1f}{:>9.2f}{:>9.2f}{:>9.2f}{:>11.2f}{:>12.1f}{:>9.2f}'.format(
+            name, mode, r['points'], r['pts_per_s'], r['set'], r['get'], r['wait'], r['engine'],
+            r['write'], r['mbytes']))
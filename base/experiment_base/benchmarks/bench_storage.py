@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 07:52:10 2026
+
+@author: zerui
+
+Compares the storage backends of zq_storage for a scalar scan (a few float
+params) and a spectral scan (uint16 spectra). For every backend it reports
+the write throughput, the file size and the time to reopen and load the
+data with xarray.
+
+    python bench_storage.py --lines 100 --points 100 --pixels 1340
+"""
+
+import os, sys, time
+import shutil
+import tempfile
+import argparse
+import numpy as np
+import xarray as xr
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from zq_experiment_base import Param
+from zq_storage import StorageSession, get_backend
+
+
+def scalar_scan(n_lines, n_points, rng):
+    """Three float params on a smooth background with noise."""
+    params = [Param(label) for label in ('IL', 'IR', 'Itg')]
+    def line(iline):
+        x = np.linspace(0, 1, n_points)
+        return [np.sin(2*np.pi*(x + 0.01*iline)) + 0.01*rng.standard_normal(n_points)
+                for _ in params]
+    for param in params:
+        param.pv = 0.
+    return params, line
+
+def spectral_scan(n_lines, n_points, n_pixels, rng):
+    """One uint16 spectrum per point, a peak on a dark count background."""
+    wl = np.linspace(700, 800, n_pixels)
+    Spec = Param('Spec', units = 'counts')
+    Spec.pv = xr.DataArray(np.zeros((1, n_pixels), dtype = np.uint16),
+                           coords = {'Frame': np.arange(1).astype('uint16'), 'Wavelength': wl},
+                           dims = ('Frame', 'Wavelength'))
+    def line(iline):
+        center = 750 + 20*np.sin(np.linspace(0, np.pi, n_points) + 0.05*iline)
+        peak = 3000*np.exp(-(wl[None, :] - center[:, None])**2 / 2.)
+        return [rng.poisson(600 + peak)[:, None, :].astype(np.uint16)]
+    return [Spec], line
+
+def path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+def reopen(filename, backend):
+    if backend == 'zarr':
+        ds = xr.open_zarr(filename, group = 'main_data')
+    elif backend == 'hdf5':
+        ds = xr.open_dataset(filename, group = 'main_data', engine = 'h5netcdf')
+    else:
+        ds = xr.open_dataset(filename, group = 'main_data')
+    ds.load()
+    ds.close()
+
+def run(backend, compression, scan, args, tmpdir):
+    rng = np.random.default_rng(0)
+    if scan == 'scalar':
+        meas_params, make_line = scalar_scan(args.lines, args.points, rng)
+    else:
+        meas_params, make_line = spectral_scan(args.lines, args.points, args.pixels, rng)
+    sweep_params = [(Param('Y'), np.arange(args.lines, dtype = float)),
+                    (Param('X'), np.arange(args.points, dtype = float))]
+    sweep_lens = [args.lines, args.points]
+    filename = os.path.join(tmpdir, '{}_{}{}'.format(scan, backend, get_backend(backend).extension))
+
+    t_write = 0.
+    nbytes = 0
+    with StorageSession(filename, sync = 'exit', backend = backend, compression = compression) as session:
+        session.create(sweep_params, meas_params)
+        for iline in range(args.lines):
+            data = make_line(iline)
+            nbytes += sum(d.nbytes for d in data)
+            t0 = time.perf_counter()
+            session.write_line(meas_params, sweep_lens, data,
+                               np.arange(iline*args.points, (iline + 1)*args.points))
+            t_write += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        session.close()
+        t_write += time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    reopen(filename, backend)
+    t_reopen = time.perf_counter() - t0
+    return nbytes / t_write / 1e6, path_size(filename) / 1e6, nbytes / 1e6, t_reopen
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type = int, default = 100)
+    parser.add_argument('--points', type = int, default = 100)
+    parser.add_argument('--pixels', type = int, default = 1340)
+    parser.add_argument('--spec-compressor', default = 'zstd',
+                        help = "compressor of the spectra for zarr / hdf5 ('lz4', 'zstd', 'zlib')")
+    parser.add_argument('--level', type = int, default = 3)
+    args = parser.parse_args()
+
+    spec_compression = {'Spec': dict(compressor = args.spec_compressor, level = args.level, shuffle = True)}
+    configs = [
+        ('netcdf4', None),
+        ('hdf5', spec_compression),
+        ('zarr', spec_compression),
+        ]
+
+    tmpdir = tempfile.mkdtemp(prefix = 'bench_storage_')
+    print('{:<10}{:<10}{:>12}{:>12}{:>12}{:>12}'.format('scan', 'backend', 'write MB/s', 'raw MB', 'file MB', 'reopen s'))
+    try:
+        for scan in ('scalar', 'spectral'):
+            for backend, compression in configs:
+                try:
+                    mbps, size, raw, t_reopen = run(backend, compression, scan, args, tmpdir)
+                except ImportError as e:
+                    print('{:<10}{:<10} skipped: {}'.format(scan, backend, e))
+                    continue
+                print('{:<10}{:<10}{:>12.1f}{:>12.1f}{:>12.1f}{:>12.3f}'.format(scan, backend, mbps, raw, size, t_reopen))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors = True)
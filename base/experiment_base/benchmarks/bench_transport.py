@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:32:04 2026
+
+@author: zerui
+
+Latency and throughput of Pyro calls returning (get) or sending (put)
+numpy arrays of growing size, with the pickle serializer of the lab setup
+and the numpy transport of pyro_nw/pyro_numpy (raw buffers, optionally
+LZ4 compressed). The server runs in a background thread on localhost,
+so the numbers are the serialization and copy cost without the network.
+
+    spectrum   uint16 frames of 1340 pixels, a peak on a dark background
+    random     float64 noise (incompressible)
+
+    python bench_transport.py --kind spectrum --max-mb 64
+"""
+
+import os, sys, time
+import threading
+import argparse
+import numpy as np
+import Pyro4
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'zq_drivers', 'pyro_nw'))
+import pyro_numpy
+
+Pyro4.config.SERIALIZERS_ACCEPTED.add('pickle')
+Pyro4.config.SERIALIZER = "pickle"
+Pyro4.config.PICKLE_PROTOCOL_VERSION = 4
+
+TRANSPORTS = ('pickle', 'numpy', 'numpy_lz4')
+
+
+def make_payload(kind, n_bytes, rng):
+    if kind == 'random':
+        return rng.standard_normal(max(n_bytes // 8, 1))
+    n_pixels = 1340
+    n_frames = max(n_bytes // (2 * n_pixels), 1)
+    wl = np.linspace(700, 800, n_pixels)
+    peak = 3000 * np.exp(-(wl - 750)**2 / 2.)
+    return rng.poisson(600 + peak, (n_frames, n_pixels)).astype(np.uint16)[:, :, None]
+
+@Pyro4.expose
+class PayloadServer(object):
+    def __init__(self):
+        self.payload = None
+
+    def load(self, kind, n_bytes):
+        self.payload = make_payload(kind, n_bytes, np.random.default_rng(0))
+        return self.payload.nbytes
+
+    def get(self):
+        return self.payload
+
+    def put(self, array):
+        return array.nbytes
+
+def timed(call, min_time, min_calls = 5):
+    times = []
+    t_start = time.perf_counter()
+    while len(times) < min_calls or time.perf_counter() - t_start < min_time:
+        t0 = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--kind', default = 'spectrum', choices = ('spectrum', 'random'))
+    parser.add_argument('--max-mb', type = float, default = 64)
+    parser.add_argument('--min-time', type = float, default = 0.5, help = 'seconds per measurement')
+    args = parser.parse_args()
+
+    pyro_numpy.register()
+    daemon = Pyro4.Daemon(host = 'localhost')
+    uri = daemon.register(PayloadServer())
+    threading.Thread(target = daemon.requestLoop, daemon = True).start()
+    proxies = {}
+    for transport in TRANSPORTS:
+        proxy = Pyro4.Proxy(uri)
+        proxy._pyroBind()
+        if transport != 'pickle':
+            pyro_numpy.use_numpy_transport(proxy, compress = transport == 'numpy_lz4')
+        proxies[transport] = proxy
+
+    sizes = [int(1e3 * 4**i) for i in range(20) if 1e3 * 4**i <= args.max_mb * 1e6]
+    print('{:>10}{:>12}{:>12}{:>12}{:>12}{:>12}'.format('MB', 'transport', 'get ms', 'get MB/s', 'put ms', 'put MB/s'))
+    try:
+        for n_bytes in sizes:
+            n_bytes = proxies['pickle'].load(args.kind, n_bytes)
+            payload = make_payload(args.kind, n_bytes, np.random.default_rng(1))
+            for transport, proxy in proxies.items():
+                t_get = timed(proxy.get, args.min_time)
+                t_put = timed(lambda: proxy.put(payload), args.min_time)
+                print('{:>10.3f}{:>12}{:>12.3f}{:>12.1f}{:>12.3f}{:>12.1f}'.format(
+                    n_bytes / 1e6, transport, t_get * 1e3, n_bytes / t_get / 1e6, t_put * 1e3, n_bytes / t_put / 1e6))
+    finally:
+        for proxy in proxies.values():
+            proxy._pyroRelease()
+        daemon.shutdown()
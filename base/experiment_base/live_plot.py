@@ -20,123 +20,375 @@ def get_rand():
     return np.random.rand(1)[0]
 
 
+def make_plot_widget(title, xlabel, ylabel):
+    """The styled plot of the plot windows."""
+    plot_graph = pg.PlotWidget()
+    plot_graph.setBackground((0, 0, 0))
+    plot_graph.setTitle(title, color = (246, 241, 238), size = "20pt", bold = True)
+    styles = {"color": "red", "font-size": "16pt"}
+    plot_graph.setLabel("left", ylabel, **styles)
+    plot_graph.setLabel("bottom", xlabel, **styles)  
+    plot_graph.showGrid(x=True, y=True)
+
+
+    # Get X and Y AxisItems
+    x_axis = plot_graph.getAxis('bottom')
+    y_axis = plot_graph.getAxis('left')
+
+    # Set font size for X and Y axis ticks
+    font = QFont()
+    font.setPointSize(12)  # Set desired font size
+    font.setBold(False)
+    for axis in [x_axis, y_axis]:
+        axis.setTickFont(font)
+        axis.setTickPen((246, 241, 238))
+        axis.setTextPen((246, 241, 238))
+        axis.setPen(color=(246, 241, 238), width=2)
+    return plot_graph
+
+
+class PlotBuffer(object):
+    """
+    x and y of a curve in preallocated numpy arrays, appending is O(1).
+    Without max_points the arrays double when full. With max_points only
+    the last max_points points are kept (rolling window): every point is
+    written twice, at i and i + max_points of arrays of 2*max_points, so
+    the window is always one contiguous slice and never has to be moved.
+    The data is never moved, full arrays are replaced by new ones.
+    """
+    def __init__(self, max_points = None, capacity = 1024):
+        self.max_points = max_points
+        self.version = 0 # changes when the points are replaced
+        self._allocate(capacity)
+        
+    def _allocate(self, capacity):
+        size = 2 * self.max_points if self.max_points else max(capacity, 1)
+        self._x = np.empty(size)
+        self._y = np.empty(size)
+        self.count = 0 # points appended or set, counts up also in the rolling window
+        self.monotonic = True # x never decreased, needed for clip to view
+        
+    def _grow(self, n):
+        size = max(2 * len(self._x), n)
+        for name in ('_x', '_y'):
+            old = getattr(self, name)
+            new = np.empty(size)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+            
+    def append(self, x, y):
+        if self.count and x < self._x[(self.count - 1) % self.max_points if self.max_points else self.count - 1]:
+            self.monotonic = False
+        n = self.max_points
+        if n:
+            i = self.count % n
+            self._x[i] = self._x[i + n] = x
+            self._y[i] = self._y[i + n] = y
+        else:
+            if self.count == len(self._x):
+                self._grow(self.count + 1)
+            self._x[self.count] = x
+            self._y[self.count] = y
+        self.count += 1
+        
+    def extend(self, x, y):
+        x, y = np.asarray(x, dtype = float).ravel(), np.asarray(y, dtype = float).ravel()
+        if self.max_points or len(x) < 16:
+            for xi, yi in zip(x, y):
+                self.append(xi, yi)
+            return
+        if self.count + len(x) > len(self._x):
+            self._grow(self.count + len(x))
+        if np.any(np.diff(x) < 0) or (self.count and x[0] < self._x[self.count - 1]):
+            self.monotonic = False
+        self._x[self.count:self.count + len(x)] = x
+        self._y[self.count:self.count + len(y)] = y
+        self.count += len(x)
+        
+    def set(self, x, y):
+        """Replace all points (e.g. a spectrum)."""
+        x, y = np.asarray(x, dtype = float).ravel(), np.asarray(y, dtype = float).ravel()
+        if len(x) != len(y):
+            raise ValueError(f"x and y of different length: {len(x)}, {len(y)}")
+        if self.max_points:
+            x, y = x[-self.max_points:], y[-self.max_points:]
+        # new arrays, the curve may still draw the old ones
+        self._allocate(len(x))
+        self.version += 1
+        self.extend(x, y)
+        
+    def data(self):
+        """Views of the x and y points in the order they were appended."""
+        n = self.max_points
+        if n and self.count > n:
+            start = self.count % n
+            return self._x[start:start + n], self._y[start:start + n]
+        return self._x[:self.count], self._y[:self.count]
+    
+
 class PlotWindow(QtWidgets.QMainWindow):
-    def __init__(self, title, xlabel, ylabel):
+    """
+    A curve of y vs x. update_xy adds a point (from any thread), set_data
+    replaces all points, update_plot redraws (GUI thread) only if the
+    points changed. max_points = None keeps all points, a number only the
+    last max_points (rolling window, e.g. for monitors running for days).
+    Only the visible points are drawn (clip to view) and downsampled to
+    the screen resolution keeping the peaks, so the frame time does not
+    grow with the number of points. Both assume increasing x (time
+    series) and are turned off once x decreases.
+    """
+    sig_closed = QtCore.pyqtSignal()
+    
+    def __init__(self, title, xlabel, ylabel, max_points = None):
         super().__init__()
 
-        self.xdata = []
-        self.ydata = []
+        self.buffer = PlotBuffer(max_points)
+        self._drawn = None
         self.closed = False
 
-        self.plot_graph = pg.PlotWidget()
+        self.plot_graph = make_plot_widget(title, xlabel, ylabel)
         self.setCentralWidget(self.plot_graph)
         self.setGeometry(200, 100, 640, 480)
-        self.plot_graph.setBackground((0, 0, 0))
-        self.plot_graph.setTitle(title, color = (246, 241, 238), size = "20pt", bold = True)
-        styles = {"color": "red", "font-size": "16pt"}
-        self.plot_graph.setLabel("left", ylabel, **styles)
-        self.plot_graph.setLabel("bottom", xlabel, **styles)  
-        self.plot_graph.showGrid(x=True, y=True)
-
-
-        # Get X and Y AxisItems
-        x_axis = self.plot_graph.getAxis('bottom')
-        y_axis = self.plot_graph.getAxis('left')
-
-        # Set font size for X and Y axis ticks
-        font = QFont()
-        font.setPointSize(12)  # Set desired font size
-        font.setBold(False)
-        for axis in [x_axis, y_axis]:
-            axis.setTickFont(font)
-            axis.setTickPen((246, 241, 238))
-            axis.setTextPen((246, 241, 238))
-            axis.setPen(color=(246, 241, 238), width=2)
 
         pen = pg.mkPen((160, 32, 240), width=1, style=QtCore.Qt.SolidLine)
         
         # time = np.arange(100)
         # temperature = np.sin(time/3.14)
         # self.plot_graph.addLegend() # provide name for each line that is plotted
-        self.line = self.plot_graph.plot(self.xdata, self.ydata, pen = pen,
+        self.line = self.plot_graph.plot(*self.buffer.data(), pen = pen,
                              symbol="o",
                              symbolSize=3,
                              symbolBrush=(160, 32, 240))
+        self.line.setClipToView(True)
+        self.line.setDownsampling(auto = True, method = 'peak')
+        
+    @property
+    def xdata(self):
+        return self.buffer.data()[0]
+    
+    @property
+    def ydata(self):
+        return self.buffer.data()[1]
         
     def update_xy(self, xnew, ynew):
-        # self.xdata = self.xdata[1:]
-        self.xdata.append(xnew)
-        # self.ydata = self.ydata[1:]
-        self.ydata.append(ynew)
+        self.buffer.append(xnew, ynew)
+        
+    def extend_xy(self, xnew, ynew):
+        self.buffer.extend(xnew, ynew)
+        
+    def set_data(self, x, y):
+        self.buffer.set(x, y)
+        
+    @property
+    def dirty(self):
+        """Points changed since the last update_plot."""
+        return (self.buffer.version, self.buffer.count) != self._drawn
         
     def update_plot(self):
-        self.line.setData(self.xdata, self.ydata)
+        state = (self.buffer.version, self.buffer.count)
+        if state == self._drawn:
+            return
+        self._drawn = state
+        monotonic = self.buffer.monotonic
+        if self.line.opts['clipToView'] != monotonic:
+            self.line.setClipToView(monotonic)
+            self.line.setDownsampling(auto = monotonic, method = 'peak')
+        self.line.setData(*self.buffer.data())
             
     def closeEvent(self, *args, **kwargs):
         super(QtWidgets.QMainWindow, self).closeEvent(*args, **kwargs)
         self.closed = True
+        self.sig_closed.emit()
+
+class ImageWindow(QtWidgets.QMainWindow):
+    """
+    An image of data (rows, cols), e.g. a 2D map over the sweep grid or a
+    waterfall of spectra, NaN where nothing was measured yet. rect =
+    (x, y, width, height) places the array on the axes. update_region
+    colors only the pixels of data that changed. The levels follow the
+    min and max of the data seen so far, the whole image is only recolored
+    when they have to be widened. update_plot redraws if pixels changed.
+    """
+    sig_closed = QtCore.pyqtSignal()
+    
+    def __init__(self, title, xlabel, ylabel, data, rect = None, colormap = 'viridis'):
+        super().__init__()
+
+        self.title = title
+        self.data = data
+        self.levels = None
+        self._range = None # min and max of the data seen
+        self._changed = False
+        self.closed = False
+        self.lut = pg.colormap.get(colormap).getLookupTable(nPts = 256, alpha = True)
+        self.rgba = np.zeros(data.shape + (4,), dtype = np.uint8)
+
+        self.plot_graph = make_plot_widget(title, xlabel, ylabel)
+        self.setCentralWidget(self.plot_graph)
+        self.setGeometry(200, 100, 640, 480)
+        self.image = pg.ImageItem(axisOrder = 'row-major')
+        self.plot_graph.addItem(self.image)
+        self.image.setImage(self.rgba, autoLevels = False)
+        if rect is not None:
+            self.image.setRect(QtCore.QRectF(*rect))
+        self.update_region(slice(None), slice(None))
+        
+    def _colors(self, values):
+        lo, hi = self.levels
+        finite = np.isfinite(values)
+        index = np.zeros(values.shape, dtype = np.intp)
+        index[finite] = np.clip((values[finite] - lo) * (len(self.lut) - 1) / (hi - lo), 0, len(self.lut) - 1)
+        colors = self.lut[index]
+        colors[~finite] = 0 # transparent
+        return colors
+        
+    def update_region(self, rows, cols):
+        """Recolor data[rows, cols] (slices)."""
+        if self.data is None:
+            return
+        values = self.data[rows, cols]
+        finite = values[np.isfinite(values)]
+        if finite.size == 0 and self.levels is None:
+            return
+        if finite.size:
+            lo, hi = float(finite.min()), float(finite.max())
+            if self._range is not None:
+                lo, hi = min(lo, self._range[0]), max(hi, self._range[1])
+            self._range = (lo, hi)
+            if self.levels is None or lo < self.levels[0] or hi > self.levels[1]:
+                # widened with a margin, so a drift does not recolor at every point
+                margin = 0.05 * (hi - lo) or 0.05 * abs(hi) or 1.
+                self.levels = (lo - margin, hi + margin)
+                rows, cols = slice(None), slice(None)
+                values = self.data
+        self.rgba[rows, cols] = self._colors(values)
+        self._changed = True
+        
+    @property
+    def dirty(self):
+        return self._changed
+        
+    def update_plot(self):
+        if not self._changed:
+            return
+        self._changed = False
+        self.image.updateImage()
+        lo, hi = self.levels
+        self.setWindowTitle(f"{self.title}  [{lo:.4g}, {hi:.4g}]")
+            
+    def closeEvent(self, *args, **kwargs):
+        super(QtWidgets.QMainWindow, self).closeEvent(*args, **kwargs)
+        self.closed = True
+        self.sig_closed.emit()
 
 import threading
+import collections
 
 
 class MultiPlotter(object):
     """
-    This is not the best way to implement threading in Qt.
-    Must call close() before the program exits.
+    Plot windows on a Qt thread, fed by the measurement thread:
     
-    Scratch all this.
-    It's just much easier to make all plots inside one server and access
-    that with the measurement script
+        mp = MultiPlotter()
+        def plot(mp):
+            mp.initialize()
+            mp.add_plot("APD counts", PlotWindow("Counts vs Time", "Time (s)", "APD counts"))
+            mp.main_loop()
+        threading.Thread(target = plot, args = ([mp]), daemon = True).start()
+        ...
+        mp._plot_windows["APD counts"].update_xy(t, counts) # measurement thread
+        ...
+        mp.close() # waits until the windows are closed
     
+    main_loop runs the Qt event loop with a timer at fps that redraws only
+    the windows whose data changed (dirty), several updates between two
+    frames are drawn once. Closed windows are no longer redrawn, the loop
+    ends when all are closed or on stop(). The time of every frame (data
+    to the windows and painting) is kept, see frame_stats.
     """
-    def __init__(self):
+    def __init__(self, fps = 10):
+        self.fps = fps
         self._plot_windows = {}
-        # self._qapps = []        
-        # tQt = threading.Thread(target=self._qapp.exec, args=())
-        # tQt.start()
-        # self.tQt = threading.Thread(target=self.main_loop, args=(), daemon = False)
-        # self.tQt.start()
+        self._open = set()
+        self._running = False
+        self._finished = threading.Event()
+        self.frame_times = collections.deque(maxlen = 1000)
+        self.n_frames = 0
         
     def initialize(self):
-        self._qapp =  QtWidgets.QApplication([])
+        self._qapp = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
         self._running = True
+        self._finished.clear()
         
     def main_loop(self):
-        while(self._running):
-            self.update_all_plots()
-            time.sleep(0.1)
-            for window in self._plot_windows.values():
-                if window.closed:
-                    self.stop()
+        timer = QtCore.QTimer()
+        timer.timeout.connect(self._tick)
+        timer.start(int(1000 / self.fps))
+        try:
+            if self._running and self._open:
+                self._qapp.exec()
+        finally:
+            timer.stop()
+            self._running = False
+            self._finished.set()
+            self.print_frame_stats()
+        
+    def _tick(self):
+        if not self._running or not self._open:
+            self._qapp.quit()
+            return
+        self.update_all_plots()
         
     def process(self):
-        # [qapp.processEvents() for qapp in self._qapps]
         self._qapp.processEvents() 
 
-    # def update_plot(self, plot_label):
-    #     if not plot_label in self._plot_windows.keys():
-    #         print('Error: no such plot - {}'.format(plot_label))
-    #     self._plot_windows[plot_label].update_plot()
-    #     self.process()
     def update_all_plots(self):
-        for pwindow in self._plot_windows.values():
-            pwindow.update_plot()
-        self.process()            
+        """Redraw the windows that changed, returns the number redrawn."""
+        t0 = time.perf_counter()
+        dirty = [label for label in self._open if self._plot_windows[label].dirty]
+        if not dirty:
+            return 0
+        for label in dirty:
+            self._plot_windows[label].update_plot()
+        self.process()
+        self.frame_times.append(time.perf_counter() - t0)
+        self.n_frames += 1
+        return len(dirty)
+        
     def add_plot(self, plot_label, plot_window : PlotWindow):
         if not plot_label in self._plot_windows.keys():
-            # self._qapps.append( QtWidgets.QApplication([]))
             self._plot_windows[plot_label] = plot_window
+            self._open.add(plot_label)
+            plot_window.sig_closed.connect(lambda: self._open.discard(plot_label))
             self._plot_windows[plot_label].show()
         else:
             print('Error: plot labeled {} already exists'.format(plot_label))
+            
+    def frame_stats(self):
+        """Frames drawn and mean, 95th percentile and max of the last 1000 frame times (s)."""
+        times = np.array(self.frame_times)
+        if len(times) == 0:
+            return dict(n = self.n_frames, mean = np.nan, p95 = np.nan, max = np.nan)
+        return dict(n = self.n_frames, mean = float(times.mean()), p95 = float(np.percentile(times, 95)), max = float(times.max()))
+    
+    def print_frame_stats(self):
+        s = self.frame_stats()
+        if s['n']:
+            print(f"Plots: {s['n']} frames, frame time mean {s['mean']*1e3:.1f} ms, "
+                  f"p95 {s['p95']*1e3:.1f} ms, max {s['max']*1e3:.1f} ms (budget {1e3/self.fps:.0f} ms)")
 
     def close(self):
-        # [qapp.exec() for qapp in self._qapps]
-        # self.tQt.stop()
-        # self._running = False
-        self._qapp.exec()
+        """Wait until the plot windows are closed."""
+        if not self._running:
+            return
+        if QtCore.QThread.currentThread() is self._qapp.thread():
+            # not on a plot thread, show the plots here
+            self.main_loop()
+        else:
+            self._finished.wait()
         
     def stop(self):
+        """Stop redrawing, the event loop ends at the next frame."""
         self._running = False     
 
 def test_live_plots(mp):
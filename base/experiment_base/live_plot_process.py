@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:18:36 2026
+
+@author: zerui
+
+Live plots in a separate process, fed through shared memory.
+
+The scan writes every point into a SharedRing (one float64 per plotted
+param) and never waits for the plotter: a full ring overwrites the
+oldest points, a plotter that died or hangs only loses its plots. The
+plot process (this file run as a script) reads the new points of the
+ring at its own frame rate.
+
+    plotter = live_plot_process()        # started once, reused by later scans
+    plotter.start_scan(title, ['VL (V)', 'IL (nA)'], [('IL', 0, 1)])
+    plotter.publish([VL.pv, IL.pv])      # per point
+    plotter.end_scan()
+
+Images (2D maps, waterfalls of spectra) are SharedArrays shaped like the
+sweep grid that the scan writes into directly. The ring records carry
+the indices of the point, the plot process recolors only the pixels or
+rows of the new points.
+
+    image = plotter.add_image('map', (len(Vg), len(Vb)), 'Vb (V)', 'Vg (V)', rect, 2, 3)
+    image.data[ig, ib] = I.pv            # per point, before publish
+
+The windows of a scan stay open until the next scan starts. When the
+scan process exits, the plot process keeps its windows until they are
+closed.
+"""
+
+import os, sys, time
+import struct
+import pickle
+import queue
+import threading
+import subprocess
+import numpy as np
+from multiprocessing import shared_memory
+
+
+def _attach(name):
+    shm = shared_memory.SharedMemory(name = name)
+    if os.name == 'posix':
+        # the scan process owns the segment, not the resource tracker of
+        # the plot process (which would unlink it at exit)
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+def _close(shm, owner):
+    shm.close()
+    if owner:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedRing(object):
+    """
+    Single producer / single consumer ring of float64 records in shared
+    memory, without locks. The header holds the capacity, the record size
+    and the number of records written so far. The writer fills the slot
+    before it increments the count. The reader copies the records between
+    its position and the count and drops those the writer may have
+    overwritten meanwhile.
+    """
+    HEADER = 4 # int64: capacity, n_channels, count, unused
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.owner = owner
+        self.name = shm.name
+        self._header = np.ndarray((self.HEADER,), dtype = np.int64, buffer = shm.buf)
+        self.capacity, self.n_channels = int(self._header[0]), int(self._header[1])
+        self._data = np.ndarray((self.capacity, self.n_channels), dtype = np.float64,
+                                buffer = shm.buf, offset = 8 * self.HEADER)
+
+    @classmethod
+    def create(cls, n_channels, capacity = 1 << 16):
+        size = 8 * (cls.HEADER + capacity * n_channels)
+        shm = shared_memory.SharedMemory(create = True, size = size)
+        header = np.ndarray((cls.HEADER,), dtype = np.int64, buffer = shm.buf)
+        header[:] = (capacity, n_channels, 0, 0)
+        del header
+        return cls(shm, owner = True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach(name), owner = False)
+
+    @property
+    def count(self):
+        return int(self._header[2])
+
+    def write(self, values):
+        count = int(self._header[2])
+        self._data[count % self.capacity] = values
+        self._header[2] = count + 1
+
+    def read(self, position):
+        """
+        Records from position on. Returns (records, new position, number
+        of records lost because the reader was too slow).
+        """
+        count = int(self._header[2])
+        start = max(position, count - self.capacity)
+        records = self._data[np.arange(start, count) % self.capacity]
+        # slots the writer reached while they were copied
+        overwritten = int(self._header[2]) - self.capacity - start
+        if overwritten > 0:
+            records = records[overwritten:]
+        return records, count, start - position + max(overwritten, 0)
+
+    def close(self):
+        self._header = self._data = None
+        _close(self._shm, self.owner)
+
+
+class SharedArray(object):
+    """A float64 array in shared memory, NaN where nothing was written."""
+    def __init__(self, shm, shape, owner):
+        self._shm = shm
+        self.owner = owner
+        self.name = shm.name
+        self.shape = tuple(shape)
+        self.data = np.ndarray(self.shape, dtype = np.float64, buffer = shm.buf)
+
+    @classmethod
+    def create(cls, shape):
+        shm = shared_memory.SharedMemory(create = True, size = 8 * max(int(np.prod(shape)), 1))
+        array = cls(shm, shape, owner = True)
+        array.data[...] = np.nan
+        return array
+
+    @classmethod
+    def attach(cls, name, shape):
+        return cls(_attach(name), shape, owner = False)
+
+    def close(self):
+        self.data = None
+        _close(self._shm, self.owner)
+
+
+class PlotProcess(object):
+    """
+    The scan side of the plot process. Commands go pickled through the
+    stdin pipe of the process, points through a SharedRing per scan.
+    Nothing here raises into the scan: if the process is gone, the scan
+    continues without plots and the next start_scan starts a new process.
+    """
+    def __init__(self, capacity = 1 << 16, fps = 20):
+        self.capacity = capacity
+        self.fps = fps
+        self.ring = None
+        self._old_ring = None
+        self.arrays = []
+        self._old_arrays = []
+        self._process = None
+
+    def alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def _start(self):
+        path = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([path] + [p for p in sys.path if p])
+        self._process = subprocess.Popen([sys.executable, os.path.abspath(__file__), str(self.fps)],
+                                         stdin = subprocess.PIPE, env = env)
+
+    def _send(self, *command):
+        try:
+            data = pickle.dumps(command)
+            self._process.stdin.write(struct.pack('<I', len(data)) + data)
+            self._process.stdin.flush()
+            return True
+        except (OSError, ValueError, AttributeError):
+            return False
+
+    def start_scan(self, title, channels, plots):
+        """
+        New plots for a scan. channels are the axis labels of the published
+        values, plots is [(plot label, x channel index, y channel index)].
+        """
+        try:
+            if not self.alive():
+                self._start()
+            # the previous ring is kept until now so the plot process can
+            # still attach to it, it has its own mapping after that
+            if self._old_ring is not None:
+                self._old_ring.close()
+            for array in self._old_arrays:
+                array.close()
+            self._old_ring, self._old_arrays = self.ring, self.arrays
+            self.arrays = []
+            self.ring = SharedRing.create(len(channels), self.capacity)
+            if not self._send('scan', self.ring.name, title, list(channels), list(plots)):
+                print("Live plot process is not responding, no plots")
+        except Exception as e:
+            print(f"Could not start the live plot process: {e}")
+            self.ring = None
+
+    def add_image(self, label, shape, xlabel, ylabel, rect, row_channel, col_channel = None):
+        """
+        An image window of the current scan, returns its SharedArray (None
+        if there is no plot process). rect = (x, y, width, height) maps the
+        array on the axes. The record of a point that changed data[row, col]
+        holds row and col in the channels row_channel and col_channel,
+        col_channel = None means the whole row changed (waterfall).
+        """
+        if self.ring is None:
+            return None
+        try:
+            array = SharedArray.create(shape)
+        except Exception as e:
+            print(f"Could not create the image {label}: {e}")
+            return None
+        self.arrays.append(array)
+        self._send('image', array.name, array.shape, label, xlabel, ylabel, tuple(rect), row_channel, col_channel)
+        return array
+
+    def publish(self, values):
+        """Write one point, never blocks or raises."""
+        if self.ring is None:
+            return
+        try:
+            self.ring.write(values)
+        except Exception:
+            pass
+
+    def end_scan(self):
+        self._send('end')
+
+    def close(self, timeout = 5):
+        """Close the plot windows and stop the process."""
+        if self.alive():
+            self._send('close')
+            try:
+                self._process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        self._process = None
+        for ring in (self._old_ring, self.ring):
+            if ring is not None:
+                ring.close()
+        for array in self._old_arrays + self.arrays:
+            array.close()
+        self.ring = self._old_ring = None
+        self.arrays, self._old_arrays = [], []
+
+_plot_process = None
+
+def live_plot_process():
+    """The plot process shared by all scans of this python session."""
+    global _plot_process
+    if _plot_process is None:
+        _plot_process = PlotProcess()
+    return _plot_process
+
+def plot_value(value):
+    """A published value: scalars as float, anything else (spectra) as NaN."""
+    try:
+        value = np.asarray(value, dtype = float)
+        return float(value) if value.size == 1 else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+def waterfall_row(value):
+    """A spectrum as one row of a waterfall, leading axes (frames) averaged."""
+    value = np.asarray(value, dtype = float)
+    if value.ndim > 1:
+        value = value.reshape(-1, value.shape[-1]).mean(axis = 0)
+    return value.ravel()
+
+
+''' Plot process '''
+
+class PlotServer(object):
+    """Reads commands from stdin and the points of the current scan at fps."""
+    def __init__(self, fps = 20):
+        from PyQt5 import QtWidgets, QtCore
+        self.app = QtWidgets.QApplication([])
+        self.app.setQuitOnLastWindowClosed(False)
+        self.windows = []
+        self.images = []
+        self.image_windows = []
+        self.ring = None
+        self.position = 0
+        self.lost = 0
+        self.commands = queue.Queue()
+        threading.Thread(target = self._read_commands, daemon = True).start()
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(int(1000 / fps))
+
+    def _read_commands(self):
+        stdin = sys.stdin.buffer
+        while True:
+            header = stdin.read(4)
+            if len(header) < 4:
+                self.commands.put(('eof',))
+                return
+            command = pickle.loads(stdin.read(struct.unpack('<I', header)[0]))
+            self.commands.put(command)
+            if command[0] == 'close':
+                # not blocked in read at exit
+                return
+
+    def _start_scan(self, name, title, channels, plots):
+        from live_plot import PlotWindow
+        for window, _, _ in self.windows:
+            window.close()
+        for window in self.image_windows:
+            window.close()
+        self._close_ring()
+        self.windows = []
+        self.image_windows = []
+        self.ring = SharedRing.attach(name)
+        self.title = title
+        self.position = 0
+        self.lost = 0
+        for plot_label, ix, iy in plots:
+            window = PlotWindow(f"{plot_label}: {title}", channels[ix], channels[iy])
+            window.show()
+            self.windows.append((window, ix, iy))
+
+    def _add_image(self, name, shape, label, xlabel, ylabel, rect, row_channel, col_channel):
+        from live_plot import ImageWindow
+        array = SharedArray.attach(name, shape)
+        window = ImageWindow(f"{label}: {self.title}", xlabel, ylabel, array.data, rect)
+        window.show()
+        self.images.append((window, array, row_channel, col_channel))
+        self.image_windows.append(window)
+
+    def _close_ring(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        for window, array, _, _ in self.images:
+            # the windows keep their colored pixels
+            window.data = None
+            array.close()
+        self.images = []
+
+    def tick(self):
+        while True:
+            try:
+                command = self.commands.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if command[0] == 'scan':
+                    self._start_scan(*command[1:])
+                elif command[0] == 'image':
+                    self._add_image(*command[1:])
+                elif command[0] == 'end':
+                    self._update()
+                    self._close_ring()
+                elif command[0] == 'close':
+                    self.app.quit()
+                    return
+                elif command[0] == 'eof':
+                    # the scan process is gone, keep the plots until closed
+                    self._update()
+                    self._close_ring()
+                    windows = [window for window, _, _ in self.windows] + self.image_windows
+                    if not any(window.isVisible() for window in windows):
+                        self.app.quit()
+                    self.app.setQuitOnLastWindowClosed(True)
+            except Exception as e:
+                print(f"Live plot: {command[0]} failed: {e}")
+        self._update()
+
+    def _update(self):
+        if self.ring is None:
+            return
+        records, self.position, lost = self.ring.read(self.position)
+        self.lost += lost
+        if not len(records):
+            return
+        for window, ix, iy in self.windows:
+            window.extend_xy(records[:, ix], records[:, iy])
+            window.update_plot()
+        for window, _, row_channel, col_channel in self.images:
+            # the box of all new points, one line of a 2D map per frame
+            # is usually a row or a few rows
+            rows = records[:, row_channel].astype(int)
+            region = slice(rows.min(), rows.max() + 1)
+            if lost:
+                window.update_region(slice(None), slice(None))
+            elif col_channel is None:
+                window.update_region(region, slice(None))
+            else:
+                cols = records[:, col_channel].astype(int)
+                window.update_region(region, slice(cols.min(), cols.max() + 1))
+            window.update_plot()
+
+    def run(self):
+        self.app.exec()
+        self._close_ring()
+
+
+if __name__ == '__main__':
+    PlotServer(fps = float(sys.argv[1]) if len(sys.argv) > 1 else 20).run()
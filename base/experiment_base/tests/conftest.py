@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:42:46 2026
+
+@author: zerui
+
+The modules of experiment_base are imported by path, like in main.py.
+"""
+
+import os, sys
+
+BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for path in (BASE, os.path.join(BASE, 'zq_drivers'), os.path.join(BASE, 'zq_drivers', 'pyro_nw')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:45:34 2026
+
+@author: zerui
+
+load_points of an adaptive scan that was interrupted, nearest_points of
+regrid.
+"""
+
+import os, glob
+import numpy as np
+import pytest
+from zq_experiment_base import Param
+import zq_adaptive
+from zq_adaptive import adaptive_scan, load_points, nearest_points
+from zq_storage import get_backend
+
+
+class Interrupt(Exception):
+    pass
+
+@pytest.mark.parametrize('backend', ['netcdf4', 'hdf5', 'zarr'])
+def test_load_interrupted_scan(tmp_path, backend):
+    X = Param('X', setter = lambda val: None)
+    n_calls = []
+    def getter():
+        if len(n_calls) == 25:
+            raise Interrupt
+        n_calls.append(1)
+        return np.sin(X.pv)
+    Z = Param('Z', getter = getter)
+    with pytest.raises(Interrupt):
+        adaptive_scan([(X, (0., 3.))], [Z], Z, n_points = 100, const_wait_time = 0,
+                      wait_before = 0, wait_after = 0, wait_btw_measurements = 0,
+                      measdatapath = str(tmp_path), script_path = __file__,
+                      storage_backend = backend, write_every = 10)
+    filename, = glob.glob(os.path.join(str(tmp_path), '*', '*', 'Measdata' + get_backend(backend).extension))
+    ds = load_points(filename)
+    # also the 5 points after the last full block of 10
+    assert ds.sizes['point'] == 25
+    np.testing.assert_allclose(ds['Z'].values, np.sin(ds['X'].values))
+    ds.close()
+
+def test_nearest_points(monkeypatch):
+    monkeypatch.setattr(zq_adaptive, 'NEAREST_CHUNK', 100)
+    rng = np.random.default_rng(0)
+    grid, points = rng.random((500, 2)), rng.random((40, 2))
+    expected = ((grid[:, None, :] - points[None, :, :])**2).sum(-1).argmin(axis = 1)
+    np.testing.assert_array_equal(nearest_points(grid, points), expected)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:42:20 2026
+
+@author: zerui
+
+The dry run of a scan with an ExpSettle whose tau is read from the instrument.
+"""
+
+import numpy as np
+import pytest
+from zq_experiment_base import Param
+from zq_estimate import estimate_scan, LatencyHistory
+from zq_settle import ExpSettle
+
+
+def estimate(tmp_path, settle):
+    X = Param('X', setter = lambda val: None, settle = settle)
+    Z = Param('Z', getter = lambda: 0.)
+    return estimate_scan([(X, np.arange(4.))], [Z], LatencyHistory(str(tmp_path / 'latency.json')),
+                         const_wait_time = 0, wait_before = 0, wait_after = 0, wait_scan_line = 0,
+                         wait_btw_measurements = 0)
+
+def read_tau():
+    raise AssertionError("the dry run read the instrument")
+
+def test_callable_tau_not_called(tmp_path):
+    with pytest.warns(UserWarning, match = 'tau_estimate'):
+        assert estimate(tmp_path, ExpSettle(read_tau))['total_time'] == 0.
+    assert estimate(tmp_path, ExpSettle(read_tau, n_tau = 5, tau_estimate = 0.1))['total_time'] == pytest.approx(4 * 0.5)
+
+def test_last_tau_read(tmp_path):
+    settle = ExpSettle(lambda: 0.2, n_tau = 2)
+    settle.delay(0., 1.) # during a scan
+    settle.tau = read_tau
+    assert estimate(tmp_path, settle)['total_time'] == pytest.approx(4 * 0.4)
+    assert estimate(tmp_path, ExpSettle(0.3, n_tau = 1))['total_time'] == pytest.approx(4 * 0.3)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:50:25 2026
+
+@author: zerui
+
+The stored dtype of measured values does not depend on the first value.
+"""
+
+import numpy as np
+import xarray as xr
+from zq_storage import LineBuffers
+from zq_experiment_base import Param, meas_scan
+
+
+def test_int_first_value():
+    buffers = LineBuffers(2, 3)
+    for position, (value, spectrum) in enumerate([(0, [1, 2]), (1.5, [3, 4]), (True, [5, 6])]):
+        buffers.store(0, position, value)
+        buffers.store(1, position, np.array(spectrum, dtype = np.uint16))
+    values, spectra = buffers.current
+    assert values.dtype == np.float64
+    np.testing.assert_array_equal(values, [0, 1.5, 1])
+    assert spectra.dtype == np.uint16
+
+def test_integer_dtypes():
+    buffers = LineBuffers(3, 2, dtypes = [None, np.int32, None])
+    for position in range(2):
+        buffers.store(0, position, np.uint32(7 * position))
+        buffers.store(1, position, 3 * position)
+        buffers.store(2, position, np.float32(position / 2))
+    assert [buf.dtype for buf in buffers.current] == [np.uint32, np.int32, np.float32]
+    np.testing.assert_array_equal(buffers.current[1], [0, 3])
+
+def test_scan_int_first_value(tmp_path):
+    X = Param('X', setter = lambda val: None)
+    Z = Param('Z', getter = lambda: 0 if X.pv == 0 else X.pv / 2)
+    result = meas_scan([(X, np.arange(4.))], meas_params = [Z],
+                       const_wait_time = 0, wait_before = 0, wait_after = 0, wait_scan_line = 0,
+                       wait_btw_measurements = 0, measdatapath = str(tmp_path), script_path = __file__)
+    with xr.open_dataset(result['filename'], group = 'main_data') as ds:
+        np.testing.assert_array_equal(ds['Z'].values, np.arange(4.) / 2)
+
+def test_scan_counts_keep_dtype(tmp_path):
+    X = Param('X', setter = lambda val: None)
+    N = Param('N', getter = lambda: np.uint32(X.pv * 3))
+    M = Param('M', getter = lambda: int(X.pv), dtype = np.int16)
+    result = meas_scan([(X, np.arange(4.))], meas_params = [N, M],
+                       const_wait_time = 0, wait_before = 0, wait_after = 0, wait_scan_line = 0,
+                       wait_btw_measurements = 0, measdatapath = str(tmp_path), script_path = __file__)
+    with xr.open_dataset(result['filename'], group = 'main_data') as ds:
+        assert ds['N'].dtype == np.uint32 and ds['M'].dtype == np.int16
+        np.testing.assert_array_equal(ds['N'].values, np.arange(4) * 3)
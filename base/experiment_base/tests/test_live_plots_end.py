@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:43:50 2026
+
+@author: zerui
+
+The live plots of a scan end also when the scan fails.
+"""
+
+import numpy as np
+import pytest
+import zq_experiment_base
+from zq_experiment_base import Param, meas_scan
+
+
+class FakePlotter(object):
+    def __init__(self):
+        self.commands = []
+
+    def start_scan(self, title, channels, plots):
+        self.commands.append('scan')
+
+    def publish(self, values):
+        self.commands.append('point')
+
+    def end_scan(self):
+        self.commands.append('end')
+
+class Interrupt(Exception):
+    pass
+
+def scan(path, fail_at = None):
+    calls = []
+    def getter():
+        if fail_at is not None and len(calls) == fail_at:
+            raise Interrupt
+        calls.append(X.pv)
+        return X.pv
+    X = Param('X', setter = lambda val: None)
+    Z = Param('Z', getter = getter)
+    return meas_scan([(X, np.arange(4.))], meas_params = [Z], param_plot_specifiers = [('Z', X, Z)],
+                     const_wait_time = 0, wait_before = 0, wait_after = 0, wait_scan_line = 0,
+                     wait_btw_measurements = 0, measdatapath = str(path), script_path = __file__)
+
+@pytest.mark.parametrize('fail_at', [None, 2])
+def test_plots_end(tmp_path, monkeypatch, fail_at):
+    plotter = FakePlotter()
+    monkeypatch.setattr(zq_experiment_base, 'live_plot_process', lambda: plotter)
+    if fail_at is None:
+        scan(tmp_path)
+    else:
+        with pytest.raises(Interrupt):
+            scan(tmp_path, fail_at = fail_at)
+    assert plotter.commands[0] == 'scan' and plotter.commands[-1] == 'end'
+    assert plotter.commands.count('point') == (4 if fail_at is None else fail_at)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:42:15 2026
+
+@author: zerui
+
+ParamGroup queries only the members a scan measures.
+"""
+
+import numpy as np
+import pytest
+import xarray as xr
+from zq_experiment_base import Param, ParamGroup, meas_scan
+
+
+def make_params(queries):
+    def get_currents(channels):
+        queries.append(list(channels))
+        return [float(channel) for channel in channels]
+    params = {label: Param(label, device = 'hp') for label in ('I1', 'I3', 'I4', 'Itg', 'IL', 'IR')}
+    ParamGroup(list(params.values()), keys = [1, 3, 4, 1, 3, 4], getter = get_currents)
+    return params
+
+def scan(tmp_path, meas_params):
+    X = Param('X', setter = lambda val: None)
+    return meas_scan([(X, np.arange(3.))], meas_params = meas_params,
+                     const_wait_time = 0, wait_before = 0, wait_after = 0, wait_scan_line = 0,
+                     wait_btw_measurements = 0, measdatapath = str(tmp_path), script_path = __file__)
+
+@pytest.mark.parametrize('labels, channels', [
+    (['Itg'], [1]),
+    (['I1', 'Itg'], [1]),
+    (['IL', 'I1', 'IR'], [3, 1, 4]),
+])
+def test_measured_members_only(tmp_path, labels, channels):
+    queries = []
+    params = make_params(queries)
+    result = scan(tmp_path, [params[label] for label in labels])
+    assert queries == [channels] * 3
+    ds = xr.open_dataset(result['filename'], group = 'main_data')
+    for label in labels:
+        assert params[label].pv == params[label].group.key(params[label])
+        np.testing.assert_array_equal(ds[label].values, params[label].pv)
+    ds.close()
+
+def test_member_getter_and_group_without_keys():
+    queries = []
+    params = make_params(queries)
+    params['IR'].meas()
+    assert queries == [[4]] and params['IR'].pv == 4.
+    X, Y = Param('X'), Param('Y')
+    group = ParamGroup([X, Y], getter = lambda: (1., 2.))
+    Y.meas()
+    assert (X.pv, Y.pv) == (1., 2.)
+    with pytest.raises(ValueError):
+        ParamGroup([Param('Z')], getter = lambda keys: keys, keys = [1, 2])
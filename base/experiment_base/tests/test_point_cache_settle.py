@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:38:28 2026
+
+@author: zerui
+
+A point_cached getter polled by ReadbackSettle during meas_scan.
+"""
+
+import warnings
+import numpy as np
+import xarray as xr
+from zq_experiment_base import Param, meas_scan
+from zq_readback import point_cached
+from zq_settle import ReadbackSettle
+
+
+class LaggingSource(object):
+    """Reads the setpoint only from the third query after a set."""
+    def __init__(self):
+        self.value = 0.
+        self.target = 0.
+        self.reads = 0
+
+    def set_voltage(self, val):
+        self.target = val
+        self.reads = 0
+
+    def get_voltage(self):
+        self.reads += 1
+        if self.reads >= 3:
+            self.value = self.target
+        return self.value
+
+@point_cached
+def voltage_getter(source):
+    return source.get_voltage()
+
+def test_readback_settle_with_cached_getter(tmp_path):
+    source = LaggingSource()
+    V = Param('V', setter = source.set_voltage, getter = lambda: voltage_getter(source),
+              settle = ReadbackSettle(tol = 1e-9, timeout = 0.5, poll = 0.001))
+    V_meas = Param('V_meas', getter = lambda: voltage_getter(source))
+    with warnings.catch_warnings():
+        warnings.simplefilter('error') # a settle timeout warns
+        result = meas_scan([(V, np.arange(1., 5.))], meas_params = [V_meas],
+                           const_wait_time = 0, wait_before = 0, wait_after = 0, wait_scan_line = 0,
+                           wait_btw_measurements = 0, measdatapath = str(tmp_path), script_path = __file__)
+    ds = xr.open_dataset(result['filename'], group = 'main_data')
+    np.testing.assert_array_equal(ds['V_meas'].values, np.arange(1., 5.))
+    ds.close()
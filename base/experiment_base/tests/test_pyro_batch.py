@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:42:24 2026
+
+@author: zerui
+
+pyro_batch against a local daemon.
+"""
+
+import threading
+import pytest
+import Pyro4
+import pyro_batch
+from pyro_batch import Batch
+
+
+@Pyro4.expose
+class Spectrometer(object):
+    """Registered as a class, like wsSrv in WinSpec.py."""
+    def __init__(self):
+        self._exposure_time = 1.
+
+    @property
+    def exposure_time(self):
+        return self._exposure_time
+
+    @exposure_time.setter
+    def exposure_time(self, val):
+        self._exposure_time = float(val)
+
+    def get_spectrum(self):
+        return [self._exposure_time] * 3
+
+
+@pytest.fixture
+def daemon():
+    daemon = Pyro4.Daemon(host = 'localhost')
+    pyro_batch.register_batch_executor(daemon)
+    thread = threading.Thread(target = daemon.requestLoop, daemon = True)
+    thread.start()
+    yield daemon
+    daemon.shutdown()
+    thread.join(timeout = 5)
+
+
+@pytest.mark.parametrize('mode', ['single', 'session', 'percall'])
+def test_registered_class(daemon, mode):
+    cls = Pyro4.behavior(instance_mode = mode)(type('Spectrometer_' + mode, (Spectrometer,), {}))
+    uri = daemon.register(cls, objectId = 'WinSpec_' + mode)
+    with Pyro4.Proxy(uri) as ws:
+        b = Batch(ws)
+        b.get('exposure_time').set('exposure_time', 0.01).get('exposure_time').call('get_spectrum')
+        before, _, after, spectrum = b.execute()
+        again, = Batch(ws).get('exposure_time').execute()
+    # one instance per batch, a new one per batch for 'percall'
+    assert before == 1. and after == 0.01 and spectrum == [0.01] * 3
+    assert again == (1. if mode == 'percall' else 0.01)
+
+def test_registered_instance_and_errors(daemon):
+    instance = Spectrometer()
+    uri = daemon.register(instance, objectId = 'instance')
+    with Pyro4.Proxy(uri) as ws:
+        assert Batch(ws, delay = 0.001).set('exposure_time', 2).call('get_spectrum').execute() == [None, [2.] * 3]
+        with pytest.raises(AttributeError) as error:
+            Batch(ws).get('exposure_time').get('_exposure_time').set('exposure_time', 3).execute()
+    assert error.value.batch_step == 1
+    assert instance.exposure_time == 2.
+
+def test_in_process():
+    spectrometer = Spectrometer()
+    assert Batch(spectrometer).set('exposure_time', 5).get('exposure_time').execute() == [None, 5.]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:45:48 2026
+
+@author: zerui
+
+Round trips of pyro_numpy.encode / decode.
+"""
+
+import numpy as np
+import pytest
+import pyro_numpy
+from pyro_numpy import encode, decode, RAW, LZ4, SHUFFLE_LZ4
+
+
+def codecs(message):
+    header = pyro_numpy._HEADER.unpack_from(message)
+    return [pyro_numpy._ARRAY.unpack_from(message, pyro_numpy._HEADER.size + i * pyro_numpy._ARRAY.size)[0]
+            for i in range(header[3])]
+
+@pytest.mark.parametrize('array, compress, codec', [
+    (np.arange(10000, dtype = np.uint16), False, RAW),
+    (np.arange(10000, dtype = np.uint16), True, SHUFFLE_LZ4),
+    (np.zeros(10000, dtype = np.int8), True, LZ4),
+])
+def test_round_trip_read_only(array, compress, codec):
+    message = encode({'a': array, 'b': [array]}, compress = compress)
+    assert codecs(message) == [codec]
+    result = decode(bytearray(message))
+    np.testing.assert_array_equal(result['a'], array)
+    assert result['b'][0] is result['a']
+    assert not result['a'].flags.writeable
+    with pytest.raises(ValueError):
+        result['a'] -= 1
+    assert result['a'].copy().flags.writeable
+
+def test_small_and_object_arrays_are_pickled():
+    small = np.arange(6.).reshape(2, 3)[:, ::2]
+    obj = [small, np.array(['a', None], dtype = object), np.zeros((0, 4)), small]
+    message = encode(obj)
+    assert codecs(message) == []
+    result = decode(message)
+    np.testing.assert_array_equal(result[0], small)
+    assert list(result[1]) == ['a', None]
+    assert result[2].shape == (0, 4)
+    assert result[3] is result[0]
+    assert not any(array.flags.writeable for array in result)
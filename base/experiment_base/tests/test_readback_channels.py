@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:56:27 2026
+
+@author: zerui
+
+Setpoints of params that share an instrument channel.
+"""
+
+import numpy as np
+import xarray as xr
+from zq_experiment_base import Param, meas_scan
+
+
+class SMUs(object):
+    def __init__(self):
+        self.voltage = {1: 0., 3: 0.}
+        self.gets = 0
+
+    def set_voltage(self, smu, val):
+        self.voltage[smu] = val
+
+    def get_voltage(self, smu):
+        self.gets += 1
+        return self.voltage[smu]
+
+def params(hp):
+    V3 = Param('V3', setter = lambda val: hp.set_voltage(3, val), getter = lambda: hp.get_voltage(3),
+               readback = 10, channel = 'SMU3')
+    VL = Param('VL', setter = lambda val: hp.set_voltage(3, val), getter = lambda: hp.get_voltage(3),
+               readback = 10, channel = 'SMU3')
+    def v_13_setter(val):
+        hp.set_voltage(1, val)
+        hp.set_voltage(3, val)
+    V13 = Param('V13', setter = v_13_setter, channel = ('SMU1', 'SMU3'))
+    return V3, VL, V13
+
+def test_set_drops_setpoints_of_channel():
+    hp = SMUs()
+    V3, VL, V13 = params(hp)
+    VL.setter(1.)
+    VL.meas()
+    assert VL.pv == 1. and hp.gets == 0
+    V3.setter(2.)
+    VL.meas()
+    assert VL.pv == 2. and hp.gets == 1
+    VL.meas()
+    assert hp.gets == 1
+    V13.setter(3.)
+    VL.meas()
+    V3.meas()
+    assert VL.pv == V3.pv == 3. and hp.gets == 3
+
+def test_scan_of_shared_channel(tmp_path):
+    hp = SMUs()
+    V3, VL, V13 = params(hp)
+    VL.setter(0.)
+    values = np.arange(5.)
+    result = meas_scan([(V13, values)], meas_params = [VL],
+                       const_wait_time = 0, wait_before = 0, wait_after = 0, wait_scan_line = 0,
+                       wait_btw_measurements = 0, measdatapath = str(tmp_path), script_path = __file__)
+    with xr.open_dataset(result['filename'], group = 'main_data') as ds:
+        np.testing.assert_array_equal(ds['VL'].values, values)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:39:29 2026
+
+@author: zerui
+
+Run numbers and the run lock of zq_utility.
+"""
+
+import os, datetime, threading
+import pytest
+import zq_utility
+from zq_utility import allocate_run, RunLock, RUN_COUNTER, RUN_LOCK, RUN_LOCK_OWNER
+
+
+@pytest.fixture
+def today_dir(tmp_path):
+    today_dir = tmp_path / datetime.datetime.now().strftime("%Y-%m-%d")
+    today_dir.mkdir()
+    return today_dir
+
+@pytest.mark.parametrize('counter', [None, 'garbage'])
+@pytest.mark.parametrize('suffix', [None, 'bar'])
+def test_number_of_any_suffix_is_taken(tmp_path, today_dir, counter, suffix):
+    (today_dir / 'Run_005_foo').mkdir()
+    if counter is not None:
+        (today_dir / RUN_COUNTER).write_text(counter)
+    n, datadir = allocate_run(str(tmp_path), suffix)
+    assert n == 6 and os.path.basename(datadir) == ('Run_006' if suffix is None else 'Run_006_bar')
+    assert allocate_run(str(tmp_path))[0] == 7
+
+def test_counter_is_trusted(tmp_path, today_dir, monkeypatch):
+    (today_dir / 'Run_005').mkdir() # made without the counter
+    (today_dir / RUN_COUNTER).write_text('4')
+    def listdir(path):
+        raise AssertionError("the day directory is listed")
+    monkeypatch.setattr(zq_utility, 'run_numbers', listdir)
+    n, datadir = allocate_run(str(tmp_path))
+    assert n == 6 and os.path.basename(datadir) == 'Run_006'
+    assert (today_dir / RUN_COUNTER).read_text().strip() == '6'
+
+def test_concurrent(tmp_path):
+    numbers = []
+    def work():
+        numbers.extend(allocate_run(str(tmp_path), 'x')[0] for _ in range(20))
+    threads = [threading.Thread(target = work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(numbers) == list(range(1, 81))
+
+def hold_lock(today_dir, token):
+    lock = today_dir / RUN_LOCK
+    lock.mkdir()
+    (lock / RUN_LOCK_OWNER).write_text(token)
+    return lock
+
+def test_old_mtime_is_not_stale(today_dir):
+    # e.g. the clock of the share is behind
+    lock = hold_lock(today_dir, 'other')
+    os.utime(lock, (0, 0))
+    with pytest.raises(TimeoutError):
+        with RunLock(str(today_dir), timeout = 0.2):
+            pass
+    assert (lock / RUN_LOCK_OWNER).read_text() == 'other'
+
+def test_stale_lock_is_broken(today_dir, monkeypatch):
+    monkeypatch.setattr(zq_utility, 'RUN_LOCK_STALE', 0.2)
+    hold_lock(today_dir, 'crashed')
+    with RunLock(str(today_dir), timeout = 5) as run_lock:
+        assert (today_dir / RUN_LOCK / RUN_LOCK_OWNER).read_text() == run_lock.token
+    assert os.listdir(str(today_dir)) == []
+
+def test_release_keeps_lock_of_other_holder(today_dir):
+    run_lock = RunLock(str(today_dir))
+    with run_lock:
+        # broken as stale and taken by another process meanwhile
+        (today_dir / RUN_LOCK / RUN_LOCK_OWNER).write_text('other')
+    assert (today_dir / RUN_LOCK / RUN_LOCK_OWNER).read_text() == 'other'
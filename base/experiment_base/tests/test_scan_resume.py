@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:39:18 2026
+
+@author: zerui
+
+Resuming a meas_scan that was interrupted in its first line.
+"""
+
+import os, glob
+import numpy as np
+import pytest
+import xarray as xr
+from zq_experiment_base import Param, meas_scan
+
+
+class Interrupt(Exception):
+    pass
+
+def scan(path, fail_at = None, resume = None):
+    calls = []
+    def setter(val):
+        if fail_at is not None and len(calls) == fail_at:
+            raise Interrupt
+        calls.append(val)
+    X = Param('X', setter = setter)
+    Y = Param('Y', setter = lambda val: None)
+    Z = Param('Z', getter = lambda: X.pv + 10 * Y.pv)
+    return meas_scan([(Y, np.arange(3.)), (X, np.arange(4.))], meas_params = [Z],
+                     const_wait_time = 0, wait_before = 0, wait_after = 0, wait_scan_line = 0,
+                     wait_btw_measurements = 0, measdatapath = str(path), script_path = __file__,
+                     resume = resume)
+
+@pytest.mark.parametrize('fail_at', [0, 2])
+def test_resume_in_first_line(tmp_path, fail_at):
+    # fail_at 0: before the file is created, 2: within line 0
+    with pytest.raises(Interrupt):
+        scan(tmp_path, fail_at = fail_at)
+    filedir, = glob.glob(os.path.join(str(tmp_path), '*', '*'))
+    result = scan(tmp_path, resume = filedir)
+    ds = xr.open_dataset(result['filename'], group = 'main_data')
+    np.testing.assert_array_equal(ds['Z'].values, np.arange(4.)[None, :] + 10 * np.arange(3.)[:, None])
+    ds.close()
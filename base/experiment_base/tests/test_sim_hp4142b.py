@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:00:54 2026
+
+@author: zerui
+
+The HP4142B driver on the simulated resource of sim_instruments.
+"""
+
+import pytest
+from sim_instruments import sim_hp4142b
+
+
+@pytest.fixture
+def hp():
+    return sim_hp4142b(latency = 0, integration_time = 0, noise = 0)
+
+
+def test_set_get_voltage(hp):
+    hp.SMU3.set_voltage_safe_step(10)
+    hp.SMU3.set_voltage(0.5)
+    assert hp.SMU3.get_voltage() == pytest.approx(0.5, abs = 1e-3)
+    assert hp.SMU3.get_current() == pytest.approx(0.5e-9, rel = 1e-3)
+
+
+def test_get_currents_one_spot_measurement(hp):
+    for channel, voltage in [(1, 0.1), (3, 0.5), (4, -0.3)]:
+        smu = getattr(hp, 'SMU{}'.format(channel))
+        smu.set_voltage_safe_step(10)
+        smu.set_voltage(voltage)
+    resource = hp._inst
+    resource.n_transactions = 0
+    currents = hp.get_currents([1, 3, 4])
+    assert currents == pytest.approx([0.1e-9, 0.5e-9, -0.3e-9], rel = 1e-3)
+    # MM, XE and one read
+    assert resource.n_transactions == 3
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 07:55:39 2026
+
+@author: zerui
+
+Adaptive sampling of 1D and 2D sweeps.
+
+Instead of a uniform grid, adaptive_scan starts with a coarse grid and
+refines where loss_param changes fastest until the point budget is used:
+
+    adaptive_scan([(Vtg, (-5, 5)), (VL, (-3, 3))], [Itg, IL], loss_param = Itg,
+                  n_points = 800, loss = 'gradient', measdatapath = ...)
+
+The points are irregular, they are stored along a 'point' dimension with
+the sweep params as variables of that dimension. regrid() interpolates a
+stored scan onto a regular grid for plotting.
+
+Losses (1D): 'gradient' (length of the curve segment), 'curvature' (area
+of the triangles with the neighbouring points) or 'uniform'.
+Losses (2D): 'gradient' (value range over the cell corners), 'curvature'
+(deviation of the corners from a plane) or 'uniform'.
+A callable loss(x, y) for 1D or loss(corners, values) for 2D is also
+accepted, coordinates and values are scaled to [0, 1].
+"""
+
+import os
+import json
+import time
+import shutil
+import numpy as np
+import xarray as xr
+from tqdm import tqdm
+from zq_utility import generate_filedir
+from zq_storage import get_backend, line_chunksizes, value_dtype, _param_attrs
+from zq_experiment_base import make_default_params, set_constants, make_measname
+from zq_settle import settle_params
+
+
+def _loss_gradient_1d(x, y):
+    return np.hypot(x[2] - x[1], y[2] - y[1])
+
+def _loss_curvature_1d(x, y):
+    # x, y hold the interval (points 1 and 2) and its neighbours (0 and 3)
+    # that are nan at the edges
+    areas = []
+    for i in (0, 1):
+        p = np.array([[x[i], y[i]], [x[i+1], y[i+1]], [x[i+2], y[i+2]]])
+        if not np.any(np.isnan(p)):
+            areas.append(0.5 * abs(np.cross(p[1] - p[0], p[2] - p[0])))
+    area = np.mean(areas) if areas else 0.
+    # the length term keeps refining straight segments once curved ones are done
+    return np.sqrt(area) + 0.02 * (x[2] - x[1])
+
+def _loss_uniform_1d(x, y):
+    return x[2] - x[1]
+
+LOSSES_1D = {'gradient': _loss_gradient_1d, 'curvature': _loss_curvature_1d, 'uniform': _loss_uniform_1d}
+
+
+def _loss_gradient_2d(corners, values):
+    size = np.hypot(*(corners[3] - corners[0]))
+    return size * (np.ptp(values) + 0.05)
+
+def _loss_curvature_2d(corners, values):
+    size = np.hypot(*(corners[3] - corners[0]))
+    # corners are ordered (x0, y0), (x1, y0), (x0, y1), (x1, y1), the twist
+    # is zero for values that are linear in x and y
+    twist = abs(values[0] - values[1] - values[2] + values[3])
+    return size * (twist + 0.05)
+
+def _loss_uniform_2d(corners, values):
+    size = corners[3] - corners[0]
+    return size[0] * size[1]
+
+LOSSES_2D = {'gradient': _loss_gradient_2d, 'curvature': _loss_curvature_2d, 'uniform': _loss_uniform_2d}
+
+
+def _get_loss(loss, losses):
+    if callable(loss):
+        return loss
+    try:
+        return losses[loss]
+    except KeyError:
+        raise ValueError(f"Unknown loss {loss}, choose from {list(losses)} or pass a function")
+
+
+class Learner1D(object):
+    """
+    Picks the points of a 1D sweep. ask() returns the next points to
+    measure, tell() takes the measured values. The interval with the
+    largest loss is halved, intervals shorter than 2 * min_spacing are not
+    split any more.
+    """
+    def __init__(self, bounds, loss = 'gradient', n_initial = 10, min_spacing = 0.):
+        self.bounds = (min(bounds), max(bounds))
+        self.loss = _get_loss(loss, LOSSES_1D)
+        self.min_spacing = min_spacing
+        self.data = {}
+        self._pending = list(np.linspace(self.bounds[0], self.bounds[1], n_initial))
+
+    def ask(self):
+        """Next points to measure, [] when nothing is left to refine."""
+        if self._pending:
+            points, self._pending = self._pending, []
+            return points
+        xs = np.array(sorted(self.data))
+        ys = np.array([self.data[x] for x in xs])
+        # losses work on coordinates scaled to [0, 1]
+        x_scale = self.bounds[1] - self.bounds[0]
+        y_scale = np.ptp(ys) if np.ptp(ys) > 0 else 1.
+        xn = np.concatenate([[np.nan], (xs - self.bounds[0]) / x_scale, [np.nan]])
+        yn = np.concatenate([[np.nan], (ys - ys.min()) / y_scale, [np.nan]])
+        best, best_loss = None, 0.
+        for i in range(len(xs) - 1):
+            if xs[i+1] - xs[i] < 2 * self.min_spacing:
+                continue
+            loss = self.loss(xn[i:i+4], yn[i:i+4])
+            if loss > best_loss:
+                best, best_loss = i, loss
+        if best is None:
+            return []
+        return [(xs[best] + xs[best+1]) / 2]
+
+    def tell(self, point, value):
+        self.data[point] = float(value)
+
+
+class Learner2D(object):
+    """
+    Picks the points of a 2D sweep on a quadtree. The sweep starts with a
+    n_initial x n_initial grid of cells, the cell with the largest loss is
+    split into four. Cells smaller than 2 * min_spacing (per axis) are not
+    split any more.
+    """
+    def __init__(self, bounds, loss = 'gradient', n_initial = 5, min_spacing = (0., 0.)):
+        self.bounds = [(min(b), max(b)) for b in bounds]
+        self.loss = _get_loss(loss, LOSSES_2D)
+        self.min_spacing = np.broadcast_to(min_spacing, (2,))
+        self.data = {}
+        x = np.linspace(*self.bounds[0], n_initial + 1)
+        y = np.linspace(*self.bounds[1], n_initial + 1)
+        self.cells = [(x[i], x[i+1], y[j], y[j+1]) for i in range(n_initial) for j in range(n_initial)]
+        self._pending = [(xi, yi) for xi in x for yi in y]
+
+    @staticmethod
+    def _corners(cell):
+        x0, x1, y0, y1 = cell
+        return [(x0, y0), (x1, y0), (x0, y1), (x1, y1)]
+
+    def ask(self):
+        """Next points to measure, [] when nothing is left to refine."""
+        if self._pending:
+            points, self._pending = self._pending, []
+            return points
+        values = np.array(list(self.data.values()))
+        v_min = values.min()
+        v_scale = np.ptp(values) if np.ptp(values) > 0 else 1.
+        offset = np.array([self.bounds[0][0], self.bounds[1][0]])
+        scale = np.array([b[1] - b[0] for b in self.bounds])
+        best, best_loss = None, 0.
+        for i, cell in enumerate(self.cells):
+            if (cell[1] - cell[0] < 2 * self.min_spacing[0]
+                    or cell[3] - cell[2] < 2 * self.min_spacing[1]):
+                continue
+            corners = self._corners(cell)
+            loss = self.loss((np.array(corners) - offset) / scale,
+                             (np.array([self.data[c] for c in corners]) - v_min) / v_scale)
+            if loss > best_loss:
+                best, best_loss = i, loss
+        if best is None:
+            return []
+        x0, x1, y0, y1 = self.cells.pop(best)
+        xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+        self.cells += [(x0, xm, y0, ym), (xm, x1, y0, ym), (x0, xm, ym, y1), (xm, x1, ym, y1)]
+        # midpoints of edges can be shared with a neighbouring cell
+        new = [(xm, ym), (xm, y0), (xm, y1), (x0, ym), (x1, ym)]
+        return [p for p in new if p not in self.data]
+
+    def tell(self, point, value):
+        self.data[tuple(point)] = float(value)
+
+
+def create_point_variables(backend, sweep_params, meas_params, n_points, chunk_points,
+                           group = 'main_data'):
+    """
+    Variables of an adaptive scan: the sweep params and the measured
+    params along the 'point' dimension (n_points long), plus 'refinement',
+    the refinement step in which a point was measured.
+    """
+    backend.create_dimension(group, 'point', n_points)
+    for param in sweep_params:
+        backend.create_variable(group, param.label, np.float64, ('point',),
+                                chunksizes = (chunk_points,), attrs = _param_attrs(param))
+    backend.create_variable(group, 'refinement', np.int32, ('point',), chunksizes = (chunk_points,),
+                            attrs = dict(long_name = 'Refinement step of the point'))
+    for param in meas_params:
+        dtype = value_dtype(param.pv, param.dtype)
+        dims = ['point']
+        if isinstance(param.pv, xr.DataArray):
+            for dim in param.pv.dims:
+                if dim not in backend.dimensions(group):
+                    coord = param.pv[dim]
+                    backend.create_dimension(group, dim, len(coord))
+                    backend.create_variable(group, dim, np.array(coord).dtype, (dim,),
+                                            attrs = dict(coord.attrs))
+                    backend.write(group, dim, slice(None), np.array(coord))
+            dims += list(param.pv.dims)
+        shape = np.array(param.pv).shape
+        backend.create_variable(group, param.label, dtype, dims,
+                                chunksizes = line_chunksizes([chunk_points], shape, dtype.itemsize),
+                                attrs = _param_attrs(param))
+
+
+def adaptive_scan(sweep_params, meas_params, loss_param, n_points,
+                  constant_params = None, loss = 'gradient', n_initial = None,
+                  min_spacing = 0., file_comment = '', measdatapath = '',
+                  const_wait_time = 1, wait_before = 0.05, wait_after = 0.05,
+                  wait_btw_measurements = 0.01, script_path = __file__,
+                  storage_backend = 'netcdf4', compression = None, write_every = 20):
+    """
+    Adaptive 1D or 2D sweep that refines where loss_param changes fastest.
+
+    Parameters
+    ----------
+    sweep_params : [(Param, (start, stop))]
+        One or two sweep parameters with their range.
+    meas_params : [Param]
+        The measured parameters.
+    loss_param : Param
+        Scalar parameter of meas_params that drives the refinement.
+    n_points : int
+        Point budget of the scan.
+    loss : string or function, optional
+        'gradient', 'curvature', 'uniform' or a function, see the module
+        docstring. The default is 'gradient'.
+    n_initial : int, optional
+        Points of the initial grid per axis. The default is 10 for 1D and
+        6 (5 x 5 cells) for 2D.
+    min_spacing : float or (float, float), optional
+        Smallest point distance per axis. The default is 0.
+    write_every : int, optional
+        Measured points are written to disk in blocks of write_every
+        points. The default is 20.
+
+    The other parameters are the same as for meas_scan.
+
+    Returns
+    -------
+    filename : string
+        The data file, see regrid() for a gridded view.
+
+    """
+    if len(sweep_params) not in (1, 2):
+        raise ValueError('adaptive_scan supports 1 or 2 sweep parameters')
+    if loss_param not in meas_params:
+        raise ValueError('loss_param has to be one of meas_params')
+    bounds = [(np.min(scan_range), np.max(scan_range)) for _, scan_range in sweep_params]
+    if len(sweep_params) == 1:
+        learner = Learner1D(bounds[0], loss, n_initial or 10, min_spacing)
+    else:
+        learner = Learner2D(bounds, loss, (n_initial or 6) - 1, min_spacing)
+
+    set_constants(constant_params, const_wait_time)
+    meas_params = list(meas_params) + make_default_params()
+
+    measname = make_measname([(p, b) for (p, _), b in zip(sweep_params, bounds)], constant_params,
+                             'adaptive_' + file_comment)
+    filedir = generate_filedir(suffix = measname, base_dir = measdatapath)
+    filename = os.path.join(filedir, "Measdata" + get_backend(storage_backend).extension)
+    shutil.copyfile(script_path, os.path.join(filedir, "Experiment.py"))
+
+    sweep = [param for param, _ in sweep_params]
+    block = {param.label: [] for param in sweep + meas_params}
+    block['refinement'] = []
+    n_written = 0
+    refinement = 0
+    with get_backend(storage_backend)(filename, 'w', compression) as backend, \
+         tqdm(total = n_points) as progress:
+        backend.set_attr('sweep_order', 'adaptive')
+        backend.set_attr('loss', loss if isinstance(loss, str) else getattr(loss, '__name__', 'custom'))
+        backend.set_attr('loss_param', loss_param.label)
+        backend.set_attr('sweep_params', json.dumps([param.label for param in sweep]))
+
+        def flush():
+            nonlocal n_written
+            n = len(block['refinement'])
+            if n == 0:
+                return
+            for name, values in block.items():
+                backend.write('main_data', name, slice(n_written, n_written + n), np.array(values))
+                values.clear()
+            n_written += n
+            # readable up to here if the scan is interrupted (load_points)
+            backend.set_attr('n_points', n_written)
+            backend.sync()
+
+        n_measured = 0
+        try:
+            while n_measured < n_points:
+                points = learner.ask()
+                if not points:
+                    break
+                for point in points[:n_points - n_measured]:
+                    changed = []
+                    for param, value in zip(sweep, np.atleast_1d(point)):
+                        changed.append((param, param.pv, value))
+                        param.setter(value)
+                    settle_params(changed)
+                    time.sleep(wait_before)
+                    for param in meas_params:
+                        param.meas()
+                        time.sleep(wait_btw_measurements)
+                    time.sleep(wait_after)
+                    learner.tell(point, loss_param.pv)
+
+                    if n_measured == 0:
+                        create_point_variables(backend, sweep, meas_params, n_points, write_every)
+                    for param, value in zip(sweep, np.atleast_1d(point)):
+                        block[param.label].append(value)
+                    for param in meas_params:
+                        value = param.pv
+                        block[param.label].append(value.data if isinstance(value, xr.DataArray) else value)
+                    block['refinement'].append(refinement)
+                    n_measured += 1
+                    progress.update(1)
+                    if len(block['refinement']) == write_every:
+                        flush()
+                refinement += 1
+        finally:
+            # also the points of the last block if the scan fails
+            flush()
+    print(f"Adaptive scan: {n_measured} points in {refinement} refinement steps")
+    return filename
+
+
+def load_points(filename, group = 'main_data'):
+    """Dataset of an adaptive scan without the unused part of the budget."""
+    engine = {'.h5': 'h5netcdf', '.zarr': 'zarr'}.get(os.path.splitext(filename)[1])
+    if engine == 'zarr':
+        root_attrs = dict(xr.open_zarr(filename).attrs)
+        ds = xr.open_zarr(filename, group = group)
+    else:
+        with xr.open_dataset(filename, engine = engine) as root:
+            root_attrs = dict(root.attrs)
+        ds = xr.open_dataset(filename, group = group, engine = engine)
+    ds.attrs.update(root_attrs)
+    n_points = root_attrs.get('n_points')
+    if n_points is None:
+        # interrupted before n_points was written (older versions wrote it
+        # at the end), the unmeasured points have no sweep value
+        first = json.loads(root_attrs['sweep_params'])[0]
+        n_points = np.count_nonzero(np.isfinite(ds[first].values))
+    return ds.isel(point = slice(0, int(n_points)))
+
+
+# Distances of this many (grid point, point) pairs at once in nearest_points
+# without scipy (the 2D differences take 16 bytes per pair, 64 MB)
+NEAREST_CHUNK = 1 << 22
+
+def nearest_points(grid, points):
+    """Index of the nearest of points for every grid point (cKDTree if scipy is there)."""
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        pass
+    else:
+        return cKDTree(points).query(grid)[1]
+    nearest = np.empty(len(grid), dtype = int)
+    step = max(1, NEAREST_CHUNK // len(points))
+    for start in range(0, len(grid), step):
+        d = ((grid[start:start+step, None, :] - points[None, :, :])**2).sum(-1)
+        nearest[start:start+step] = d.argmin(axis = 1)
+    return nearest
+
+
+def regrid(ds, shape = 101, method = 'nearest'):
+    """
+    Regular grid view of an adaptive scan.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset or string
+        Dataset (e.g. of load_points) or the data file of the scan.
+    shape : int or (int, int)
+        Number of grid points per sweep axis.
+    method : 'nearest' or 'linear'
+        Interpolation in 2D, 'linear' needs scipy. 1D is always linear.
+
+    Returns
+    -------
+    xarray.Dataset with one dimension per sweep parameter.
+    """
+    if isinstance(ds, str):
+        ds = load_points(ds)
+    sweep_labels = json.loads(ds.attrs['sweep_params'])
+    shape = tuple(np.broadcast_to(shape, (len(sweep_labels),)))
+    axes = [np.linspace(float(ds[label].min()), float(ds[label].max()), n)
+            for label, n in zip(sweep_labels, shape)]
+    # coordinates scaled to [0, 1] so that both axes count the same
+    lo = np.array([axis[0] for axis in axes])
+    span = np.array([axis[-1] - axis[0] if axis[-1] > axis[0] else 1. for axis in axes])
+    points = (np.stack([ds[label].values for label in sweep_labels], axis = -1) - lo) / span
+    grid = (np.stack(np.meshgrid(*axes, indexing = 'ij'), axis = -1).reshape(-1, len(axes)) - lo) / span
+
+    if len(axes) == 2 and method == 'nearest':
+        nearest = nearest_points(grid, points)
+    elif len(axes) == 2 and method == 'linear':
+        try:
+            from scipy.interpolate import griddata
+        except ImportError as e:
+            raise ImportError("regrid(method = 'linear') needs scipy, use method = 'nearest'") from e
+    elif len(axes) == 2:
+        raise ValueError(f"method must be 'nearest' or 'linear', got {method}")
+    order = np.argsort(points[:, 0])
+
+    data_vars = {}
+    for name, var in ds.data_vars.items():
+        if name in sweep_labels or var.dims[:1] != ('point',):
+            continue
+        values = var.values.reshape(len(points), -1)
+        if len(axes) == 1:
+            gridded = np.stack([np.interp(grid[:, 0], points[order, 0], column[order])
+                                for column in values.T], axis = -1)
+        elif method == 'nearest':
+            gridded = values[nearest]
+        else:
+            gridded = np.stack([griddata(points, column, grid, method = 'linear')
+                                for column in values.T], axis = -1)
+        data_vars[name] = (sweep_labels + list(var.dims[1:]),
+                           gridded.reshape(shape + var.shape[1:]), var.attrs)
+    coords = {label: axis for label, axis in zip(sweep_labels, axes)}
+    coords.update({name: coord for name, coord in ds.coords.items() if 'point' not in coord.dims})
+    return xr.Dataset(data_vars, coords = coords, attrs = ds.attrs)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:11:18 2026
+
+@author: zerui
+
+Phase timing of meas_scan (meas_scan(..., diagnostics = True)).
+
+Every point of the scan records, on the monotonic clock,
+    set_<label>   time in the setter of every sweep param that was set
+    settle        settle policies (zq_settle)
+    sleep         wait_before, wait_after and wait_btw_measurements
+    get_<label>   time in the getter of every meas param
+    plot          live plot update
+    point         the whole point
+and every line
+    line_acquire  hardware timed acquisition (zq_line_compiler)
+    line_sleep    wait_scan_line
+    line_save     handing the line to the writer (incl. blocking on a full queue)
+    line_write    writing the line to the file (writer thread)
+The point times are stored like the measured data, in the diagnostics
+group of the data file over the sweep dims, the line times over the line
+dim:
+    xr.open_dataset(filename, group = 'diagnostics')
+Phases that did not happen at a point (e.g. a setter of a slow param)
+are NaN.
+"""
+
+import time
+import numpy as np
+from zq_storage import LineBuffers
+
+LINE_PHASES = ('line_acquire', 'line_sleep', 'line_save', 'line_write')
+
+
+class ScanTimer(object):
+    """
+    Collects the phase times of the current point in a row and stores the
+    rows of a line in line buffers that are handed to the writer with the
+    measured data. With enabled = False nothing is recorded, only sleep()
+    sleeps.
+    """
+    def __init__(self, sweep_params, meas_params, line_len, n_lines, n_buffers = 1, enabled = True):
+        self.enabled = enabled
+        self.point_names = ([f'set_{param.label}' for param, _ in sweep_params] + ['settle', 'sleep'] +
+                            [f'get_{param.label}' for param in meas_params] + ['plot', 'point'])
+        self.line_names = list(LINE_PHASES)
+        self._columns = {name: i for i, name in enumerate(self.point_names)}
+        self._row = np.full(len(self.point_names), np.nan, dtype = np.float32)
+        self._buffers = LineBuffers(1, line_len, n_buffers)
+        self.lines = {name: np.full(n_lines, np.nan, dtype = np.float32) for name in self.line_names}
+        self._t_point = 0.
+
+    @property
+    def names(self):
+        """point_names and line_names, see StorageSession.create."""
+        return self.point_names, self.line_names
+
+    def start_point(self):
+        self._row[:] = np.nan
+        self._row[self._columns['sleep']] = 0.
+        self._t_point = time.perf_counter()
+
+    def set(self, name, t):
+        if self.enabled:
+            self._row[self._columns[name]] = t
+
+    def sleep(self, t):
+        """time.sleep that counts as sleep of the point."""
+        t0 = time.perf_counter()
+        time.sleep(t)
+        self._row[self._columns['sleep']] += time.perf_counter() - t0
+
+    def end_point(self, position):
+        """Store the row at position of the current line."""
+        if self.enabled:
+            self._row[self._columns['point']] = time.perf_counter() - self._t_point
+            self._buffers.store(0, position, self._row)
+
+    def line(self, name, line_index, t):
+        if self.enabled:
+            self.lines[name][line_index] = t
+
+    def swap(self):
+        """
+        The point times of the finished line as {name: line array} and the
+        function that releases them (see LineBuffers.swap), (None, None) if
+        disabled.
+        """
+        if not self.enabled:
+            return None, None
+        (filled,), release = self._buffers.swap()
+        return {name: filled[:, i] for name, i in self._columns.items()}, release
+
+
+def phase_stats(times):
+    """count, mean, 95th percentile, max and total of the recorded (not NaN) times."""
+    times = np.asarray(times, dtype = float).ravel()
+    times = times[np.isfinite(times)]
+    if len(times) == 0:
+        return dict(n = 0, mean = np.nan, p95 = np.nan, max = np.nan, total = 0.)
+    return dict(n = len(times), mean = float(times.mean()), p95 = float(np.percentile(times, 95)),
+                max = float(times.max()), total = float(times.sum()))
+
+def timing_summary(times):
+    """phase_stats of every phase, times maps phase names to their times."""
+    return {name: phase_stats(t) for name, t in times.items()}
+
+def print_timing_summary(summary, elapsed = None):
+    """Table of the phases, with their share of elapsed (s) if given."""
+    print("{:<24}{:>9}{:>11}{:>11}{:>11}{:>10}{:>8}".format(
+        'phase', 'n', 'mean ms', 'p95 ms', 'max ms', 'total s', '%'))
+    for name, s in summary.items():
+        if s['n'] == 0:
+            continue
+        share = 100 * s['total'] / elapsed if elapsed else np.nan
+        print("{:<24}{:>9d}{:>11.3f}{:>11.3f}{:>11.3f}{:>10.2f}{:>8.1f}".format(
+            name, s['n'], s['mean']*1e3, s['p95']*1e3, s['max']*1e3, s['total'], share))
@@ -6,7 +6,10 @@ Created on Fri Aug 04 11:03:03 2017
 """
 
 from __future__ import division, print_function
-import pyvisa as visa
+try:
+    import pyvisa as visa
+except ImportError:
+    visa = None # only needed to open the GPIB resource, see HP4142B(resource = ...)
 import numpy as np
 import time
 import pandas as pd
@@ -14,9 +17,6 @@ import warnings
 from builtins import input
 import os,sys
 
-sys.path.append(r'C:\Users\QPG\Documents\zerui_g15\C-hBN\base\experiment_base\zq_drivers\pyro_nw')
-import nw_utils as nw_utils
-
 import logging
 logging.basicConfig(
     filename = os.path.splitext(__file__)[0] + '_debug.log',
@@ -88,10 +88,18 @@ def sample_safety_warning(operation):
 
 class HP4142B(object):
     @default_setting
-    def __init__(self, GPIB_resource_name, initialize = True):
+    def __init__(self, GPIB_resource_name, initialize = True, resource = None):
+        # resource: an open VISA like resource (write, query, read_raw) used
+        # instead of GPIB_resource_name, e.g. sim_instruments.SimHP4142BResource
         self._address = GPIB_resource_name
-        self._rm = visa.ResourceManager()
-        self._inst = self._rm.open_resource(self._address,timeout=2000)
+        if resource is None:
+            if visa is None:
+                raise ImportError("HP4142B needs pyvisa to open {}".format(GPIB_resource_name))
+            self._rm = visa.ResourceManager()
+            self._inst = self._rm.open_resource(self._address,timeout=2000)
+        else:
+            self._rm = None
+            self._inst = resource
         self.inst = self._inst
         self.SMU = []
         self.SMU_A = []
@@ -304,6 +312,39 @@ class HP4142B(object):
     def get_SMU_output(self):
         ret_df = self.get_SMU_settings()
         return ret_df.loc['Output Value']
+
+    def get_currents(self, channels):
+        '''
+        Currents (A) of several SMUs in voltage mode in one spot measurement
+        (MM 1 + XE), all channels are read back in one transfer instead of
+        one TI / NUB? / read per channel.
+
+        Parameters
+        ----------
+        channels : list of int
+            SMU channels, e.g. [1, 3, 4]
+
+        Returns
+        -------
+        list of float : Currents in the order of channels
+
+        '''
+        if self.data_format != 'binary':
+            return [getattr(self, 'SMU' + str(channel)).get_current() for channel in channels]
+        self.__rawWrite__('MM 1,' + ','.join(str(channel) for channel in channels))
+        self.__rawWrite__('XE')
+        reading = b''
+        while len(reading) < 4*len(channels):
+            reading += self.__rawRead__()
+        reading = reading.decode('latin-1')
+        currents = []
+        for i, channel in enumerate(channels):
+            smu = getattr(self, 'SMU' + str(channel))
+            conversion = smu._convert_from_binary(reading[4*i:4*i+4])
+            if not conversion[5] == channel:
+                warnings.warn('get_currents: addressed channel %s but got %s instead'%(channel, conversion[5]))
+            currents.append(conversion[4])
+        return currents
     
     # TODO: implement this in same function for VSVM?
     def get_VSVM_settings():
@@ -1321,6 +1362,9 @@ class VS(Channel):
     
     
 if __name__ == '__main__':
+    # the nameserver is located when nw_utils is imported
+    sys.path.append(r'C:\Users\QPG\Documents\zerui_g15\C-hBN\base\experiment_base\zq_drivers\pyro_nw')
+    import nw_utils as nw_utils
     resource_name = 'GPIB0::17::INSTR'
     object_dict = {'HP4142B_r': HP4142B(resource_name)}
     nw_utils.RunServer(object_dict)
\ No newline at end of file
@@ -788,6 +788,138 @@ class NIDAQ(object):
                 
         return data
     
+    def set_ao_measure(self, ao_channel, ao_setpoints, sampling_rate,
+                       samples_per_point=1, settle_samples=0,
+                       ctr_channels=(), ai_channels=(), ao_range=10,
+                       ai_limit=10.0, ai_mode='diff'):
+        """Output ao_setpoints as one buffered waveform and measure on the
+        same sample clock (generalizes set_ao0_measure_ctr1 / _ai0).
+
+        Every setpoint is held for samples_per_point samples of the AO
+        sample clock, counters and analog inputs are clocked from
+        ao/SampleClock. The first settle_samples of every point are
+        discarded.
+        Args:
+            ao_channel (str): e.g. 'ao1'.
+            ao_setpoints (array): voltages, one per point.
+            sampling_rate (float): AO sample clock in Hz.
+            ctr_channels (list of str): e.g. ['ctr1'], edges are counted.
+            ai_channels (list of str): e.g. ['ai0', 'ai1'].
+            ai_limit, ai_mode: see measure_ai.
+        Returns:
+            data (dict): channel name -> array with one value per setpoint,
+                the number of counted edges for counters and the mean
+                voltage for analog inputs.
+            The acquisition time per point is
+            (samples_per_point - settle_samples) / sampling_rate."""
+        ao_setpoints = np.asarray(ao_setpoints, dtype=np.float64)
+        n_points = len(ao_setpoints)
+        samples_per_point = int(samples_per_point)
+        settle_samples = int(settle_samples)
+        assert 0 <= settle_samples < samples_per_point
+        # one extra sample closes the counting window of the last point
+        waveform = np.append(np.repeat(ao_setpoints, samples_per_point),
+                             ao_setpoints[-1])
+        n_total = len(waveform)
+        timeout = n_total / sampling_rate + 2
+        clock_src = '/' + self.device_name + '/ao/SampleClock'
+        read = PyDAQmx.int32()
+        written = PyDAQmx.int32()
+
+        ao_task = PyDAQmx.Task()
+        ctr_tasks = []
+        ai_task = None
+        try:
+            ao_task.CreateAOVoltageChan(self.device_name + '/' + ao_channel, '',
+                                        -ao_range, ao_range,
+                                        PyDAQmx.DAQmx_Val_Volts, None)
+            ao_task.CfgSampClkTiming('', sampling_rate, PyDAQmx.DAQmx_Val_Rising,
+                                     PyDAQmx.DAQmx_Val_FiniteSamps, n_total)
+            ao_task.WriteAnalogF64(n_total, False, 10.0,
+                                   PyDAQmx.DAQmx_Val_GroupByChannel,
+                                   waveform, PyDAQmx.byref(written), None)
+
+            for ctr_channel in ctr_channels:
+                ctr_task = PyDAQmx.Task()
+                ctr_tasks.append((ctr_channel, ctr_task))
+                ctr_task.CreateCICountEdgesChan(self.device_name + '/' + ctr_channel,
+                                                '', PyDAQmx.DAQmx_Val_Rising, 0,
+                                                PyDAQmx.DAQmx_Val_CountUp)
+                ctr_task.CfgSampClkTiming(clock_src, sampling_rate,
+                                          PyDAQmx.DAQmx_Val_Rising,
+                                          PyDAQmx.DAQmx_Val_FiniteSamps, n_total)
+
+            if len(ai_channels) > 0:
+                ai_task = PyDAQmx.Task()
+                ai_task.CreateAIVoltageChan(
+                    ', '.join(self.device_name + '/' + c for c in ai_channels), '',
+                    self._ai_terminal_config(ai_mode), -ai_limit, ai_limit,
+                    PyDAQmx.DAQmx_Val_Volts, None)
+                ai_task.CfgSampClkTiming(clock_src, sampling_rate,
+                                         PyDAQmx.DAQmx_Val_Rising,
+                                         PyDAQmx.DAQmx_Val_FiniteSamps, n_total)
+
+            # inputs wait for the AO sample clock, AO starts last
+            for _, ctr_task in ctr_tasks:
+                ctr_task.StartTask()
+            if ai_task is not None:
+                ai_task.StartTask()
+            ao_task.StartTask()
+
+            raw = {}
+            for ctr_channel, ctr_task in ctr_tasks:
+                counts = np.zeros(n_total, dtype=np.uint32)
+                ctr_task.ReadCounterU32(n_total, timeout, counts, n_total,
+                                        PyDAQmx.byref(read), None)
+                raw[ctr_channel] = counts
+            if ai_task is not None:
+                voltages = np.zeros(n_total * len(ai_channels), dtype=np.float64)
+                ai_task.ReadAnalogF64(n_total, timeout,
+                                      PyDAQmx.DAQmx_Val_GroupByChannel,
+                                      voltages, len(voltages),
+                                      PyDAQmx.byref(read), None)
+                for ai_channel, v in zip(ai_channels,
+                                         voltages.reshape(len(ai_channels), n_total)):
+                    raw[ai_channel] = v
+            ao_task.WaitUntilTaskDone(timeout)
+        finally:
+            for task in [ao_task] + [t for _, t in ctr_tasks] + [ai_task]:
+                if task is not None:
+                    try:
+                        task.StopTask()
+                    finally:
+                        task.ClearTask()
+        if hasattr(self, '_' + ao_channel):
+            setattr(self, '_' + ao_channel, float(ao_setpoints[-1]))
+
+        start = np.arange(n_points) * samples_per_point + settle_samples
+        stop = (np.arange(n_points) + 1) * samples_per_point
+        data = {}
+        for ctr_channel, _ in ctr_tasks:
+            # counters are cumulative, uint32 difference handles a rollover
+            counts = raw[ctr_channel]
+            data[ctr_channel] = (counts[stop] - counts[start]).astype(np.float64)
+        for ai_channel in ai_channels:
+            v = raw[ai_channel]
+            data[ai_channel] = np.array([np.mean(v[a:b]) for a, b in zip(start, stop)])
+        return data
+
+    @staticmethod
+    def _ai_terminal_config(mode):
+        # Input mode, determines the reference for the measured voltage.
+        # See DAQmx documentation for details
+        if mode.lower() == 'diff':
+            return PyDAQmx.DAQmx_Val_Diff
+        elif mode.lower() == 'rse':
+            return PyDAQmx.DAQmx_Val_RSE
+        elif mode.lower() == 'nrse':
+            return PyDAQmx.DAQmx_Val_NRSE
+        elif mode.lower() == 'pseudodiff':
+            return PyDAQmx.DAQmx_Val_PseudoDiff
+        raise ValueError('Unknown input mode "' + mode + '".\n' +
+                         'Choose from "diff" (default), "RSE", "NRSE", ' +
+                         '"pseudodiff".')
+
     def set_ao0_measure_ctr1_ai0(self, n_samples, sampling_rate, ao_setpoints):
         """Collect n_samples while setting ao_setpoints at sampling_rate.
         
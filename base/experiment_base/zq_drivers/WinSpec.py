@@ -41,6 +41,8 @@ Pyro4.config.SERIALIZER = 'pickle'
 sys.path.append(r'C:\Users\QPG\Documents\eyazici_g15\base\experiment_base\fey_drivers\pyro_nw')
 import nw_utils as nw_utils
 import nw_config as config
+import pyro_numpy
+import pyro_batch
 
 
 
@@ -525,15 +527,19 @@ class wsSrv(object):
 
 if __name__ == "__main__":
     IS_EXILE = True    
+    # spectra as raw (LZ4 compressed) buffers for clients that ask for it
+    pyro_numpy.register()
     
     if IS_EXILE: # EXILE winspec 
         # don't register the daemon 
         daemon = Pyro4.Daemon(host = config.CONFIG['PYRO_HOST'], port=config.CONFIG['PYRO_PORT'], nathost='phd-exile-phys.ethz.ch', natport=9090)
         uri = daemon.register(wsSrv, objectId = 'WinSpec')
+        pyro_batch.register_batch_executor(daemon)
         print('WinSpec in exile')
     else: # normal winspec
         daemon = Pyro4.Daemon(host = config.HOSTNAME + '.dhcp.phys.ethz.ch')
         uri = daemon.register(wsSrv, objectId = 'WinSpec')
+        pyro_batch.register_batch_executor(daemon)
         ns = Pyro4.naming.locateNS(host=config.CONFIG['PYRO_HOST'], port=config.CONFIG['PYRO_PORT'])
         ns.register('WinSpec',uri)
     
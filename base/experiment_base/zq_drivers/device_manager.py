@@ -9,6 +9,8 @@ import sys
 import Pyro4
 sys.path.append(r'C:\Users\QPG\Documents\zerui_g15\C-hBN\base\experiment_base\zq_drivers\pyro_nw')
 from nameserver_client import nameserver as ns
+from pyro_numpy import use_numpy_transport
+from pyro_batch import Batch
 from colorama import Fore, Back, Style
 from HP4142B import *
 from NIDAQ import *
@@ -21,7 +23,11 @@ Pyro4.config.REQUIRE_EXPOSE = False
 Pyro4.config.PICKLE_PROTOCOL_VERSION = 4   #added on 24-02-2022
 
 
-def connect(objectId, nameserver = ns, exile_id=None, uri = None):
+def connect(objectId, nameserver = ns, exile_id=None, uri = None, transport = None):
+    """
+    transport = 'numpy' sends arrays as raw buffers, 'numpy_lz4' also
+    compresses them (see pyro_numpy), if the server accepts it.
+    """
     try:
         if exile_id is not None:
             # uri = 'PYRO:' + exile_id + '@phd-exile-phys.ethz.ch:' + str(9090)
@@ -31,6 +37,8 @@ def connect(objectId, nameserver = ns, exile_id=None, uri = None):
         
         proxy = Pyro4.Proxy(uri)
         proxy._pyroBind()
+        if transport is not None:
+            use_numpy_transport(proxy, compress = transport == 'numpy_lz4')
         print(Fore.GREEN + Style.BRIGHT + "Connection success: " + objectId + Fore.RESET)
         return proxy
     except:
@@ -38,9 +46,9 @@ def connect(objectId, nameserver = ns, exile_id=None, uri = None):
         return None
 
 HP4142B_c       = connect('HP4142B_r')
-WinSpec_c       = connect('WinSpec', exile_id = 'WinSpec')
+WinSpec_c       = connect('WinSpec', exile_id = 'WinSpec', transport = 'numpy_lz4')
 # LightField_c    = connect('LightField', uri = 'PYRO:LightField@G15-Pylon.dhcp-int.phys.ethz.ch:63899')        
-NIDAQ_c = connect("NIDAQ")
+NIDAQ_c = connect("NIDAQ", transport = 'numpy')
 ELL1_c = connect("ELL14")
 ELL2_c = connect("ELL14_2")
 ELL3_c = connect("ELL14_3")
@@ -7,6 +7,8 @@ Created on Mon Jun 04 14:15:01 2018
 
 from nameserver_client import *
 import nw_config as config
+import pyro_numpy
+import pyro_batch
 
 import Pyro4
 Pyro4.config.SERIALIZERS_ACCEPTED.add('pickle')
@@ -29,8 +31,12 @@ def RunServer(object_dict, host = 'localhost'):
     Pyro4.config.SERIALIZERS_ACCEPTED.add('pickle')
     Pyro4.config.SERIALIZER = "pickle"
     Pyro4.config.REQUIRE_EXPOSE = False
+    # clients may send arrays as raw buffers (pyro_numpy.use_numpy_transport)
+    pyro_numpy.register()
     
     daemon = Pyro4.Daemon(host = host)
+    # several calls in one round trip (pyro_batch.Batch)
+    pyro_batch.register_batch_executor(daemon)
     objectIds = object_dict.keys()
     for objectId in objectIds:
         uri = daemon.register(object_dict[objectId], objectId = objectId)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:33:04 2026
+
+@author: zerui
+
+Several calls on a Pyro object in one round trip.
+
+Every call or attribute access on a proxy is a round trip, e.g.
+v_134_setter of main.py (hp.SMU1.set_voltage, sleep, hp.SMU3..., each
+hp.SMUx itself a round trip). A Batch records the steps and sends them
+at once, the server runs them in order and returns all results:
+
+    b = Batch(hp, delay = 0.05)    # sleep in the server after every call
+    for smu in ('SMU1', 'SMU3', 'SMU4'):
+        b.call(smu + '.set_voltage', val)
+    b.execute()
+
+    b = Batch(ws)
+    b.get('exposure_time')
+    b.set('exposure_time', 0.01)
+    b.call('get_spectrum', wlen = True)
+    b.sleep(0.1)
+    exp, _, (spectra, wl), _ = b.execute()
+
+Names are attribute paths on the object, like for Pyro calls (no
+names starting with '_', only exposed ones if Pyro4.config.REQUIRE_EXPOSE).
+execute() returns one result per step (None for set and sleep) and
+raises the exception of a failing step, with its index as
+batch_step, the following steps are not run.
+
+The server side is a BatchExecutor registered in the daemon under
+BATCH_OBJECT_ID (register_batch_executor, done by RunServer). For a
+registered class (WinSpec) it takes the instance like the daemon does
+for a call, by the instance mode of the class: with 'session' (the
+default) the executor's connection has its own instance. Against a
+server without it, or on an object that is not a proxy (simulation in
+process), the steps run one by one from the client.
+"""
+
+import time
+import inspect
+import threading
+import Pyro4
+import Pyro4.util
+import Pyro4.errors
+
+BATCH_OBJECT_ID = 'zq.batch'
+
+CALL, GET, SET, SLEEP = 'call', 'get', 'set', 'sleep'
+
+
+def _attribute(obj, name, only_exposed):
+    if name.startswith('_'):
+        raise AttributeError(f"attempt to access private attribute '{name}'")
+    if only_exposed and inspect.isdatadescriptor(getattr(type(obj), name, None)):
+        return Pyro4.util.get_exposed_property_value(obj, name)
+    value = getattr(obj, name)
+    if only_exposed and not getattr(value, '_pyroExposed', False):
+        raise AttributeError(f"attempt to access unexposed attribute '{name}'")
+    return value
+
+def _resolve(obj, path, only_exposed = False):
+    """obj.a.b for 'a.b'."""
+    for name in path.split('.'):
+        obj = _attribute(obj, name, only_exposed)
+    return obj
+
+def run_steps(obj, steps, delay = 0, only_exposed = False):
+    """
+    Run the steps of a Batch on obj (object or proxy), the results.
+    only_exposed: the attributes must be exposed to Pyro.
+    """
+    results = []
+    for i, (kind, name, args, kwargs) in enumerate(steps):
+        try:
+            if kind == CALL:
+                result = _resolve(obj, name, only_exposed)(*args, **kwargs)
+            elif kind == GET:
+                result = _resolve(obj, name, only_exposed)
+            elif kind == SET:
+                parent, _, attribute = name.rpartition('.')
+                if parent:
+                    obj_set = _resolve(obj, parent, only_exposed)
+                else:
+                    obj_set = obj
+                if attribute.startswith('_'):
+                    raise AttributeError(f"attempt to access private attribute '{attribute}'")
+                if only_exposed:
+                    Pyro4.util.set_exposed_property_value(obj_set, attribute, args[0])
+                else:
+                    setattr(obj_set, attribute, args[0])
+                result = None
+            elif kind == SLEEP:
+                time.sleep(args[0])
+                result = None
+            else:
+                raise ValueError(f"unknown batch step {kind}")
+        except Exception as e:
+            e.batch_step = i
+            raise
+        results.append(result)
+        if delay and kind == CALL:
+            time.sleep(delay)
+    return results
+
+
+@Pyro4.expose
+class BatchExecutor(object):
+    """Runs batches on the objects of its daemon."""
+    def __init__(self, daemon):
+        self._daemon = daemon
+
+    def run(self, object_id, steps, delay = 0):
+        obj = self._daemon.objectsById.get(object_id)
+        if obj is None:
+            raise Pyro4.errors.DaemonError(f"unknown object {object_id}")
+        if inspect.isclass(obj):
+            obj = self._daemon._getInstance(obj, Pyro4.current_context.client)
+        return run_steps(obj, steps, delay, only_exposed = Pyro4.config.REQUIRE_EXPOSE)
+
+def register_batch_executor(daemon):
+    """Let clients send batches to the objects of daemon."""
+    if BATCH_OBJECT_ID not in daemon.objectsById:
+        daemon.register(BatchExecutor(daemon), objectId = BATCH_OBJECT_ID)
+
+
+# proxies of the executors by (daemon location, serializer), None if the
+# daemon has no executor. Pyro4 proxies can be shared between threads.
+_executors = {}
+_executors_lock = threading.Lock()
+
+def _executor(proxy):
+    uri = proxy._pyroUri
+    key = (uri.location, proxy._pyroSerializer)
+    with _executors_lock:
+        if key not in _executors:
+            executor = Pyro4.Proxy(f"PYRO:{BATCH_OBJECT_ID}@{uri.location}")
+            executor._pyroSerializer = proxy._pyroSerializer
+            executor._pyroHmacKey = proxy._pyroHmacKey
+            executor._pyroTimeout = proxy._pyroTimeout
+            try:
+                executor._pyroBind()
+            except Pyro4.errors.CommunicationError as e:
+                print(f"{uri.location}: no batch executor ({e}), running batches call by call")
+                executor._pyroRelease()
+                executor = None
+            _executors[key] = executor
+        return _executors[key]
+
+
+class Batch(object):
+    """
+    Steps on obj (a Pyro proxy or the object itself), sent in one round
+    trip by execute(). delay (s) is slept in the server after every call.
+    """
+    def __init__(self, obj, delay = 0):
+        self.obj = obj
+        self.delay = delay
+        self.steps = []
+
+    def call(self, method, *args, **kwargs):
+        self.steps.append((CALL, method, args, kwargs))
+        return self
+
+    def get(self, name):
+        self.steps.append((GET, name, (), {}))
+        return self
+
+    def set(self, name, value):
+        self.steps.append((SET, name, (value,), {}))
+        return self
+
+    def sleep(self, seconds):
+        self.steps.append((SLEEP, None, (seconds,), {}))
+        return self
+
+    def __len__(self):
+        return len(self.steps)
+
+    def execute(self):
+        """The result of every step, clears the batch for reuse."""
+        steps, self.steps = self.steps, []
+        if not steps:
+            return []
+        if isinstance(self.obj, Pyro4.Proxy):
+            executor = _executor(self.obj)
+            if executor is not None:
+                return executor.run(self.obj._pyroUri.object, steps, self.delay)
+        return run_steps(self.obj, steps, self.delay)
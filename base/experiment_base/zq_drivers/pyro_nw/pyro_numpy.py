@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:32:31 2026
+
+@author: zerui
+
+Pyro4 serializers that send numpy arrays as raw buffers.
+
+With the pickle serializer every array of a call or result (spectra of
+WinSpec, DAQ buffers, ...) is copied into the pickle stream and copied
+out again on the other side. The 'numpy' serializer pickles everything
+but the arrays: each array (of at least MIN_ARRAY_BYTES) is replaced by a
+small header (dtype, shape) and its data is appended to the message as
+is. On the receiving side the arrays are read-only views of the message,
+nothing is copied. Decompressed arrays, smaller arrays (copied from the
+pickle) and arrays of objects are read-only too (not subclasses such as
+masked arrays, which are pickled as usual), so callers copy before
+modifying in place (spec = spec - background, or .copy()) with either
+serializer. 'numpy_lz4' additionally compresses the array data
+with LZ4 (if it gets smaller), e.g. for the WinSpec exile link. The bytes
+of multi-byte items are shuffled first (all first bytes, all second
+bytes, ...), which roughly halves noisy uint16 CCD frames where plain LZ4
+barely compresses them. The
+serializer of a response is the one of its request, so the client
+chooses per proxy.
+
+Server (before the Daemon is created):
+    import pyro_numpy
+    pyro_numpy.register()
+
+Client:
+    ws = pyro_numpy.use_numpy_transport(ws, compress = True)
+
+use_numpy_transport falls back to pickle if the server does not accept
+the serializers. Message layout (little endian):
+    'ZQNP', version (u1), 0 (u1), number of arrays (u2), pickle length (u4)
+    per array: codec (u1, 0 raw, 1 LZ4, 2 shuffled LZ4), item size (u1,
+        for the shuffle), data length (u8), stored length (u8)
+    pickle of the object, the arrays as persistent ids
+    stored data of every array, each starting at a multiple of 8 bytes
+"""
+
+import io
+import struct
+import pickle
+import numpy as np
+import Pyro4
+import Pyro4.util
+import Pyro4.errors
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+
+MAGIC = b'ZQNP'
+VERSION = 2
+MIN_ARRAY_BYTES = 256 # smaller arrays are sent in the pickle
+MIN_COMPRESS_BYTES = 4096
+RAW, LZ4, SHUFFLE_LZ4 = 0, 1, 2
+
+_HEADER = struct.Struct('<4sBBHI')
+_ARRAY = struct.Struct('<BBQQ')
+MAX_SHUFFLE_ITEMSIZE = 16
+
+def _padding(n):
+    return -n % 8
+
+# byte k of every item, per k (column copies, much faster than .T.copy())
+def _shuffle(data, itemsize):
+    items = data.reshape(-1, itemsize)
+    out = np.empty((itemsize, len(items)), np.uint8)
+    for k in range(itemsize):
+        out[k] = items[:, k]
+    return out
+
+def _unshuffle(data, itemsize):
+    planes = np.frombuffer(data, np.uint8).reshape(itemsize, -1)
+    out = np.empty((planes.shape[1], itemsize), np.uint8)
+    for k in range(itemsize):
+        out[:, k] = planes[k]
+    return out.reshape(-1)
+
+
+class _Pickler(pickle.Pickler):
+    def __init__(self, file, protocol):
+        super().__init__(file, protocol)
+        self.arrays = []
+        self._ids = {} # id of the array: persistent id, the same array is sent once
+
+    def persistent_id(self, obj):
+        # not subclasses (masked arrays, ...) except memmap
+        if type(obj) not in (np.ndarray, np.memmap):
+            return None
+        if id(obj) in self._ids:
+            return self._ids[id(obj)]
+        if obj.dtype.hasobject:
+            # the items are pickled
+            pid = ('objects', len(self._ids), obj.dtype, obj.shape, obj.ravel().tolist())
+        elif obj.nbytes < MIN_ARRAY_BYTES:
+            pid = ('bytes', len(self._ids), np.lib.format.dtype_to_descr(obj.dtype), obj.shape, obj.tobytes())
+        else:
+            pid = ('ndarray', len(self.arrays), np.lib.format.dtype_to_descr(obj.dtype), obj.shape)
+            self.arrays.append(np.ascontiguousarray(obj))
+        self._ids[id(obj)] = pid
+        return pid
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, buffers):
+        super().__init__(file)
+        self.buffers = buffers
+        self._arrays = {} # (kind, index): array, shared like on the sending side
+
+    def _load(self, kind, index, dtype, shape, data = None):
+        if kind == 'ndarray':
+            return np.frombuffer(self.buffers[index], dtype = np.lib.format.descr_to_dtype(dtype)).reshape(shape)
+        if kind == 'bytes':
+            # frombuffer of bytes is read-only
+            return np.frombuffer(data, dtype = np.lib.format.descr_to_dtype(dtype)).reshape(shape)
+        if kind == 'objects':
+            array = np.empty(len(data), dtype = dtype)
+            array[:] = data
+            array = array.reshape(shape)
+            array.flags.writeable = False
+            return array
+        raise pickle.UnpicklingError(f"unknown persistent id {kind}")
+
+    def persistent_load(self, pid):
+        key = pid[:2]
+        if key not in self._arrays:
+            self._arrays[key] = self._load(*pid)
+        return self._arrays[key]
+
+
+def encode(obj, compress = False):
+    """obj as bytes, its arrays as raw (or LZ4 compressed) buffers."""
+    if compress and lz4 is None:
+        raise ImportError("LZ4 compression needs the lz4 package")
+    stream = io.BytesIO()
+    pickler = _Pickler(stream, Pyro4.config.PICKLE_PROTOCOL_VERSION)
+    pickler.dump(obj)
+    pickled = stream.getbuffer()
+    table, blocks = [], []
+    offset = _HEADER.size + _ARRAY.size * len(pickler.arrays) + len(pickled)
+    blocks.append(b'\0' * _padding(offset))
+    offset += _padding(offset)
+    for array in pickler.arrays:
+        data = array.reshape(-1).view(np.uint8)
+        codec = RAW
+        if compress and array.nbytes >= MIN_COMPRESS_BYTES:
+            itemsize = array.dtype.itemsize
+            if 1 < itemsize <= MAX_SHUFFLE_ITEMSIZE:
+                compressed, method = lz4.block.compress(_shuffle(data, itemsize), store_size = False), SHUFFLE_LZ4
+            else:
+                compressed, method = lz4.block.compress(data, store_size = False), LZ4
+            if len(compressed) < array.nbytes:
+                data, codec = compressed, method
+        table.append(_ARRAY.pack(codec, min(array.dtype.itemsize, 255), array.nbytes, len(data)))
+        blocks += [data, b'\0' * _padding(len(data))]
+        offset += len(data) + _padding(len(data))
+    header = _HEADER.pack(MAGIC, VERSION, 0, len(pickler.arrays), len(pickled))
+    return b''.join([header] + table + [pickled] + blocks)
+
+def decode(data):
+    """
+    The object of encode(obj), its arrays are read-only (views of data if
+    not compressed).
+    """
+    data = memoryview(data)
+    magic, version, _, n_arrays, n_pickled = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise Pyro4.errors.SerializeError(f"not a numpy transport message (version {VERSION})")
+    offset = _HEADER.size
+    table = [_ARRAY.unpack_from(data, offset + i * _ARRAY.size) for i in range(n_arrays)]
+    offset += _ARRAY.size * n_arrays
+    pickled = data[offset:offset + n_pickled]
+    offset += n_pickled
+    offset += _padding(offset)
+    buffers = []
+    for codec, itemsize, n_bytes, n_stored in table:
+        block = data[offset:offset + n_stored]
+        if codec in (LZ4, SHUFFLE_LZ4):
+            if lz4 is None:
+                raise Pyro4.errors.SerializeError("received LZ4 compressed arrays, install the lz4 package")
+            block = lz4.block.decompress(block, uncompressed_size = n_bytes, return_bytearray = True)
+            if codec == SHUFFLE_LZ4:
+                block = _unshuffle(block, itemsize)
+        elif codec != RAW:
+            raise Pyro4.errors.SerializeError(f"unknown array codec {codec}")
+        buffers.append(memoryview(block).toreadonly())
+        offset += n_stored + _padding(n_stored)
+    return _Unpickler(io.BytesIO(pickled), buffers).load()
+
+
+class NumpySerializer(Pyro4.util.PickleSerializer):
+    """Pickle with the arrays sent as raw buffers (see the module docstring)."""
+    serializer_id = 16 # Pyro4 uses 1 to 7
+    compress = False
+
+    def dumpsCall(self, obj, method, vargs, kwargs):
+        return encode((obj, method, vargs, kwargs), self.compress)
+
+    def dumps(self, data):
+        return encode(data, self.compress)
+
+    def loadsCall(self, data):
+        return decode(data)
+
+    def loads(self, data):
+        return decode(data)
+
+class NumpyLZ4Serializer(NumpySerializer):
+    serializer_id = 17
+    compress = True
+
+SERIALIZERS = {'numpy': NumpySerializer, 'numpy_lz4': NumpyLZ4Serializer}
+
+def register():
+    """
+    Make the serializers known to Pyro4 and accepted by daemons created
+    afterwards, on servers and clients.
+    """
+    for name, cls in SERIALIZERS.items():
+        if name == 'numpy_lz4' and lz4 is None:
+            continue
+        if name not in Pyro4.util._serializers:
+            serializer = cls()
+            Pyro4.util._serializers[name] = serializer
+            Pyro4.util._serializers_by_id[serializer.serializer_id] = serializer
+        Pyro4.config.SERIALIZERS_ACCEPTED.add(name)
+
+def use_numpy_transport(proxy, compress = False):
+    """
+    Switch proxy to the numpy serializer (with LZ4 if compress) and
+    rebind it, stays with its serializer if the server does not accept
+    it. Returns the proxy.
+    """
+    register()
+    name = 'numpy_lz4' if compress and lz4 is not None else 'numpy'
+    previous = proxy._pyroSerializer
+    proxy._pyroRelease()
+    proxy._pyroSerializer = name
+    try:
+        proxy._pyroBind()
+    except (Pyro4.errors.SerializeError, Pyro4.errors.ProtocolError, Pyro4.errors.CommunicationError) as e:
+        print(f"{proxy._pyroUri.object}: numpy transport not accepted by the server ({e}), using {previous or Pyro4.config.SERIALIZER}")
+        proxy._pyroRelease()
+        proxy._pyroSerializer = previous
+        proxy._pyroBind()
+    return proxy
@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:08:46 2026
+
+@author: zerui
+
+Simulated instruments with the interface of the lab drivers, to run and
+benchmark meas_scan without the lab PCs (see sim_server and
+benchmarks/bench_scan.py).
+
+    sim_hp4142b  the lab driver HP4142B on SimHP4142BResource, a VISA
+                 resource that answers UNT?, *LRN?, DV, TI / TV, MM / XE and NUB?
+                 and returns readings in the binary output format (FMT3)
+    SimNIDAQ     NIDAQ ao0-ao2 with ramps, measure_ai, get_one_ctrate and
+                 the hardware timed set_ao_measure
+    SimWinSpec   WinSpec spectrometer (wsSrv), get_spectrum
+    SimSR830     SR830 lock-in, X / Y / R / theta and snapshot (SNAP?)
+
+Every instrument call sleeps latency (+ the acquisition time), values
+carry gaussian noise of the given size. The simulated instruments are
+Pyro4 exposed, attributes that main.py reads remotely (daq.ao1,
+ws.exposure_time, ...) are properties. The HP4142B driver is served like
+in the lab, with Pyro4.config.REQUIRE_EXPOSE = False (see sim_server).
+"""
+
+import time
+import threading
+import numpy as np
+import Pyro4
+from HP4142B import HP4142B
+
+
+''' HP4142B '''
+
+HP_VOLTAGE_RANGES = {10:0.2, 11:2, 12:20, 13:40, 14:100, 15:200, 16:500, 17:1000}
+HP_CURRENT_RANGES = {11:1e-9, 12:1e-8, 13:1e-7, 14:1e-6, 15:1e-5, 16:1e-4, 17:1e-3, 18:1e-2, 19:1e-1, 20:1, 21:10}
+
+def encode_hp_binary(value, channel, is_voltage = False, is_measurement = True):
+    """
+    One reading in the 4 byte binary format of the HP4142B (FMT3): measured
+    value in counts of the smallest range that holds it, 17 bit two's
+    complement, status (overflow if no range holds it) and channel.
+    """
+    ranges = HP_VOLTAGE_RANGES if is_voltage else HP_CURRENT_RANGES
+    full_scale = 50000. if is_measurement else 20000.
+    status = 3 # V: overflow, counted in the largest range
+    for setting, value_range in sorted(ranges.items()):
+        if abs(value) <= value_range:
+            status = 0
+            break
+    counts = int(round(value / value_range * full_scale))
+    counts = max(min(counts, 65535), -65536) & 0x1FFFF
+    byte_1 = (128 if is_measurement else 0) | (0 if is_voltage else 64) | (setting << 1) | (counts >> 16)
+    byte_4 = (status << 5) | channel
+    return bytes([byte_1, (counts >> 8) & 0xFF, counts & 0xFF, byte_4])
+
+
+class SimHP4142BResource(object):
+    """
+    Instrument side of a HP4142B with SMUs in slots, a VISA like resource
+    (write, query, read_raw). Every SMU in voltage mode drives a resistor
+    of resistance Ohm, TI integrates for integration_time. Each write or
+    query takes latency seconds.
+    """
+    def __init__(self, slots = (1, 2, 3, 4), latency = 2e-3, integration_time = 0.02,
+                 resistance = 1e9, noise = 1e-12, seed = None):
+        self.slots = tuple(slots)
+        self.latency = latency
+        self.integration_time = integration_time
+        self.resistance = resistance
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.RLock()
+        # range setting (20 V), voltage, compliance
+        self._output = {slot: [12, 0., 1e-9] for slot in self.slots}
+        self._output_on = {slot: True for slot in self.slots}
+        self._buffer = []
+        self._spot_channels = []
+        self.n_transactions = 0
+
+    def _transaction(self):
+        self.n_transactions += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _current(self, channel):
+        setting, voltage, compliance = self._output[channel]
+        current = voltage / self.resistance + self.noise * self._rng.standard_normal()
+        return np.clip(current, -compliance, compliance)
+
+    def write(self, command):
+        with self._lock:
+            self._transaction()
+            command = command.strip()
+            if command.startswith('DV'):
+                channel, setting, value, compliance = command[2:].split(',')[:4]
+                self._output[int(channel)] = [int(setting), float(value), float(compliance)]
+            elif command.startswith('TI') or command.startswith('TV'):
+                channel = int(command[2:].split(',')[0])
+                time.sleep(self.integration_time)
+                if command.startswith('TI'):
+                    self._buffer.append(encode_hp_binary(self._current(channel), channel))
+                else:
+                    self._buffer.append(encode_hp_binary(self._output[channel][1], channel, is_voltage = True))
+            elif command.startswith('MM'):
+                self._spot_channels = [int(c) for c in command[2:].split(',')[1:]]
+            elif command == 'XE':
+                # one record of all channels of the spot measurement
+                time.sleep(self.integration_time)
+                self._buffer.append(b''.join(encode_hp_binary(self._current(channel), channel)
+                                             for channel in self._spot_channels))
+            elif command.startswith('CN') or command.startswith('CL'):
+                channels = [int(c) for c in command[2:].split(',') if c.strip()] or self.slots
+                for channel in channels:
+                    self._output_on[channel] = command.startswith('CN')
+            elif command.startswith('BC') or command == '*RST':
+                self._buffer = []
+            # AV, FL, CM, FMT, AB: accepted, no effect on the simulation
+
+    def query(self, command):
+        with self._lock:
+            self._transaction()
+            command = command.strip()
+            if command == 'UNT?':
+                units = ['HP41421B,0' if slot in self.slots else '0,0' for slot in range(1, 9)]
+                return ';'.join(units)
+            if command == 'NUB?':
+                return str(len(self._buffer))
+            if command.startswith('*LRN?'):
+                channel = int(command[5:])
+                if not self._output_on[channel]:
+                    return 'CL{}'.format(channel)
+                setting, voltage, compliance = self._output[channel]
+                return 'DV{},{},{:+.4E},{:+.3E},0'.format(channel, setting, voltage, compliance)
+            raise ValueError('SimHP4142BResource: unknown query {}'.format(command))
+
+    def read_raw(self):
+        with self._lock:
+            self._transaction()
+            return self._buffer.pop(0) + b'\r\n'
+
+
+def sim_hp4142b(**kwargs):
+    """
+    The lab driver HP4142B.HP4142B on a SimHP4142BResource (kwargs), with
+    SMU1 ... SMU4, connected without the startup (initialize = False) like
+    to a running instrument.
+    """
+    return HP4142B(None, initialize = False, resource = SimHP4142BResource(**kwargs))
+
+
+''' NIDAQ '''
+
+@Pyro4.expose
+class SimNIDAQ(object):
+    """
+    NIDAQ with the ao0 - ao2 outputs of NIDAQ.NIDAQ (ramped at rate V/s with
+    1000 samples/s like the real card), analog inputs and edge counters.
+    The count rate is a grid of gaussian spots over the scanner outputs
+    ao1 / ao2 (spot_pitch in V) on top of background, the analog inputs
+    read ao0 * ai_gain.
+    """
+    def __init__(self, latency = 1e-3, background = 1e3, peak = 2e4, spot_pitch = 0.1,
+                 spot_width = 0.01, ai_gain = 0.5, noise = 1e-3, seed = None):
+        self.latency = latency
+        self.background = background
+        self.peak = peak
+        self.spot_pitch = spot_pitch
+        self.spot_width = spot_width
+        self.ai_gain = ai_gain
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._ao = {'ao0': 0., 'ao1': 0., 'ao2': 0.}
+
+    @property
+    def ao0(self):
+        return self._ao['ao0']
+
+    @property
+    def ao1(self):
+        return self._ao['ao1']
+
+    @property
+    def ao2(self):
+        return self._ao['ao2']
+
+    def get_ao0(self):
+        return self.ao0
+
+    def get_ao1(self):
+        return self.ao1
+
+    def get_ao2(self):
+        return self.ao2
+
+    def _set_ao(self, channel, value, rate):
+        with self._lock:
+            if rate > 0:
+                nsamples = int(np.ceil(1000 * np.abs(value - self._ao[channel]) / rate))
+                time.sleep(nsamples / 1000)
+            time.sleep(self.latency)
+            self._ao[channel] = value
+
+    def set_ao0(self, value, ao_range = 10, rate = 1):
+        self._set_ao('ao0', value, rate)
+
+    def set_ao1(self, value, ao_range = 10, rate = 1, verbose = False):
+        if not np.isclose(value, self._ao['ao1']):
+            self._set_ao('ao1', value, rate)
+
+    def set_ao2(self, value, ao_range = 10, rate = 1, verbose = False):
+        if not np.isclose(value, self._ao['ao2']):
+            self._set_ao('ao2', value, rate)
+
+    def count_rate(self, x, y):
+        """Counts per second at scanner voltages x, y (ao1, ao2)."""
+        dx = (np.asarray(x) + self.spot_pitch/2) % self.spot_pitch - self.spot_pitch/2
+        dy = (np.asarray(y) + self.spot_pitch/2) % self.spot_pitch - self.spot_pitch/2
+        return self.background + self.peak * np.exp(-(dx**2 + dy**2) / (2 * self.spot_width**2))
+
+    def _ai_value(self, ao0, shape = ()):
+        return self.ai_gain * ao0 + self.noise * self._rng.standard_normal(shape)
+
+    def measure_ai(self, ai_channel = 0, rate = 1000.0, nr_samples = 100,
+                   average = True, limit = 10.0, mode = 'diff', return_std = False):
+        channels = np.atleast_1d(ai_channel)
+        with self._lock:
+            time.sleep(self.latency + (nr_samples + 1) / rate)
+            data = self._ai_value(self._ao['ao0'], (len(channels), nr_samples))
+        if not average:
+            return data
+        if return_std:
+            return data.mean(axis = 1), data.std(axis = 1)
+        return data.mean(axis = 1)
+
+    def get_one_ctrate(self, sampling_rate = 3e3, acq_time = 0.5, channel = 'ctr2'):
+        """Count rate at the current scanner position, like daq_February2025.get_one_ctrate."""
+        with self._lock:
+            time.sleep(self.latency + acq_time)
+            rate = self.count_rate(self._ao['ao1'], self._ao['ao2'])
+            return self._rng.poisson(rate * acq_time) / acq_time
+
+    def set_ao_measure(self, ao_channel, ao_setpoints, sampling_rate,
+                       samples_per_point = 1, settle_samples = 0,
+                       ctr_channels = (), ai_channels = (), ao_range = 10,
+                       ai_limit = 10.0, ai_mode = 'diff'):
+        """Hardware timed line, see NIDAQ.set_ao_measure."""
+        ao_setpoints = np.asarray(ao_setpoints, dtype = np.float64)
+        n_total = len(ao_setpoints) * int(samples_per_point) + 1
+        acq_time = (int(samples_per_point) - int(settle_samples)) / sampling_rate
+        with self._lock:
+            time.sleep(self.latency + n_total / sampling_rate)
+            position = dict(self._ao)
+            data = {}
+            for channel in ctr_channels:
+                position[ao_channel] = ao_setpoints
+                rate = self.count_rate(position['ao1'], position['ao2'])
+                data[channel] = self._rng.poisson(rate * acq_time).astype(np.float64)
+            for channel in ai_channels:
+                ao0 = ao_setpoints if ao_channel == 'ao0' else self._ao['ao0']
+                data[channel] = self._ai_value(ao0, ao_setpoints.shape)
+            self._ao[ao_channel] = ao_setpoints[-1]
+        return data
+
+
+''' WinSpec '''
+
+@Pyro4.expose
+class SimWinSpec(object):
+    """
+    WinSpec server (wsSrv) with a single emission line on a dark count
+    background. get_spectrum takes num_frames * exposure_time plus
+    readout_time, spectra are uint16 of shape (frames, pixels, 1).
+    """
+    def __init__(self, n_pixels = 1340, dispersion = 0.05, latency = 5e-3, readout_time = 0.02,
+                 line_center = 750., line_width = 0.5, dark = 600, peak = 3e4, seed = None):
+        self.n_pixels = n_pixels
+        self.dispersion = dispersion
+        self.latency = latency
+        self.readout_time = readout_time
+        self.line_center = line_center
+        self.line_width = line_width
+        self.dark = dark
+        self.peak = peak
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._exposure_time = 0.1
+        self._wavelength = 750.
+        self._num_frames = 1
+        self._temperature = -70.
+
+    def _call(self):
+        time.sleep(self.latency)
+
+    @property
+    def exposure_time(self):
+        self._call()
+        return self._exposure_time
+    @exposure_time.setter
+    def exposure_time(self, val):
+        self._call()
+        self._exposure_time = float(val)
+
+    def get_exposure_time(self):
+        return self.exposure_time
+
+    def set_exposure_time(self, val):
+        self.exposure_time = val
+
+    @property
+    def wavelength(self):
+        self._call()
+        return self._wavelength
+    @wavelength.setter
+    def wavelength(self, val):
+        self._call()
+        time.sleep(abs(float(val) - self._wavelength) / 100.) # grating moves at 100 nm/s
+        self._wavelength = float(val)
+
+    def get_wavelength(self):
+        return self.wavelength
+
+    def set_wavelength(self, val):
+        self.wavelength = val
+
+    @property
+    def num_frames(self):
+        self._call()
+        return self._num_frames
+    @num_frames.setter
+    def num_frames(self, val):
+        self._call()
+        self._num_frames = int(val)
+
+    def get_num_frames(self):
+        return self.num_frames
+
+    def set_num_frames(self, val):
+        self.num_frames = val
+
+    @property
+    def temperature(self):
+        self._call()
+        return self._temperature
+
+    def get_temperature(self):
+        return self.temperature
+
+    def wavelengths(self):
+        return self._wavelength + self.dispersion * (np.arange(self.n_pixels) - self.n_pixels / 2)
+
+    def get_spectrum(self, wlenpoly = False, wlen = False, dt_loop = 0.01, test = False):
+        with self._lock:
+            self._call()
+            time.sleep(self._num_frames * self._exposure_time + self.readout_time)
+            wl = self.wavelengths()
+            counts = self.peak * self._exposure_time * np.exp(-(wl - self.line_center)**2 / (2 * self.line_width**2))
+            spectra = self._rng.poisson(self.dark + counts, size = (self._num_frames, self.n_pixels))
+            spectra = np.clip(spectra, 0, 65535).astype(np.uint16)[:, :, None]
+        if wlen or wlenpoly:
+            return spectra, wl
+        return spectra
+
+
+''' SR830 '''
+
+@Pyro4.expose
+class SimSR830(object):
+    """
+    SR830 lock-in measuring a signal of amplitude (V) and phase (deg), a
+    callable amplitude is evaluated at every reading (e.g. from another
+    simulated instrument). Every query takes latency seconds, snapshot
+    reads up to 6 values in one query like SNAP?.
+    """
+    SNAP_PARAMS = ('X', 'Y', 'R', 'theta', 'aux in 1', 'aux in 2', 'aux in 3', 'aux in 4',
+                   'reference frequency', 'ch1 display', 'ch2 display')
+
+    def __init__(self, amplitude = 1e-3, phase = 30., frequency = 77.7, time_constant = 0.1,
+                 latency = 2e-3, noise = 1e-5, seed = None):
+        self.amplitude = amplitude
+        self.phase = phase
+        self._frequency = frequency
+        self._time_constant = time_constant
+        self.latency = latency
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def _values(self):
+        amplitude = self.amplitude() if callable(self.amplitude) else self.amplitude
+        z = amplitude * np.exp(1j * np.deg2rad(self.phase))
+        z += self.noise * (self._rng.standard_normal() + 1j * self._rng.standard_normal())
+        return {'X': z.real, 'Y': z.imag, 'R': abs(z), 'theta': np.rad2deg(np.angle(z)),
+                'aux in 1': 0., 'aux in 2': 0., 'aux in 3': 0., 'aux in 4': 0.,
+                'reference frequency': self._frequency, 'ch1 display': z.real, 'ch2 display': z.imag}
+
+    def _query(self, *names):
+        with self._lock:
+            time.sleep(self.latency)
+            values = self._values()
+        return [float(values[name]) for name in names]
+
+    @property
+    def frequency(self):
+        return self._frequency
+    @frequency.setter
+    def frequency(self, val):
+        with self._lock:
+            time.sleep(self.latency)
+            self._frequency = float(val)
+
+    @property
+    def time_constant(self):
+        return self._time_constant
+    @time_constant.setter
+    def time_constant(self, val):
+        self._time_constant = float(val)
+
+    def get_X(self):
+        return self._query('X')[0]
+
+    def get_Y(self):
+        return self._query('Y')[0]
+
+    def get_R(self):
+        return self._query('R')[0]
+
+    def get_theta(self):
+        return self._query('theta')[0]
+
+    X = property(get_X)
+    Y = property(get_Y)
+    R = property(get_R)
+    theta = property(get_theta)
+
+    def get_aux_in(self, channel):
+        return self._query('aux in {}'.format(channel))[0]
+
+    def snapshot(self, *args):
+        if not (2 <= len(args) <= 6):
+            raise ValueError(
+                'Number of arguments must be between 2 and 6 (got {}).'.format(len(args)))
+        for a in args:
+            if a not in self.SNAP_PARAMS:
+                raise ValueError('Values must be in {} (got {}).'.format(self.SNAP_PARAMS, a))
+        return self._query(*args)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:04:59 2026
+
+@author: zerui
+
+Simulated lab (sim_instruments) in place of device_manager.
+
+    with SimDevices(mode = 'pyro') as dev:
+        hp, ws, daq, sr = dev.hp, dev.ws, dev.daq, dev.sr
+
+mode = 'inprocess' gives the instrument objects themselves, mode = 'pyro'
+starts a Pyro4 nameserver and daemon on localhost (free ports, in
+background threads), registers the instruments under the object ids of
+device_manager and connects to them through the nameserver like
+device_manager.connect, so every call pays the serialization and the
+round trip of the lab setup. transport = 'numpy' or 'numpy_lz4' sends
+arrays as raw buffers (pyro_nw/pyro_numpy), the server accepts both.
+The daemon also runs pyro_batch.Batch requests.
+
+    python sim_server.py --port 9090
+
+serves the instruments until interrupted, e.g. for main.py with
+nw_config PYRO_HOST = 'localhost'.
+"""
+
+import os, sys
+import threading
+import argparse
+import Pyro4
+import Pyro4.naming
+from sim_instruments import sim_hp4142b, SimNIDAQ, SimWinSpec, SimSR830
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pyro_nw'))
+import pyro_numpy
+import pyro_batch
+
+Pyro4.config.SERIALIZERS_ACCEPTED.add('pickle')
+Pyro4.config.SERIALIZER = "pickle"
+Pyro4.config.REQUIRE_EXPOSE = False # like nw_utils.RunServer, the HP4142B driver is not exposed
+Pyro4.config.PICKLE_PROTOCOL_VERSION = 4
+
+
+# objectId of every instrument and its attribute in main.py
+DEVICE_NAMES = {'hp': 'HP4142B_r', 'ws': 'WinSpec', 'daq': 'NIDAQ', 'sr': 'SR830'}
+
+def make_instruments(latency = None, seed = 0, **kwargs):
+    """
+    The simulated instruments by main.py name. latency overrides the
+    latency of all instruments, kwargs are passed per instrument,
+    e.g. daq = dict(background = 0.).
+    """
+    classes = {'hp': sim_hp4142b, 'ws': SimWinSpec, 'daq': SimNIDAQ, 'sr': SimSR830}
+    instruments = {}
+    for i, (name, cls) in enumerate(classes.items()):
+        options = dict(seed = None if seed is None else seed + i)
+        if latency is not None:
+            options['latency'] = latency
+        options.update(kwargs.get(name, {}))
+        instruments[name] = cls(**options)
+    return instruments
+
+
+class SimServer(object):
+    """Nameserver and daemon serving instruments in background threads."""
+    def __init__(self, instruments, host = 'localhost', ns_port = 0):
+        pyro_numpy.register()
+        self.ns_uri, self._ns_daemon, _ = Pyro4.naming.startNS(host = host, port = ns_port,
+                                                                enableBroadcast = False)
+        self._daemon = Pyro4.Daemon(host = host)
+        pyro_batch.register_batch_executor(self._daemon)
+        self._threads = [threading.Thread(target = self._ns_daemon.requestLoop, daemon = True),
+                         threading.Thread(target = self._daemon.requestLoop, daemon = True)]
+        for thread in self._threads:
+            thread.start()
+        self.nameserver = Pyro4.Proxy(self.ns_uri)
+        for name, instrument in instruments.items():
+            uri = self._daemon.register(instrument, objectId = DEVICE_NAMES.get(name, name))
+            self.nameserver.register(DEVICE_NAMES.get(name, name), uri)
+            # sub objects (hp.SMU1, ...) are returned as proxies (autoproxy)
+            for channel in getattr(instrument, 'SMU_channels', []):
+                self._daemon.register(getattr(instrument, 'SMU{}'.format(channel)))
+
+    def close(self):
+        self.nameserver._pyroRelease()
+        self._daemon.shutdown()
+        self._ns_daemon.shutdown()
+        for thread in self._threads:
+            thread.join(timeout = 5)
+
+
+class SimDevices(object):
+    """
+    hp, ws, daq and sr of main.py, simulated in process or served over a
+    local Pyro nameserver (mode = 'pyro'). kwargs go to make_instruments.
+    """
+    def __init__(self, mode = 'inprocess', host = 'localhost', ns_port = 0, transport = None, **kwargs):
+        if mode not in ('inprocess', 'pyro'):
+            raise ValueError(f"mode must be 'inprocess' or 'pyro', not {mode}")
+        if transport not in (None, 'numpy', 'numpy_lz4'):
+            raise ValueError(f"transport must be None, 'numpy' or 'numpy_lz4', not {transport}")
+        self.mode = mode
+        self.instruments = make_instruments(**kwargs)
+        self.server = None
+        if mode == 'inprocess':
+            self.devices = dict(self.instruments)
+        else:
+            self.server = SimServer(self.instruments, host = host, ns_port = ns_port)
+            self.devices = {}
+            for name in self.instruments:
+                proxy = Pyro4.Proxy(self.server.nameserver.lookup(DEVICE_NAMES[name]))
+                proxy._pyroBind()
+                if transport is not None:
+                    pyro_numpy.use_numpy_transport(proxy, compress = transport == 'numpy_lz4')
+                self.devices[name] = proxy
+
+    def __getattr__(self, name):
+        devices = self.__dict__.get('devices', {})
+        if name in devices:
+            return devices[name]
+        raise AttributeError(name)
+
+    def close(self):
+        if self.server is not None:
+            for proxy in self.devices.values():
+                proxy._pyroRelease()
+            self.server.close()
+            self.server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default = 'localhost')
+    parser.add_argument('--port', type = int, default = 9090, help = 'nameserver port')
+    parser.add_argument('--latency', type = float, default = None)
+    args = parser.parse_args()
+
+    server = SimServer(make_instruments(latency = args.latency), host = args.host, ns_port = args.port)
+    print("Simulated instruments at", server.ns_uri)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.close()
+        sys.exit(0)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:04:55 2026
+
+@author: zerui
+
+Duration and data volume of a scan before it runs (meas_scan(..., dry_run = True)).
+
+The sweep plan is walked point by point without calling any setter or
+getter. The time of a point is modelled from
+    - the ramp of every sweep param that changes (Param(..., ramp = ...)):
+          SafeStepRamp(step, t_step)   HP4142B safe_voltage_sweep
+          RateRamp(rate, scale)        NIDAQ set_ao1 / set_ao2 with rate
+      params without a ramp model use their mean setter time of earlier runs
+    - the settle policies (zq_settle), readbacks count with their min_wait,
+      instruments are not read (Settle.estimate_delay)
+    - wait_before, wait_after, wait_btw_measurements and wait_scan_line
+    - the mean getter time of every meas param in earlier runs, params of
+      different devices run concurrently like in DeviceMeasurement, a
+      ParamGroup counts as one query
+    - the samples of a hardware timed line (zq_line_compiler)
+Getter and setter times are recorded by every meas_scan in
+getter_latency.json in measdatapath (LatencyHistory).
+"""
+
+import os
+import json
+import numpy as np
+import xarray as xr
+from zq_utility import fast_axis_position
+
+LATENCY_FILENAME = 'getter_latency.json'
+
+
+class SafeStepRamp(object):
+    """
+    HP4142B.safe_voltage_sweep: steps larger than step are swept in
+    ceil(|new - old| / step) + 1 points, every point is a readback and two
+    waits of 0.025 s (t_step). The time of the instrument calls is not
+    included.
+    """
+    def __init__(self, step = 0.05, t_step = 0.05):
+        self.step = step
+        self.t_step = t_step
+
+    def time(self, old, new):
+        if old is None:
+            return 0. # unknown start value
+        delta = float(np.abs(new - old))
+        if delta <= self.step:
+            return 0.
+        return (np.ceil(delta / self.step) + 1) * self.t_step
+
+
+class RateRamp(object):
+    """NIDAQ analog output ramped at rate V/s, the output is value * scale."""
+    def __init__(self, rate = 1., scale = 1.):
+        self.rate = rate
+        self.scale = scale
+
+    def time(self, old, new):
+        if old is None or self.rate <= 0:
+            return 0.
+        return float(np.abs(new - old)) * abs(self.scale) / self.rate
+
+
+class LatencyHistory(object):
+    """
+    Mean getter / setter time of every param label over earlier scans,
+    stored as json: {label: {'get': [mean, n], 'set': [mean, n]}}.
+    The count is capped at max_count so that the mean follows changes of
+    the setup.
+    """
+    def __init__(self, filename, max_count = 1000):
+        self.filename = filename
+        self.max_count = max_count
+        self.entries = {}
+        if os.path.isfile(filename):
+            try:
+                with open(filename) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                print(f"Could not read {filename}, starting a new latency history")
+
+    def mean(self, label, kind):
+        entry = self.entries.get(label, {}).get(kind)
+        return None if entry is None else entry[0]
+
+    def update(self, label, kind, mean, n):
+        if n == 0:
+            return
+        old_mean, old_n = self.entries.get(label, {}).get(kind, (0., 0))
+        total = old_n + n
+        self.entries.setdefault(label, {})[kind] = [(old_mean*old_n + mean*n) / total,
+                                                    min(total, self.max_count)]
+
+    def record(self, params):
+        """Add the call times the params accumulated since the last record."""
+        for param in params:
+            for kind, (t_sum, n) in param.call_times.items():
+                if n:
+                    self.update(param.label, kind, t_sum / n, n)
+            param.reset_call_times()
+
+    def save(self):
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f, indent = 1, sort_keys = True)
+        os.replace(tmp, self.filename)
+
+
+def latency_filename(measdatapath):
+    return os.path.join(measdatapath, LATENCY_FILENAME)
+
+def point_nbytes(param):
+    """Bytes and a description of one value of param, from its last value if known."""
+    if param.pv is None:
+        return 8, 'float64 (assumed)'
+    value = param.pv.data if isinstance(param.pv, xr.DataArray) else np.asarray(param.pv)
+    shape = ' {}'.format(value.shape) if value.shape else ''
+    return value.nbytes, '{}{}'.format(value.dtype, shape)
+
+def format_duration(seconds):
+    h, rest = divmod(int(round(seconds)), 3600)
+    m, s = divmod(rest, 60)
+    return '{:d}:{:02d}:{:02d}'.format(h, m, s)
+
+def format_bytes(n):
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if n < 1000:
+            return '{:.1f} {}'.format(n, unit)
+        n /= 1000
+    return '{:.1f} TB'.format(n)
+
+
+def measurement_time(meas_params, history, wait_btw_measurements):
+    """
+    Time to measure all params once, see DeviceMeasurement. The params of
+    a ParamGroup share one query, the time of which is recorded split
+    between them, and wait_btw_measurements applies once per group.
+    """
+    def group_time(params):
+        n_units = len({id(getattr(p, 'group', None) or p) for p in params})
+        return sum(history.mean(p.label, 'get') or 0. for p in params) + n_units * wait_btw_measurements
+    devices = {}
+    untagged = []
+    for param in meas_params:
+        group = getattr(param, 'group', None)
+        device = getattr(param if group is None else group, 'device', None)
+        if device is None:
+            untagged.append(param)
+        else:
+            devices.setdefault(device, []).append(param)
+    if not devices:
+        return group_time(untagged)
+    return max(group_time(params) for params in devices.values()) + group_time(untagged)
+
+
+def estimate_scan(sweep_params, meas_params, history, compiled_line = None,
+                  const_wait_time = 1, wait_before = 0.05, wait_after = 0.05,
+                  wait_scan_line = 1, wait_btw_measurements = 0.01,
+                  sweep_order = 'sawtooth', line_buffers = 1, start_line = 0):
+    """
+    Walk the sweep plan like meas_scan and model its duration.
+    meas_params include the default params of meas_scan. line_buffers is
+    the number of line buffer sets meas_scan allocates.
+    Returns a dict with the total time, the time of every line, the time
+    per point split into set / settle / wait / measure, the bytes of every
+    variable and the peak memory of the line buffers.
+    """
+    sweep_lens = [len(sweep_param[1]) for sweep_param in sweep_params]
+    total_len = int(np.prod(sweep_lens))
+    param_ctr = np.array(total_len/np.cumprod(sweep_lens), dtype = int)
+    n_lines = total_len // sweep_lens[-1]
+    start_index = start_line * sweep_lens[-1]
+
+    t_meas = measurement_time(meas_params, history, wait_btw_measurements)
+    if compiled_line is not None:
+        t_line_acq = sweep_lens[-1] * compiled_line.samples_per_point / compiled_line.sampling_rate
+    parts = dict(set = 0., settle = 0., wait = 0., measure = 0.)
+    line_times = np.zeros(n_lines)
+    old_values = [getattr(sweep_param[0], 'pv', None) for sweep_param in sweep_params]
+    for sweep_index in range(start_index, total_len):
+        fast_pos = fast_axis_position(sweep_index, sweep_lens[-1], sweep_order)
+        line_start = sweep_index % sweep_lens[-1] == 0
+        t_set = 0.
+        t_settle = 0.
+        for param_index, param_ct in enumerate(param_ctr):
+            if compiled_line is not None and param_index == len(param_ctr) - 1 and not line_start:
+                continue
+            if sweep_index%param_ct == 0 or sweep_index == start_index:
+                value_index = sweep_index//param_ct % sweep_lens[param_index]
+                if param_index == len(param_ctr) - 1:
+                    value_index = fast_pos
+                param = sweep_params[param_index][0]
+                old = old_values[param_index]
+                new = sweep_params[param_index][1][value_index]
+                ramp = getattr(param, 'ramp', None)
+                if ramp is not None:
+                    t_set += ramp.time(old, new)
+                else:
+                    t_set += history.mean(param.label, 'set') or 0.
+                settle = getattr(param, 'settle', None)
+                if settle is not None and (old is None or np.any(old != new)):
+                    t_settle = max(t_settle, settle.estimate_delay(old, new))
+                old_values[param_index] = new
+        if compiled_line is not None and line_start:
+            # the card leaves the fast param at the end of the line
+            last = fast_axis_position(sweep_index + sweep_lens[-1] - 1, sweep_lens[-1], sweep_order)
+            old_values[-1] = sweep_params[-1][1][last]
+        if compiled_line is None:
+            t_wait = wait_before + wait_after
+            t_acq = t_meas
+        elif line_start:
+            t_wait = wait_before
+            t_acq = t_line_acq
+        else:
+            t_wait = t_acq = 0.
+        if (sweep_index + 1) % sweep_lens[-1] == 0:
+            t_wait += wait_scan_line
+        parts['set'] += t_set
+        parts['settle'] += t_settle
+        parts['wait'] += t_wait
+        parts['measure'] += t_acq
+        line_times[sweep_index // sweep_lens[-1]] += t_set + t_settle + t_wait + t_acq
+
+    sizes = {}
+    for param in meas_params:
+        nbytes, description = point_nbytes(param)
+        sizes[param.label] = (nbytes * total_len, description)
+    point_bytes = sum(point_nbytes(param)[0] for param in meas_params)
+    n_points = total_len - start_index
+    return dict(
+        n_points = n_points,
+        n_lines = n_lines - start_line,
+        sweep_lens = sweep_lens,
+        total_time = const_wait_time + line_times.sum(),
+        line_times = line_times[start_line:],
+        point_time = {kind: t / max(n_points, 1) for kind, t in parts.items()},
+        variable_bytes = sizes,
+        total_bytes = sum(nbytes for nbytes, _ in sizes.values()),
+        peak_memory = line_buffers * sweep_lens[-1] * point_bytes,
+        unknown_latency = [param.label for param in meas_params
+                           if history.mean(param.label, 'get') is None
+                           and (compiled_line is None or param not in compiled_line.meas_params)],
+        latency_file = history.filename,
+        )
+
+
+def print_estimate(estimate):
+    line_times = estimate['line_times']
+    print("Dry run: {} = {} points in {} lines".format(
+        ' x '.join(str(n) for n in estimate['sweep_lens']), estimate['n_points'], estimate['n_lines']))
+    print("  total time     {} ({:.0f} s)".format(format_duration(estimate['total_time']), estimate['total_time']))
+    if len(line_times):
+        print("  time per line  {:.1f} s (min {:.1f} s, max {:.1f} s)".format(
+            line_times.mean(), line_times.min(), line_times.max()))
+    print("  time per point " + ", ".join('{} {:.3f} s'.format(kind, t) for kind, t in estimate['point_time'].items()))
+    for label, (nbytes, description) in estimate['variable_bytes'].items():
+        print("  {:<14} {:>10}  {}".format(label, format_bytes(nbytes), description))
+    print("  data total     {} uncompressed".format(format_bytes(estimate['total_bytes'])))
+    print("  peak memory    {} line buffers".format(format_bytes(estimate['peak_memory'])))
+    if estimate['unknown_latency']:
+        print("  no getter latency in {} for: {} (counted as 0 s)".format(
+            estimate['latency_file'], ', '.join(estimate['unknown_latency'])))
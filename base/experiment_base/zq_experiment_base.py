@@ -11,20 +11,55 @@ import time, os, sys
 import numpy as np 
 from zq_utility import *
 from live_plot import PlotWindow,MultiPlotter
-import threading
+from live_plot_process import live_plot_process, plot_value, waterfall_row
+from zq_line_compiler import compile_line, DAQ_AO, DAQ_Counter, DAQ_AI
+from zq_settle import settle_params, FixedSettle, StepSettle, ExpSettle, ReadbackSettle
+from zq_estimate import estimate_scan, print_estimate, LatencyHistory, latency_filename, SafeStepRamp, RateRamp
+from zq_readback import check_readback, check_channels, register_channels, invalidate_setpoints, point_cache, point_cached, PointCache
+from zq_diagnostics import ScanTimer, timing_summary, print_timing_summary
+from zq_storage import StorageSession, AsyncLineWriter, LineBuffers, LineJournal, NetCDF4Backend, get_backend, create_variables, write_line, find_datafile, journal_filename
 import netCDF4 as nc4
 import xarray as xr
 from tqdm import tqdm
 import shutil
+from contextlib import nullcontext
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 
 class Param(object):
-    def __init__(self, label, units = "", long_name = "", getter = None, setter = None):
+    def __init__(self, label, units = "", long_name = "", getter = None, setter = None, hw = None,
+                 device = None, settle = None, ramp = None, readback = 'always', channel = None,
+                 dtype = None):
         self.label = label
         self._ext_setter = setter
         self.getter = getter
+        # Hardware description for hardware timed lines (see zq_line_compiler)
+        self.hw = hw
+        # Instrument the getter talks to, e.g. 'hp', params of different 
+        # devices are measured concurrently (see DeviceMeasurement)
+        self.device = device
+        # Settle policy applied by meas_scan when the param changed (see zq_settle)
+        self.settle = settle
+        # Ramp model of the setter for dry runs, e.g. SafeStepRamp (see zq_estimate)
+        self.ramp = ramp
+        # dtype the values are stored with, None for that of the first value (see value_dtype)
+        self.dtype = dtype
+        # ParamGroup that measures this param together with others
+        self.group = None
+        # When meas() calls the getter or returns the setpoint (see zq_readback)
+        self.readback = check_readback(readback)
+        self.setpoint = None
+        self._setpoint_stale = False
+        # Instrument outputs the setter sets, shared with other params (see zq_readback)
+        self.channels = check_channels(channel)
+        register_channels(self)
+        self._reads_since_get = 0
         self.pv = None
         self.ConstantValue = None
+        # Total time and number of getter / setter calls, see LatencyHistory,
+        # and the time of the last call (see zq_diagnostics)
+        self.reset_call_times()
 
         if units != "":
             self.units = units
@@ -35,8 +70,22 @@ class Param(object):
             self.setter = self._tracking_setter
         
     def _tracking_setter(self, val):
+        t0 = time.perf_counter()
         self._ext_setter(val)
+        self._add_call_time('set', time.perf_counter() - t0)
         self.pv = val
+        self.setpoint = val
+        self._setpoint_stale = False
+        invalidate_setpoints(self)
+
+    def reset_call_times(self):
+        self.call_times = {'get': [0., 0], 'set': [0., 0]}
+        self.last_time = {'get': np.nan, 'set': np.nan}
+
+    def _add_call_time(self, kind, t):
+        self.call_times[kind][0] += t
+        self.call_times[kind][1] += 1
+        self.last_time[kind] = t
                  
     def constant(self, ConstantValue=None):
         # there are cases where it has a constant value but no setter
@@ -54,8 +103,27 @@ class Param(object):
             raise ValueError('{}: need to set ConstantValue or give input value'.format(self.label))
         self.pv = self.ConstantValue
         
+    def _trust_setpoint(self):
+        if self.readback == 'always' or self.setpoint is None or self._setpoint_stale:
+            return False
+        if self.readback == 'setpoint':
+            return True
+        return self._reads_since_get < self.readback - 1
+
     def meas(self):
+        if self._trust_setpoint():
+            self._reads_since_get += 1
+            self.pv = self.setpoint
+            self._add_call_time('get', 0.)
+            return
+        t0 = time.perf_counter()
         self.pv = self.getter()
+        self._add_call_time('get', time.perf_counter() - t0)
+        self._reads_since_get = 0
+        if self._setpoint_stale:
+            # set by another param of the channel
+            self.setpoint = self.pv
+            self._setpoint_stale = False
                     
     def get_units(self):
         if hasattr(self, 'units'):
@@ -69,64 +137,128 @@ class Param(object):
         else:
             return ''
         
-def init_ncfile(filename, sweep_params, meas_params, measured_data):
-    sweep_lens = [len(sweep_param[1]) for sweep_param in sweep_params]
-
-    with nc4.Dataset(filename, 'w', format = 'NETCDF4') as ncfile:
-        
-        md = ncfile.createGroup('main_data')
-
-        # Define dimensions and create variables for the sweep parameters
-        for sweep_param in sweep_params:
-            md.createDimension(sweep_param[0].label, len(sweep_param[1]))
-            var = md.createVariable(sweep_param[0].label, sweep_param[1].dtype, (sweep_param[0].label,), zlib=True)
-            if hasattr(sweep_param[0], 'units'):
-                var.units = sweep_param[0].units
-            if hasattr(sweep_param[0], 'long_name'):
-                var.long_name = sweep_param[0].long_name
-            var[:] = sweep_param[1]
-        # sweep_dims = md.dimensions.values()
-        sweep_dims = list(md.dimensions.keys())
-        
-        # Create variables for measured parameters
-        for imeas_param, meas_param in enumerate(meas_params):
-            param_label = meas_param.label
-            if type(meas_param.pv) == xr.core.dataarray.DataArray:
-                for dim in meas_param.pv.coords.dims:
-                    if dim not in md.dimensions.keys():
-                        md.createDimension(dim, len(meas_param.pv[dim] ) )
-                    coord = md.createVariable(dim, np.array(meas_param.pv[dim]).dtype, 
-                                            dim, zlib=True)
-                    coord[:] = meas_param.pv[dim]
-                    if hasattr(meas_param.pv[dim], 'units'):
-                        coord.units = meas_param.units
-                    if hasattr(meas_param.pv[dim], 'long_name'):
-                        coord.long_name = meas_param.long_name
-                var = md.createVariable(param_label, np.array(meas_param.pv).dtype, 
-                                        sweep_dims + list(meas_param.pv.dims), zlib=True)
-            else:
-                var = md.createVariable(param_label, np.array(meas_param.pv).dtype, 
-                                        sweep_dims, zlib=True)
-            if hasattr(meas_param, 'units'):
-                var.units = meas_param.units
-            if hasattr(meas_param, 'long_name'):
-                var.long_name = meas_param.long_name
+class ParamGroup(object):
+    """
+    Params that one instrument query measures together, e.g.
+    
+        XYR = ParamGroup([X, Y, R], getter = lambda: sr.snapshot('X', 'Y', 'R'), device = 'sr')
         
-            new_data = measured_data[imeas_param]            
-            md[param_label][:] = new_data
+    getter returns one value per param, in the order of params. meas_scan
+    calls the getter once per point for all params of the group that are 
+    in meas_params (see measurement_units) and fills the pv of every 
+    param. The time of the query is split evenly between the params.
+    Params without a getter of their own get one that measures the group,
+    so they can still be measured alone (Param.meas, Param.constant).
+    device defaults to the device of the params.
+    
+    With keys (one per param, params may share one) only the params that
+    are measured are queried: getter is called with the distinct keys of
+    these params and returns one value per key, e.g.
+    
+        I_SMU = ParamGroup([I1, I3, Itg], keys = [1, 3, 1],
+                           getter = lambda channels: hp.get_currents(channels))
     
+    queries channel 1 once for a scan of I1 and Itg.
+    """
+    def __init__(self, params, getter, device = None, keys = None):
+        self.params = list(params)
+        self.getter = getter
+        if keys is not None and len(keys) != len(self.params):
+            raise ValueError(f"ParamGroup: {len(keys)} keys for {len(self.params)} params")
+        self.keys = None if keys is None else list(keys)
+        if device is None:
+            devices = {param.device for param in self.params}
+            device = devices.pop() if len(devices) == 1 else None
+        self.device = device
+        for param in self.params:
+            if param.group is not None:
+                raise ValueError(f"{param.label} is already in a ParamGroup")
+            param.group = self
+            if param.getter is None:
+                param.getter = self._member_getter(param)
+
+    @property
+    def label(self):
+        return '+'.join(param.label for param in self.params)
+
+    def _member_getter(self, param):
+        def getter():
+            self.meas([param])
+            return param.pv
+        return getter
+
+    def key(self, param):
+        return self.keys[next(i for i, p in enumerate(self.params) if p is param)]
+
+    def subset(self, params):
+        """The measurement of params (members of the group), see GroupMeasurement."""
+        return GroupMeasurement(self, params)
+
+    def meas(self, params = None):
+        """
+        Query params (default all) and set their pv, without keys all
+        params are measured.
+        """
+        if params is None or self.keys is None:
+            params = self.params
+        t0 = time.perf_counter()
+        if self.keys is None:
+            values = self.getter()
+            n_expected = len(self.params)
+        else:
+            keys = list(dict.fromkeys(self.key(param) for param in params))
+            values = self.getter(keys)
+            n_expected = len(keys)
+            by_key = dict(zip(keys, values))
+        t = (time.perf_counter() - t0) / len(params)
+        if len(values) != n_expected:
+            raise ValueError(f"ParamGroup {self.label}: getter returned {len(values)} values "
+                             f"for {n_expected} {'params' if self.keys is None else 'keys'}")
+        if self.keys is not None:
+            values = [by_key[self.key(param)] for param in params]
+        for param, value in zip(params, values):
+            param.pv = value
+            param._add_call_time('get', t)
+
+class GroupMeasurement(object):
+    """The params of a ParamGroup that meas_scan measures, in one query."""
+    def __init__(self, group, params):
+        self.group = group
+        self.params = list(params)
+
+    @property
+    def device(self):
+        return self.group.device
+
+    @property
+    def label(self):
+        return '+'.join(param.label for param in self.params)
+
+    def meas(self):
+        self.group.meas(self.params)
+
+def measurement_units(meas_params):
+    """
+    What has to be measured for meas_params: every ParamGroup once (a
+    GroupMeasurement of its params in meas_params), in place of its first
+    param in meas_params, and the params that are not in a group.
+    """
+    units = []
+    for param in meas_params:
+        if param.group is None:
+            units.append(param)
+        elif not any(getattr(unit, 'group', None) is param.group for unit in units):
+            units.append(param.group.subset([p for p in meas_params if p.group is param.group]))
+    return units
+
+def init_ncfile(filename, sweep_params, meas_params, measured_data):
+    with NetCDF4Backend(filename, 'w') as backend:
+        create_variables(backend, sweep_params, meas_params)
+        # Measured values are written line by line in save_to_disk
 
 def save_to_disk(filename, meas_params, sweep_lens, measured_data, save_index):
-    with nc4.Dataset(filename, 'r+', clobber = True) as ncfile:
-        md = ncfile.groups['main_data'] 
-        index = np.unravel_index(save_index, sweep_lens)
-        for imeas_param, meas_param in enumerate(meas_params):
-            param_label = meas_param.label
-            new_data = measured_data[imeas_param]
-          
-            old_data = md[param_label][:]
-            old_data[index] = new_data
-            md[param_label][:] = old_data
+    with NetCDF4Backend(filename, 'r+') as backend:
+        write_line(backend, meas_params, sweep_lens, measured_data, save_index)
 
 Dummy = Param(
     label = 'Dummy', 
@@ -136,6 +268,58 @@ Dummy = Param(
     )
 
 
+class DeviceMeasurement(object):
+    """
+    Measures params that are tagged with different devices concurrently.
+    
+    ParamGroups are measured as one param (see measurement_units) and
+    take the device of the group. Params of the same device are measured one after the other, in the 
+    order of meas_params, with wait_btw_measurements in between. Every 
+    device has its own worker thread, so an instrument is always accessed
+    from the same thread. Untagged params are measured afterwards in the 
+    calling thread (with wait_btw_measurements after each, as before), so 
+    they can use values of the tagged params (e.g. a sum over Spec.pv).
+    Exceptions of a getter are raised by meas().
+    """
+    def __init__(self, meas_params, wait_btw_measurements = 0):
+        self.wait = wait_btw_measurements
+        groups = {}
+        self.untagged = []
+        for unit in measurement_units(meas_params):
+            if getattr(unit, 'device', None) is None:
+                self.untagged.append(unit)
+            else:
+                groups.setdefault(unit.device, []).append(unit)
+        self.groups = list(groups.values())
+        self._workers = [ThreadPoolExecutor(max_workers = 1, thread_name_prefix = f'meas_{device}')
+                         for device in groups]
+
+    def _measure_group(self, group):
+        for i, param in enumerate(group):
+            if i > 0:
+                time.sleep(self.wait)
+            param.meas()
+
+    def meas(self):
+        futures = [worker.submit(self._measure_group, group)
+                   for worker, group in zip(self._workers, self.groups)]
+        for future in futures:
+            future.result()
+        for param in self.untagged:
+            param.meas()
+            time.sleep(self.wait)
+
+    def close(self):
+        for worker in self._workers:
+            worker.shutdown(wait = True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def make_default_params():
     time0 = time.time()
     Time = Param("Time (s)", long_name = "Time since the start of the experiment (seconds)",
@@ -144,17 +328,46 @@ def make_default_params():
     return [Time]
 
 
+def set_constants(constant_params, const_wait_time):
+    """Set constant parameters to their starting value and wait."""
+    if constant_params is not None:
+        print("Setting constants.")
+        for par, val in constant_params:
+            par.constant(val) 
+            if hasattr(par, 'units'): 
+                print (f"{par.label} set to constant: {val} {par.units}")
+            else:   
+                print (f"{par.label} set to constant: {val}")
+                
+    print("Wait after setting constants")
+    time.sleep(const_wait_time)
+    print("Constants set to starting value")
+
+def make_measname(sweep_params, constant_params, file_comment):
+    """Suffix of the run directory from the sweep ranges and constants."""
+    measname = ''
+    for sweep_dim, scan_range in sweep_params:
+        measname = measname + f"_scan{sweep_dim.label}_{scan_range[0]}_{scan_range[-1]}"
+    if constant_params:
+        for const_var, const_val in constant_params:
+            measname = measname + f"_{const_var.label}_{const_val}"
+#     print('measname: %s'%measname)
+    measname = measname + f"_{file_comment}"
+    return measname
+
+
+def param_axis_label(param):
+    if hasattr(param, 'units'):
+        return f"{param.label} ({param.units})"
+    return param.label
+
 class ParamPlot(PlotWindow):
     def __init__(self, plot_label: str, x_param : Param, y_param : Param):
         self.title = f"{y_param.label} vs. {x_param.label}"
         self.plot_label = plot_label
         
-        self.xlabel = x_param.label
-        if hasattr(x_param, 'units'):
-            self.xlabel += f" ({x_param.units})"
-        self.ylabel = y_param.label
-        if hasattr(y_param, 'units'):
-            self.ylabel += f" ({y_param.units})"
+        self.xlabel = param_axis_label(x_param)
+        self.ylabel = param_axis_label(y_param)
 
         super().__init__(self.title, self.xlabel, self.ylabel)
 
@@ -166,11 +379,114 @@ class ParamPlot(PlotWindow):
         super().update_xy(self.x_getter(), self.y_getter())
         # super().update_plot()
 
-def proc_live_plots(mp, param_plot_specifiers):
-    mp.initialize()
-    for plot_label, x_param, y_param in param_plot_specifiers:
-        mp.add_plot(plot_label, ParamPlot(plot_label, x_param, y_param))
-    mp.main_loop()
+def release_both(release_a, release_b):
+    """One release function for two sets of line buffers (see LineBuffers.swap)."""
+    def release():
+        release_a()
+        release_b()
+    return release
+
+class LivePlots(object):
+    """
+    The plots of one scan in the live plot process (live_plot_process).
+        (label, x_param, y_param)             y vs x
+        (label, (row_param, col_param), param) image of param over the values
+                                              of two sweep params (2D map)
+        (label, (row_param,), Spec)           waterfall, the spectrum (frames
+                                              averaged) of every point in the
+                                              row of the value of row_param
+    Images are written in place at every point, the record of the point
+    also holds the index of every sweep param so that the plot process
+    only recolors the new pixels.
+    """
+    def __init__(self, title, param_plot_specifiers, sweep_params):
+        self.plotter = live_plot_process()
+        self.params = []
+        self.sweep_params = [param for param, _ in sweep_params]
+        self.sweep_values = [values for _, values in sweep_params]
+        plots = []
+        self.images = []
+        for label, x, y in param_plot_specifiers:
+            if isinstance(x, tuple):
+                axes = [self._sweep_axis(param) for param in x]
+                if len(axes) not in (1, 2):
+                    raise ValueError(f"Plot {label}: give one (waterfall) or two sweep params (image), not {len(axes)}")
+                self.images.append(dict(label = label, param = y, row = axes[0],
+                                        col = axes[1] if len(axes) == 2 else None, array = None))
+            else:
+                plots.append((label, self._channel(x), self._channel(y)))
+        self.n_values = len(self.params)
+        channels = [param_axis_label(param) for param in self.params] + [f"index of {param.label}" for param in self.sweep_params]
+        self.plotter.start_scan(title, channels, plots)
+        for image in self.images:
+            if image['col'] is not None:
+                self._add_image(image, len(self.sweep_values[image['col']]))
+    
+    def _channel(self, param):
+        for i, p in enumerate(self.params):
+            if p is param:
+                return i
+        self.params.append(param)
+        return len(self.params) - 1
+    
+    def _sweep_axis(self, param):
+        for i, p in enumerate(self.sweep_params):
+            if p is param:
+                return i
+        raise ValueError(f"{param.label} is not a sweep param, images are plotted over sweep params")
+    
+    @staticmethod
+    def _extent(values):
+        """Start and size of the axis of the pixels centered on (evenly spaced) values."""
+        step = (values[-1] - values[0]) / (len(values) - 1) if len(values) > 1 else 1.
+        return values[0] - step / 2, step * len(values)
+    
+    def _add_image(self, image, n_cols):
+        row, col = image['row'], image['col']
+        y, height = self._extent(self.sweep_values[row])
+        if col is None:
+            x, width = -0.5, n_cols
+            xlabel = 'pixel'
+        else:
+            x, width = self._extent(self.sweep_values[col])
+            xlabel = param_axis_label(self.sweep_params[col])
+        image['array'] = self.plotter.add_image(
+            image['label'], (len(self.sweep_values[row]), n_cols), xlabel, param_axis_label(self.sweep_params[row]),
+            (x, y, width, height), self.n_values + row, None if col is None else self.n_values + col)
+        if image['array'] is None:
+            image['param'] = None
+    
+    def _write(self, image, indices):
+        if image['col'] is not None:
+            image['array'].data[indices[image['row']], indices[image['col']]] = plot_value(image['param'].pv)
+            return
+        spectrum = waterfall_row(image['param'].pv)
+        if image['array'] is None:
+            self._add_image(image, spectrum.size)
+            if image['array'] is None:
+                return
+        image['array'].data[indices[image['row']]] = spectrum
+    
+    def publish(self, indices):
+        """Plot the point at indices (index of every sweep param)."""
+        for image in self.images:
+            if image['param'] is None:
+                continue
+            try:
+                self._write(image, indices)
+            except Exception as e:
+                print(f"Plot {image['label']} stopped: {e}")
+                image['param'] = None
+        self.plotter.publish([plot_value(param.pv) for param in self.params] + list(indices))
+    
+    def end(self):
+        self.plotter.end_scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end()
 
 
 def meas_scan(sweep_params, constant_params = None, meas_params = None, 
@@ -181,6 +497,16 @@ def meas_scan(sweep_params, constant_params = None, meas_params = None,
               script_path = __file__,
               param_plot_specifiers = None,
               remote_path = None,
+              sync_policy = 'line',
+              async_write = True,
+              write_queue_size = 4,
+              storage_backend = 'netcdf4',
+              compression = None,
+              resume = None,
+              hw_timed_lines = True,
+              sweep_order = 'sawtooth',
+              dry_run = False,
+              diagnostics = True,
               ):
     """
 
@@ -228,123 +554,459 @@ def meas_scan(sweep_params, constant_params = None, meas_params = None,
         Give a list of 3-tuples that specify parameters to be plotted.
         For each tuple (label, Param1, Param2), a plot is generated with 
         Param1 on x axis and Param2 on y axis.
-        For addional info on plotting algorithm check live_plot.py
+        (label, (Param1, Param2), Param3) plots Param3 as an image over
+        the values of the sweep params Param1 (y) and Param2 (x), 
+        (label, (Param1,), Spec) a waterfall of the spectra vs. the values
+        of the sweep param Param1 (see LivePlots).
+        The plots run in a separate process that is fed through shared
+        memory and reused by the next scan (see live_plot_process), the
+        scan never waits for it and continues if it fails.
+    remote_path : string, optional
+        If given, the data and the script are copied there after the scan.
+    sync_policy : 'line', 'exit' or float, optional
+        When the open data file is flushed to disk: after every line, 
+        only at the end of the scan, or at most every sync_policy seconds.
+        The default is 'line'.
+    async_write : bool, optional
+        Write completed lines on a background thread so that acquisition
+        continues while the previous line is compressed and written.
+        The default is True.
+    write_queue_size : int, optional
+        Number of completed lines that can wait for the writer thread before
+        the scan blocks. The default is 4.
+    storage_backend : 'netcdf4', 'zarr' or 'hdf5', optional
+        File format of the data, see zq_storage. The default is 'netcdf4'.
+    compression : dict, optional
+        Compressor and level per measured variable, e.g.
+        {'Spec': dict(compressor = 'zstd', level = 3, shuffle = True)}.
+        The default of each backend is used for unlisted variables.
+    resume : string, optional
+        Run directory of an interrupted scan with the same sweep. Its data
+        file is reopened, the constants are set again and the scan continues
+        at the first line that is not in the journal (Measdata.journal).
+        The storage backend is taken from the existing file.
+    hw_timed_lines : bool, optional
+        If the fast sweep param is a DAQ analog output and all measured
+        params are counters / analog inputs of the same DAQ card (see
+        zq_line_compiler), every line is run as one hardware timed
+        acquisition. The fast param is set to the first value of the line
+        with its setter, then wait_before and the whole line follow.
+        wait_after and wait_btw_measurements do not apply, the time per
+        point is the dwell of the input params. The default is True.
+    
+    sweep_order : 'sawtooth' or 'snake', optional
+        'sawtooth' runs every line of the fast (last) sweep param in the
+        same direction. 'snake' reverses the fast axis on every other line
+        so there is no flyback between lines. The data is stored in the 
+        same layout for both, the direction of every line is stored in the
+        sweep_direction variable. The default is 'sawtooth'.
+    
+    Sweep params with a settle policy (Param(..., settle = ...), see 
+    zq_settle) are settled after every point at which they changed, on top
+    of wait_before. With settle policies wait_before can usually be 0.
+    
+    If some meas_params are tagged with a device (Param(..., device = 'hp')),
+    params of different devices are measured concurrently and 
+    wait_btw_measurements is only applied between params of the same 
+    device, see DeviceMeasurement.
+    
+    meas_params with readback = 'setpoint' or N (see zq_readback) return
+    the value they were set to instead of calling the getter (except every
+    N-th point). Functions decorated with point_cached (e.g. a getter 
+    shared by two params) are called once per point for the same 
+    arguments.
+    
+    meas_params that belong to a ParamGroup (e.g. SR830 X / Y / R from one
+    snapshot) are measured by one call of the group getter per point, 
+    wait_btw_measurements applies once per group.
+    
+    dry_run : bool, optional
+        Do not touch any instrument and do not create a data file, only
+        print how long the scan takes and how much data it produces (see
+        zq_estimate). Ramps are modelled from Param(..., ramp = ...), 
+        getter times from the earlier scans recorded in 
+        getter_latency.json in measdatapath, values of meas params that
+        were never measured count as float64. The default is False.
+    diagnostics : bool, optional
+        Time every setter, settle, sleep, getter, plot update and line save
+        of every point and store the times in the diagnostics group of the
+        data file (see zq_diagnostics). A table with mean, 95th percentile
+        and max per phase is printed at the end. The default is True.
+    
+    iter_scan runs the same scan as a generator of point and line records
+    for online analysis.
 
     Returns
     -------
-    None.
+    dict
+        filename of the data, n_points measured, elapsed time (s) of the
+        scan loop, the writer stats (None without async_write) and the 
+        timing summary per phase (None without diagnostics). 
+        With dry_run the estimate, see zq_estimate.estimate_scan.
 
     """    
 
+    # The scan runs in the generator of iter_scan, without records
+    scan = iter_scan(**locals(), points = False, lines = False)
+    for _ in scan:
+        pass
+    return scan.result
+
+
+class ScanStream(object):
+    """
+    Iterator over the records of a scan (see iter_scan). result is the 
+    return value of meas_scan once the iterator is exhausted. Closing it
+    (or leaving the with block, or breaking out of a for loop and deleting
+    it) stops the scan, the lines measured so far are on disk.
+    """
+    def __init__(self, generator):
+        self._generator = generator
+        self.result = None
+        self.done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._generator)
+        except StopIteration as e:
+            self.result = e.value
+            self.done = True
+            raise
+
+    def close(self):
+        self._generator.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Records of iter_scan
+ScanPoint = namedtuple('ScanPoint', ['sweep_index', 'indices', 'setpoints', 'values', 'time'])
+ScanLine = namedtuple('ScanLine', ['line_index', 'sweep_indices', 'data', 'direction', 'time'])
+
+def iter_scan(*args, points = True, lines = True, **kwargs):
+    """
+    meas_scan as a generator of records, the data is still written to disk
+    like in meas_scan (same arguments). With points, every measured point
+    yields a ScanPoint
+        sweep_index   index in the sweep plan (as in the data file)
+        indices       index of the value of every sweep param
+        setpoints     value of every sweep param
+        values        {label: value} of every meas param
+        time          time.time() at the end of the point
+    and with lines, every completed line yields a ScanLine (after its point)
+        line_index    index of the line
+        sweep_indices sweep_index of every point in the line
+        data          {label: line array} of every meas param, in the order
+                      of the fast sweep values (also for snake scans)
+        direction     1 or -1 (see sweep_order)
+        time          time.time() when the line was handed to the writer
+    values and data are the line buffers of meas_scan (values of array
+    params are views), they are only valid until the next record is 
+    requested, copy what has to be kept.
+    
+        with iter_scan(sweep_params, meas_params = [c_APD], ...) as scan:
+            for record in scan:
+                if isinstance(record, ScanLine):
+                    print(record.data['Counts'].max())
+        scan.result
+    
+    Returns a ScanStream.
+    """
+    return ScanStream(_scan(*args, points = points, lines = lines, **kwargs))
+
+
+def _scan(sweep_params, constant_params = None, meas_params = None, 
+          file_comment = '', measdatapath = '',
+          const_wait_time = 1, wait_before = 0.05, wait_after = 0.05,
+          wait_scan_line = 1,
+          wait_btw_measurements = 0.01,
+          script_path = __file__,
+          param_plot_specifiers = None,
+          remote_path = None,
+          sync_policy = 'line',
+          async_write = True,
+          write_queue_size = 4,
+          storage_backend = 'netcdf4',
+          compression = None,
+          resume = None,
+          hw_timed_lines = True,
+          sweep_order = 'sawtooth',
+          dry_run = False,
+          diagnostics = True,
+          points = True,
+          lines = True,
+          ):
+    """Scan engine of meas_scan and iter_scan."""
+
     if sweep_params is None:
         sweep_params = [(Dummy, [0,1])]
     else:
         sweep_dim = len(sweep_params)
+    line_direction(0, sweep_order) # check sweep_order before anything is set
     
-    # Set constant parameters to their starting value
-    if constant_params is not None:
-        print("Setting constants.")
-        for par, val in constant_params:
-            par.constant(val) 
-            if hasattr(par, 'units'): 
-                print (f"{par.label} set to constant: {val} {par.units}")
-            else:   
-                print (f"{par.label} set to constant: {val}")
-                
-    print("Wait after setting constants")
-    time.sleep(const_wait_time)
-    print("Constants set to starting value")
+    if dry_run:
+        default_params = make_default_params()
+        start_line = 0
+        if resume is not None:
+            n_lines = int(np.prod([len(sweep_param[1]) for sweep_param in sweep_params[:-1]]))
+            try:
+                start_line = LineJournal(journal_filename(find_datafile(resume)[0])).first_incomplete(n_lines)
+            except FileNotFoundError:
+                pass
+        estimate = estimate_scan(
+            sweep_params, meas_params + default_params, LatencyHistory(latency_filename(measdatapath)),
+            compiled_line = compile_line(sweep_params, meas_params + default_params, 
+                                         clock_params = default_params) if hw_timed_lines else None,
+            const_wait_time = const_wait_time if constant_params is not None else 0,
+            wait_before = wait_before, wait_after = wait_after, wait_scan_line = wait_scan_line,
+            wait_btw_measurements = wait_btw_measurements, sweep_order = sweep_order,
+            line_buffers = write_queue_size + 2 if async_write else 1, start_line = start_line)
+        print_estimate(estimate)
+        return estimate
+    
+    set_constants(constant_params, const_wait_time)
 
     default_params = make_default_params()
     meas_params.extend(default_params)
     
-    measname = ''
-    for sweep_dim, scan_range in sweep_params:
-        measname = measname + f"_scan{sweep_dim.label}_{scan_range[0]}_{scan_range[-1]}"
-    if constant_params:
-        for const_var, const_val in constant_params:
-            measname = measname + f"_{const_var.label}_{const_val}"
-#     print('measname: %s'%measname)
-    measname = measname + f"_{file_comment}"
-    filedir = generate_filedir(suffix = measname, base_dir = measdatapath)
-    filename = os.path.join(filedir, "Measdata.nc")
-
-    # Copy the running script to where data will be stored
-    shutil.copyfile(script_path, os.path.join(filedir, "Experiment.py"))
+    measname = make_measname(sweep_params, constant_params, file_comment)
+    if resume is None:
+        filedir = generate_filedir(suffix = measname, base_dir = measdatapath)
+        filename = os.path.join(filedir, "Measdata" + get_backend(storage_backend).extension)
+        # Copy the running script to where data will be stored
+        shutil.copyfile(script_path, os.path.join(filedir, "Experiment.py"))
+    else:
+        filedir = resume
+        # Lines that are on disk are recorded in the journal, the scan
+        # continues at the first line that is missing
+        n_lines = int(np.prod([len(sweep_param[1]) for sweep_param in sweep_params[:-1]]))
+        try:
+            filename, storage_backend = find_datafile(filedir)
+            start_line = LineJournal(journal_filename(filename)).first_incomplete(n_lines)
+        except FileNotFoundError: # interrupted before the first point
+            filename = os.path.join(filedir, "Measdata" + get_backend(storage_backend).extension)
+            start_line = 0
+        if start_line == n_lines:
+            print(f"All {n_lines} lines of {filename} are complete, nothing to resume.")
+            return
+        if start_line == 0:
+            print(f"No line of {filename} is complete, starting it over")
+        else:
+            print(f"Resuming {filename} at line {start_line} of {n_lines}")
+    # Nothing to keep of an interrupted first line, the file is created anew
+    fresh = resume is None or start_line == 0
     
-    tQt = None
-    mp = None
     # Create param plots if any
     HAS_PLOTS = param_plot_specifiers is not None
     if HAS_PLOTS:
         # redefine time string to time parameter
         param_plot_specifiers = [ (label, default_params[0], p2) if p1 == 'Time' or p1 == 'time' 
                                  else (label,p1,p2) for label, p1, p2 in param_plot_specifiers]
-        
-        mp = MultiPlotter()
-        try:
-            tQt = threading.Thread(target=proc_live_plots, args=([mp, param_plot_specifiers]), daemon = True)
-            tQt.start()
-        except e:
-            print(f"Plotter thread failed: \n{e}")
-        time.sleep(1)
 
     # Create necessary variables to loop over the sweep parameters
     sweep_lens = [len(sweep_param[1]) for sweep_param in sweep_params]
     total_len = np.prod(sweep_lens) # total length of sweep
     param_ctr = np.array(total_len/np.cumprod(sweep_lens),dtype = int) # counter that shows index at which each parameter should be changed
+    start_index = 0 if resume is None else start_line * sweep_lens[-1]
+    start_line = start_index // sweep_lens[-1]
+    
+    compiled_line = compile_line(sweep_params, meas_params, clock_params = default_params) if hw_timed_lines else None
+    if compiled_line is not None:
+        print(f"Hardware timed lines: {compiled_line}")
+    
+    # Typed line buffers, one set is filled while the writer thread
+    # consumes the others (queued lines + the one being written)
+    buffers = LineBuffers(len(meas_params), sweep_lens[-1],
+                          n_buffers = write_queue_size + 2 if async_write else 1,
+                          dtypes = [param.dtype for param in meas_params])
+    # Phase times of every point, handed to the writer with the line
+    n_lines = total_len // sweep_lens[-1]
+    timer = ScanTimer(sweep_params, meas_params, sweep_lens[-1], n_lines,
+                      n_buffers = buffers.n_buffers, enabled = diagnostics)
     
-    measured_data = []
+    # The data file stays open for the whole scan and is closed on any
+    # exception (incl. KeyboardInterrupt). Completed lines are written by
+    # a background thread unless async_write is False.
+    meas_units = measurement_units(meas_params)
+    concurrent_meas = any(getattr(unit, 'device', None) is not None for unit in meas_units)
     
-    # print(f"Sweep lens =  {sweep_lens}")    
-    for sweep_index in tqdm(range(total_len)):
-    # for sweep_index in (range(total_len)):
-        # Set the sweep parameters to their next value using some algebra for indices
-        for param_index, param_ct in enumerate(param_ctr):
-            if sweep_index%param_ct == 0:
-                sweep_params[param_index][0].setter(sweep_params[param_index][1][sweep_index//param_ct % sweep_lens[param_index]])
+    for param in [sweep_param[0] for sweep_param in sweep_params] + meas_params:
+        param.reset_call_times()
+    
+    stats = None
+    timing = None
+    t_scan = time.monotonic()
+    # The plots end also when the scan fails, they stay open until the next scan
+    with (LivePlots(os.path.basename(filedir), param_plot_specifiers, sweep_params)
+          if HAS_PLOTS else nullcontext()) as live_plots, \
+         StorageSession(filename, sync = sync_policy, backend = storage_backend,
+                        compression = compression, journal = journal_filename(filename)) as session, \
+         (AsyncLineWriter(session, maxsize = write_queue_size) if async_write else nullcontext(session)) as writer, \
+         (DeviceMeasurement(meas_params, wait_btw_measurements) if concurrent_meas else nullcontext()) as device_meas, \
+         point_cache:
+        if not fresh:
+            resume_count = session.reopen(sweep_params, start_line, sweep_order)
+            shutil.copyfile(script_path, os.path.join(filedir, f"Experiment_resume_{resume_count}.py"))
+            if timer.enabled and not session.has_diagnostics():
+                print("No diagnostics group in the resumed file, phase times are not recorded")
+                timer.enabled = False
+        # print(f"Sweep lens =  {sweep_lens}")    
+        for sweep_index in tqdm(range(start_index, total_len), initial = start_index, total = total_len):
+        # for sweep_index in (range(total_len)):
+            # Set the sweep parameters to their next value using some algebra for indices
+            # (all of them at the first point of a resumed scan, the fast
+            # param of a hardware timed line only at the start of the line)
+            # fast_pos is the index of the fast param value (and the position
+            # in the stored line), it runs backwards in odd lines of a snake
+            fast_pos = fast_axis_position(sweep_index, sweep_lens[-1], sweep_order)
+            line_index = sweep_index // sweep_lens[-1]
+            timer.start_point()
+            # getters run uncached while setting and settling (readback
+            # settles poll them), the point's cache starts after
+            with point_cache.paused():
+                changed = []
+                for param_index, param_ct in enumerate(param_ctr):
+                    if compiled_line is not None and param_index == len(param_ctr) - 1 and sweep_index % sweep_lens[-1] != 0:
+                        continue
+                    if sweep_index%param_ct == 0 or sweep_index == start_index:
+                        value_index = sweep_index//param_ct % sweep_lens[param_index]
+                        if param_index == len(param_ctr) - 1:
+                            value_index = fast_pos
+                        param = sweep_params[param_index][0]
+                        old_value = param.pv
+                        param.setter(sweep_params[param_index][1][value_index])
+                        timer.set(f'set_{param.label}', param.last_time['set'])
+                        changed.append((param, old_value, sweep_params[param_index][1][value_index]))
+                timer.set('settle', settle_params(changed))
+            point_cache.new_point()
         
-        time.sleep(wait_before)
-        # Store the value of measured parameters in memory
-        for i_param, param in enumerate(meas_params):
-            param.meas()
-            if sweep_index == 0:
-                measured_data.append(np.empty((sweep_lens[-1],) + np.array(param.pv).shape))
-            measured_data[i_param][sweep_index % sweep_lens[-1]] = param.pv
-            time.sleep(wait_btw_measurements)
-        time.sleep(wait_after)
+            if compiled_line is None:
+                timer.sleep(wait_before)
+                # Store the value of measured parameters in memory
+                if concurrent_meas:
+                    device_meas.meas()
+                else:
+                    for unit in meas_units:
+                        unit.meas()
+                        timer.sleep(wait_btw_measurements)
+                for i_param, param in enumerate(meas_params):
+                    buffers.store(i_param, fast_pos, param.pv)
+                    timer.set(f'get_{param.label}', param.last_time['get'])
+                timer.sleep(wait_after)
+            else:
+                # The whole line is measured at its first point (the fast
+                # param was just set to its first value), the other points
+                # only take their values from line_data
+                if sweep_index % sweep_lens[-1] == 0:
+                    timer.sleep(wait_before)
+                    direction = line_direction(line_index, sweep_order)
+                    t0 = time.perf_counter()
+                    line_data = compiled_line.run(sweep_params[-1][1][::direction])
+                    timer.line('line_acquire', line_index, time.perf_counter() - t0)
+                    line_data = [data[::direction] for data in line_data]
+                sweep_params[-1][0].pv = sweep_params[-1][1][fast_pos]
+                for i_param, param in enumerate(meas_params):
+                    param.pv = line_data[i_param][fast_pos]
+                    buffers.store(i_param, fast_pos, param.pv)
         
-        # Plot data if necessary
-        if HAS_PLOTS:
-            try:
-                for param_plot in mp._plot_windows.values():
-                    param_plot.update_xy()
-            except:
-                return -1
+            point_indices = tuple(int(i) for i in np.unravel_index(sweep_index, sweep_lens)[:-1]) + (int(fast_pos),)
+            # Plot data if necessary
+            if HAS_PLOTS:
+                t0 = time.perf_counter()
+                live_plots.publish(point_indices)
+                timer.set('plot', time.perf_counter() - t0)
+            timer.end_point(fast_pos)
+            if points:
+                record = ScanPoint(
+                    sweep_index, 
+                    point_indices,
+                    tuple(param.pv for param, _ in sweep_params),
+                    {param.label: buffers.current[i_param][fast_pos] for i_param, param in enumerate(meas_params)},
+                    time.time())
             
-        # I initialize the data file here so we know the dataype of the 
-        # measured variables.
-        if sweep_index == 0:
-            init_ncfile(filename, sweep_params,meas_params,measured_data)
-        # Line end opreations
-        elif (sweep_index+1) % sweep_lens[-1] == 0:
-            time.sleep(wait_scan_line)
-            # Save data after each line
-            last_line_idx = np.arange((sweep_index+1) - sweep_lens[-1], (sweep_index+1))
-            save_to_disk(filename, meas_params, sweep_lens, measured_data, last_line_idx)
+            # I initialize the data file here so we know the dataype of the 
+            # measured variables.
+            if sweep_index == 0 and fresh:
+                session.create(sweep_params, meas_params, sweep_order,
+                               diagnostics = timer.names if timer.enabled else None)
+            # Line end opreations
+            if (sweep_index+1) % sweep_lens[-1] == 0:
+                t0 = time.perf_counter()
+                time.sleep(wait_scan_line)
+                timer.line('line_sleep', line_index, time.perf_counter() - t0)
+                # Save data after each line
+                t0 = time.perf_counter()
+                last_line_idx = np.arange((sweep_index+1) - sweep_lens[-1], (sweep_index+1))
+                filled, release = buffers.swap()
+                point_times, release_times = timer.swap()
+                if release_times is not None:
+                    release = release_both(release, release_times)
+                writer.write_line(meas_params, sweep_lens, filled, last_line_idx, release = release,
+                                  diagnostics = point_times)
+                timer.line('line_save', line_index, time.perf_counter() - t0)
+                if points:
+                    yield record
+                if lines:
+                    yield ScanLine(line_index, last_line_idx, 
+                                   {param.label: data for param, data in zip(meas_params, filled)},
+                                   line_direction(line_index, sweep_order), time.time())
+            elif points:
+                yield record
 
-    if HAS_PLOTS:
-        # print("Closing plots")
-        mp.close()
+        # Everything has to be on disk before plots block and data is copied
+        writer.drain()
+        t_scan = time.monotonic() - t_scan
+        if point_cache.hits:
+            print(f"Point cache: {point_cache.hits} of {point_cache.hits + point_cache.misses} queries reused")
+        if async_write:
+            stats = writer.stats()
+            print("Writer: {lines_written} lines, max queue depth {max_queue_depth}, "
+                  "mean write {mean_write_time:.3f} s, max latency {max_latency:.3f} s, "
+                  "blocked {blocked_time:.3f} s".format(**stats))
+        
+        if timer.enabled:
+            # write_times of the writer thread are in line order, the
+            # synchronous writer writes during line_save
+            line_write = (np.array(writer.write_times) if async_write
+                          else timer.lines['line_save'][start_line:])
+            timer.lines['line_write'][start_line:start_line + len(line_write)] = line_write
+            for name in timer.line_names:
+                session.write_diagnostics(name, slice(start_line, None), timer.lines[name][start_line:])
+            session.sync()
+            times = {name: session.read_diagnostics(name).ravel()[start_index:] for name in timer.point_names}
+            times.update({name: timer.lines[name][start_line:] for name in timer.line_names})
+            timing = timing_summary(times)
+            print_timing_summary(timing, elapsed = t_scan)
+
+    # Getter / setter times for the dry runs of later scans
+    try:
+        history = LatencyHistory(latency_filename(measdatapath))
+        history.record([sweep_param[0] for sweep_param in sweep_params] + meas_params)
+        history.save()
+    except OSError as e:
+        print(f"Could not save the getter latencies: {e}")
     
     if remote_path is not None:
         remote_filedir = generate_filedir(suffix = measname, base_dir = remote_path)
-        remote_filename = os.path.join(remote_filedir, "Measdata.nc")
+        remote_filename = os.path.join(remote_filedir, os.path.basename(filename))
         try:
             shutil.copyfile(os.path.join(filedir, "Experiment.py"), os.path.join(remote_filedir, "Experiment.py"))
-            shutil.copyfile(filename, remote_filename)
+            if os.path.isdir(filename): # Zarr directory store
+                shutil.copytree(filename, remote_filename)
+            else:
+                shutil.copyfile(filename, remote_filename)
         except:
             print("COULD NOT UPLOAD TO REMOTE!")    
+    
+    return dict(filename = filename, n_points = int(total_len - start_index),
+                elapsed = t_scan, writer = stats, timing = timing)
 
 if __name__ == "__main__":
     
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 07:54:52 2026
+
+@author: zerui
+
+Hardware timed scan lines on a NIDAQ card.
+
+Params that live on the DAQ card are described by attaching hw to them:
+
+    SCx = Param("ScannerX", units = 'V', ..., hw = DAQ_AO(daq, 'ao1', scale = 1/15))
+    c_APD = Param("Counts", ..., hw = DAQ_Counter(daq, 'ctr2', dwell = 0.05))
+
+If the fast (last) sweep param of meas_scan is a DAQ_AO and every measured
+param is a DAQ_Counter or DAQ_AI of the same card, compile_line returns a
+CompiledLine that runs a whole scan line as one buffered AO waveform,
+clocked together with the counter / AI reads (NIDAQ.set_ao_measure), i.e.
+a single call to the card per line instead of a setter, a sleep and a
+finite task per point.
+"""
+
+import numpy as np
+
+
+class DAQ_AO(object):
+    """
+    Analog output channel of a NIDAQ. The param value is volts / scale,
+    e.g. scale = 1/15 for the scanner that is set with daq.set_ao1(val/15).
+    settle is the time in s every point is held before acquisition starts.
+    """
+    def __init__(self, daq, channel, scale = 1., settle = 0., ao_range = 10):
+        self.daq = daq
+        self.channel = channel
+        self.scale = scale
+        self.settle = settle
+        self.ao_range = ao_range
+
+    def volts(self, values):
+        return np.asarray(values, dtype = float) * self.scale
+
+
+class DAQ_Input(object):
+    """Common part of the inputs: acquisition time per point and clock."""
+    def __init__(self, daq, channel, dwell = 0.05, sampling_rate = 3e4, scale = 1.):
+        self.daq = daq
+        self.channel = channel
+        self.dwell = dwell
+        self.sampling_rate = sampling_rate
+        self.scale = scale
+
+
+class DAQ_Counter(DAQ_Input):
+    """
+    Edge counter of a NIDAQ. With rate = True the value is counts per
+    second (like get_one_ctrate), otherwise the counts per point.
+    """
+    def __init__(self, daq, channel, dwell = 0.05, sampling_rate = 3e4, scale = 1., rate = True):
+        super().__init__(daq, channel, dwell, sampling_rate, scale)
+        self.rate = rate
+
+    def convert(self, counts, acq_time):
+        if self.rate:
+            counts = counts / acq_time
+        return counts * self.scale
+
+
+class DAQ_AI(DAQ_Input):
+    """Analog input of a NIDAQ, the value is the mean voltage * scale."""
+    def __init__(self, daq, channel, dwell = 0.05, sampling_rate = 3e4, scale = 1.,
+                 limit = 10., mode = 'diff'):
+        super().__init__(daq, channel, dwell, sampling_rate, scale)
+        self.limit = limit
+        self.mode = mode
+
+    def convert(self, voltages, acq_time):
+        return voltages * self.scale
+
+
+class CompiledLine(object):
+    """
+    One scan line of sweep_param as a single hardware timed acquisition.
+    All inputs share the AO sample clock, the fastest requested
+    sampling_rate and the longest dwell are used.
+    clock_params (the Time param of meas_scan) are not measured by the card,
+    their value is interpolated between a reading before and after the line.
+    """
+    def __init__(self, sweep_param, meas_params, clock_params = ()):
+        self.sweep_param = sweep_param
+        self.meas_params = meas_params
+        self.clock_params = clock_params
+        self.ao = sweep_param.hw
+        inputs = [param.hw for param in meas_params if param not in clock_params]
+        self.sampling_rate = max(hw.sampling_rate for hw in inputs)
+        self.dwell = max(hw.dwell for hw in inputs)
+        self.settle_samples = int(round(self.ao.settle * self.sampling_rate))
+        self.samples_per_point = max(int(round(self.dwell * self.sampling_rate)), 1) + self.settle_samples
+        self.acq_time = (self.samples_per_point - self.settle_samples) / self.sampling_rate
+
+    def __repr__(self):
+        inputs = ', '.join(p.label for p in self.meas_params if p not in self.clock_params)
+        return "{} -> {} ({} samples per point at {:g} Hz)".format(
+            self.sweep_param.label, inputs, self.samples_per_point, self.sampling_rate)
+
+    def run(self, values):
+        """
+        Sweep the values of the line and return the measured values, one
+        array per meas_param. sweep_param.pv is left at the last value.
+        """
+        inputs = [param.hw for param in self.meas_params if param not in self.clock_params]
+        ctr_channels = [hw.channel for hw in inputs if isinstance(hw, DAQ_Counter)]
+        ai_channels = [hw.channel for hw in inputs if isinstance(hw, DAQ_AI)]
+        ai = [hw for hw in inputs if isinstance(hw, DAQ_AI)]
+        t_start = [param.getter() for param in self.clock_params]
+        data = self.ao.daq.set_ao_measure(
+            self.ao.channel, self.ao.volts(values), self.sampling_rate,
+            samples_per_point = self.samples_per_point,
+            settle_samples = self.settle_samples,
+            ctr_channels = ctr_channels, ai_channels = ai_channels,
+            ao_range = self.ao.ao_range,
+            ai_limit = max([hw.limit for hw in ai], default = 10.),
+            ai_mode = ai[0].mode if ai else 'diff')
+        t_stop = [param.getter() for param in self.clock_params]
+        self.sweep_param.pv = values[-1]
+
+        fraction = (np.arange(len(values)) + 0.5) / len(values)
+        line = []
+        for param in self.meas_params:
+            if param in self.clock_params:
+                i = self.clock_params.index(param)
+                line.append(t_start[i] + fraction * (t_stop[i] - t_start[i]))
+            else:
+                line.append(param.hw.convert(data[param.hw.channel], self.acq_time))
+        return line
+
+
+def compile_line(sweep_params, meas_params, clock_params = ()):
+    """
+    CompiledLine for the fast sweep param and the measured params, or None
+    if they can not run as one hardware timed line.
+    """
+    sweep_param = sweep_params[-1][0]
+    ao = getattr(sweep_param, 'hw', None)
+    if not isinstance(ao, DAQ_AO):
+        return None
+    inputs = [getattr(param, 'hw', None) for param in meas_params if param not in clock_params]
+    if not inputs:
+        return None
+    for hw in inputs:
+        if not isinstance(hw, (DAQ_Counter, DAQ_AI)) or hw.daq is not ao.daq:
+            return None
+    channels = [hw.channel for hw in inputs]
+    if len(set(channels)) != len(channels):
+        return None # the same channel twice
+    ai = [hw for hw in inputs if isinstance(hw, DAQ_AI)]
+    if len(set(hw.mode for hw in ai)) > 1:
+        return None # one AI task has one terminal configuration
+    return CompiledLine(sweep_param, meas_params, list(clock_params))
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:16:07 2026
+
+@author: zerui
+
+Fewer instrument queries per point.
+
+Readback policy of a Param (Param(..., readback = ...)):
+    'always'     the getter is called on every meas() (default)
+    'setpoint'   meas() returns the value the setter set last, the getter
+                 is only called if the param was never set
+    N (int)      like 'setpoint', but every N-th meas() calls the getter
+e.g. the gate voltages of the HP4142B, whose get_voltage is a *LRN?
+round trip that returns the value that was just set.
+
+Params that set the same instrument output name it as their channel
+(Param(..., channel = 'SMU3'), a tuple for a setter of several outputs),
+setting one of them makes the setpoint of the others stale: their next
+meas() calls the getter, whose value is the setpoint from then on. E.g.
+VL and V3 both set SMU3, Vall sets SMU1, 3 and 4.
+
+Point cache: during meas_scan, functions decorated with point_cached are
+called at most once per sweep point for the same arguments, meas_scan
+starts a new point after setting the sweep params and their settle. While
+setting and settling (ReadbackSettle polls the getter) they are not
+cached, nor outside of a scan. E.g. with
+
+    @point_cached
+    def hp_current_getter(SMU): ...
+
+I1 and Itg (both hp_current_getter(hp.SMU1)) query SMU1 once per point.
+Arguments must be hashable, Pyro proxies compare by their URI.
+"""
+
+import weakref
+import threading
+import contextlib
+import collections
+
+READBACK_POLICIES = ('always', 'setpoint')
+
+def check_readback(readback):
+    if readback in READBACK_POLICIES:
+        return readback
+    if isinstance(readback, int) and not isinstance(readback, bool) and readback > 0:
+        return readback
+    raise ValueError(f"readback must be one of {READBACK_POLICIES} or a positive int, not {readback!r}")
+
+def check_channels(channel):
+    """The channels of Param(..., channel = ...) as a tuple."""
+    if channel is None:
+        return ()
+    if isinstance(channel, (tuple, list)):
+        return tuple(channel)
+    return (channel,)
+
+# Params by channel, for invalidate_setpoints
+_channel_params = collections.defaultdict(weakref.WeakSet)
+
+def register_channels(param):
+    for channel in param.channels:
+        _channel_params[channel].add(param)
+
+def invalidate_setpoints(param):
+    """param was set, the setpoints of the other params on its channels are stale."""
+    for channel in param.channels:
+        for other in list(_channel_params[channel]):
+            if other is not param:
+                other._setpoint_stale = True
+
+
+class PointCache(object):
+    """
+    Results of decorated functions within one sweep point, only while
+    active (with point_cache: ...). Calls with the same function and
+    arguments from several threads (DeviceMeasurement) wait for the first
+    one instead of querying again.
+    """
+    def __init__(self):
+        self.active = False
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def new_point(self):
+        with self._lock:
+            self._values = {}
+
+    def __enter__(self):
+        self.new_point()
+        self.reset_stats()
+        self.active = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.active = False
+        self.new_point()
+        self._locks = {}
+
+    @contextlib.contextmanager
+    def paused(self):
+        """Calls within are not cached (e.g. the polls of a settle)."""
+        active = self.active
+        self.active = False
+        try:
+            yield self
+        finally:
+            self.active = active
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def call(self, func, *args, **kwargs):
+        if not self.active:
+            return func(*args, **kwargs)
+        key = (func, args, tuple(sorted(kwargs.items())))
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            values = self._values
+            if key in values:
+                self.hits += 1
+                return values[key]
+            value = func(*args, **kwargs)
+            values[key] = value
+            self.misses += 1
+            return value
+
+    def cached(self, func):
+        """Decorator, see point_cached."""
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.uncached = func
+        return wrapper
+
+# The cache meas_scan clears at every point
+point_cache = PointCache()
+point_cached = point_cache.cached
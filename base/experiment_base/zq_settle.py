@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 08:02:06 2026
+
+@author: zerui
+
+Settle policies of sweep parameters.
+
+A policy is attached to a Param (Param(..., settle = ExpSettle(0.1))) and
+applied by meas_scan after the param was set to a new value, only for the
+params that changed at that point:
+
+    FixedSettle(t)                 wait t seconds
+    StepSettle(per_unit, ...)      wait per_unit * |step| (+ offset, <= max_time)
+    ExpSettle(tau, n_tau = 5)      wait n_tau time constants, e.g. a lock-in
+    ReadbackSettle(tol, timeout)   poll the getter until it is within tol of
+                                   the setpoint (e.g. a magnet or a ramping SMU)
+
+The time based waits of all changed params run in parallel (the longest
+one is waited), readbacks are polled afterwards.
+"""
+
+import time
+import warnings
+import numpy as np
+
+
+class Settle(object):
+    """Base class, delay is the time to wait after a step from old to new."""
+    def delay(self, old, new):
+        return 0.
+
+    def estimate_delay(self, old, new):
+        """delay for the dry run of a scan, without instrument access."""
+        return self.delay(old, new)
+
+    def converge(self, param, target):
+        """Block until param has settled at target (after delay)."""
+        pass
+
+
+class FixedSettle(Settle):
+    def __init__(self, t):
+        self.t = t
+
+    def delay(self, old, new):
+        return self.t
+
+
+class StepSettle(Settle):
+    """
+    Wait proportional to the step: offset + per_unit * |new - old|, at most
+    max_time. The first step (old value unknown) waits max_time.
+    """
+    def __init__(self, per_unit, offset = 0., max_time = np.inf):
+        self.per_unit = per_unit
+        self.offset = offset
+        self.max_time = max_time
+
+    def delay(self, old, new):
+        if old is None:
+            return self.max_time if np.isfinite(self.max_time) else self.offset
+        return min(self.offset + self.per_unit * float(np.abs(new - old)), self.max_time)
+
+
+class ExpSettle(Settle):
+    """
+    Wait n_tau time constants, e.g. 5 tau of a lock-in for 99.3 %. tau can
+    be a function that reads the current time constant from the instrument.
+    The dry run does not call it, it takes tau_estimate or else the tau
+    read last (a callable tau that was never read counts 0 s, with a
+    warning).
+    """
+    def __init__(self, tau, n_tau = 5, tau_estimate = None):
+        self.tau = tau
+        self.n_tau = n_tau
+        self.tau_estimate = tau_estimate
+        self.last_tau = None if callable(tau) else tau
+
+    def delay(self, old, new):
+        tau = self.tau() if callable(self.tau) else self.tau
+        self.last_tau = tau
+        return self.n_tau * tau
+
+    def estimate_delay(self, old, new):
+        tau = self.tau_estimate if self.tau_estimate is not None else self.last_tau
+        if tau is None:
+            warnings.warn("ExpSettle with a callable tau that was not read yet counts 0 s "
+                          "in the estimate, give tau_estimate")
+            return 0.
+        return self.n_tau * tau
+
+
+class ReadbackSettle(Settle):
+    """
+    Poll readback (the getter of the param by default) every poll seconds
+    until |readback - setpoint| <= tol, at most timeout seconds after
+    min_wait. A timeout warns and the scan continues.
+    """
+    def __init__(self, tol, timeout = 10., poll = 0.05, min_wait = 0., readback = None):
+        self.tol = tol
+        self.timeout = timeout
+        self.poll = poll
+        self.min_wait = min_wait
+        self.readback = readback
+
+    def delay(self, old, new):
+        return self.min_wait
+
+    def converge(self, param, target):
+        readback = self.readback if self.readback is not None else param.getter
+        t_stop = time.monotonic() + self.timeout
+        while True:
+            value = readback()
+            if abs(value - target) <= self.tol:
+                return value
+            if time.monotonic() > t_stop:
+                warnings.warn(f"{param.label} did not settle at {target} within {self.timeout} s "
+                              f"(readback {value}, tolerance {self.tol})")
+                return value
+            time.sleep(self.poll)
+
+
+def settle_params(changes):
+    """
+    Apply the settle policies of the changed params.
+    changes is a list of (param, old value, new value), params without a
+    settle policy or with old == new are skipped.
+    Returns the time spent.
+    """
+    t0 = time.monotonic()
+    changes = [(param, old, new) for param, old, new in changes
+               if getattr(param, 'settle', None) is not None
+               and (old is None or np.any(old != new))]
+    delay = max((param.settle.delay(old, new) for param, old, new in changes), default = 0.)
+    if delay > 0:
+        time.sleep(delay)
+    for param, old, new in changes:
+        param.settle.converge(param, new)
+    return time.monotonic() - t0
@@ -0,0 +1,879 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 07:44:18 2026
+
+@author: zerui
+
+Storage of the measured data of meas_scan.
+The data file is opened once per scan and kept open until the scan ends,
+completed scan lines are written as hyperslabs into line aligned chunks.
+
+The file format is given by a StorageBackend:
+    'netcdf4' : NetCDF4 file (Measdata.nc), zlib compressed by default
+    'zarr'    : chunked Zarr directory store (Measdata.zarr), needs zarr
+    'hdf5'    : HDF5 file with blosc filters (Measdata.h5), needs h5py and
+                hdf5plugin. Readable with xarray using engine = 'h5netcdf'.
+Compression is chosen per variable with a dict
+    {'default': dict(compressor = 'lz4', level = 5, shuffle = True),
+     'Spec': dict(compressor = 'zstd', level = 3, shuffle = True)}
+where compressor is one of 'zlib', 'lz4', 'zstd', 'blosclz' or None.
+"""
+
+import os
+import time
+import datetime
+import queue
+import threading
+import numpy as np
+try:
+    # Registers the blosc filters with h5py. Has to be imported before netCDF4,
+    # which otherwise points h5py to the plugins of its own HDF5 library.
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+import netCDF4 as nc4
+import xarray as xr
+from zq_utility import line_directions
+
+
+# Upper bound for the size of a single chunk. A full scan line is kept in one
+# chunk unless that would exceed this size (e.g. many frames per spectrum).
+MAX_CHUNK_BYTES = 4 * 1024**2
+
+def line_chunksizes(sweep_lens, point_shape = (), itemsize = 8):
+    """
+    Chunk shape aligned to the scan line.
+    The last sweep parameter is the fast axis, so one chunk holds one line
+    (or a whole number of points of it if the line is too large).
+    """
+    point_bytes = itemsize * int(np.prod(point_shape))
+    points_per_chunk = max(1, min(sweep_lens[-1], MAX_CHUNK_BYTES // max(point_bytes, 1)))
+    return (1,) * (len(sweep_lens) - 1) + (points_per_chunk,) + tuple(point_shape)
+
+
+class StorageBackend(object):
+    """
+    Minimal interface between the scan layout (create_variables, write_line)
+    and a file format. Variables live in named groups ('main_data') and are
+    addressed by group and name, keys are tuples of ints and slices.
+    """
+    extension = ''
+    default_compression = dict(compressor = 'zlib', level = 4, shuffle = True)
+
+    def __init__(self, filename, mode = 'w', compression = None):
+        self.filename = filename
+        self.mode = mode
+        self.compression = dict(default = self.default_compression)
+        if compression is not None:
+            self.compression.update(compression)
+
+    def compression_for(self, name):
+        """Compression spec of variable name, None means uncompressed."""
+        spec = self.compression.get(name, self.compression['default'])
+        if spec is None or isinstance(spec, dict):
+            return spec
+        return dict(self.default_compression, compressor = spec)
+
+    def create_dimension(self, group, name, size):
+        raise NotImplementedError
+
+    def create_variable(self, group, name, dtype, dims, chunksizes = None, attrs = None):
+        raise NotImplementedError
+
+    def write(self, group, name, key, data):
+        raise NotImplementedError
+
+    def read(self, group, name, key = Ellipsis):
+        raise NotImplementedError
+
+    def dimensions(self, group):
+        """Dict of dimension name to size."""
+        raise NotImplementedError
+
+    def variables(self, group):
+        raise NotImplementedError
+
+    def attrs(self):
+        """Dict of the global attributes of the file."""
+        raise NotImplementedError
+
+    def set_attr(self, name, value):
+        """Set a global attribute of the file."""
+        raise NotImplementedError
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class NetCDF4Backend(StorageBackend):
+    extension = '.nc'
+
+    # names of the compressors in netCDF4-python (>= 1.6 for all but zlib)
+    _COMPRESSORS = {'zlib': 'zlib', 'zstd': 'zstd', 'lz4': 'blosc_lz4', 'blosclz': 'blosc_lz'}
+
+    def __init__(self, filename, mode = 'w', compression = None):
+        super().__init__(filename, mode, compression)
+        self.ncfile = nc4.Dataset(filename, mode, format = 'NETCDF4')
+
+    def _group(self, group):
+        if group not in self.ncfile.groups:
+            self.ncfile.createGroup(group)
+        return self.ncfile.groups[group]
+
+    def create_dimension(self, group, name, size):
+        self._group(group).createDimension(name, size)
+
+    def create_variable(self, group, name, dtype, dims, chunksizes = None, attrs = None):
+        spec = self.compression_for(name)
+        kwargs = {}
+        if spec is not None and spec['compressor'] is not None:
+            if spec['compressor'] == 'zlib':
+                kwargs = dict(zlib = True, complevel = spec['level'])
+            else:
+                kwargs = dict(compression = self._COMPRESSORS[spec['compressor']], complevel = spec['level'])
+            kwargs['shuffle'] = spec['shuffle']
+        var = self._group(group).createVariable(name, dtype, tuple(dims), chunksizes = chunksizes, **kwargs)
+        for key, val in (attrs or {}).items():
+            var.setncattr(key, val)
+
+    def write(self, group, name, key, data):
+        self.ncfile.groups[group][name][key] = data
+
+    def read(self, group, name, key = Ellipsis):
+        return self.ncfile.groups[group][name][key]
+
+    def dimensions(self, group):
+        return {name: len(dim) for name, dim in self.ncfile.groups[group].dimensions.items()}
+
+    def variables(self, group):
+        return list(self.ncfile.groups[group].variables.keys())
+
+    def attrs(self):
+        return {name: self.ncfile.getncattr(name) for name in self.ncfile.ncattrs()}
+
+    def set_attr(self, name, value):
+        self.ncfile.setncattr(name, value)
+
+    def sync(self):
+        self.ncfile.sync()
+
+    def close(self):
+        if self.ncfile is not None:
+            try:
+                self.ncfile.close()
+            finally:
+                self.ncfile = None
+
+
+class HDF5BloscBackend(StorageBackend):
+    """
+    Plain HDF5 via h5py with blosc filters from hdf5plugin. Dimensions are
+    stored as HDF5 dimension scales like netCDF4 does.
+    """
+    extension = '.h5'
+    default_compression = dict(compressor = 'lz4', level = 5, shuffle = True)
+
+    def __init__(self, filename, mode = 'w', compression = None):
+        super().__init__(filename, mode, compression)
+        if hdf5plugin is None:
+            raise ImportError("The 'hdf5' storage backend needs h5py and hdf5plugin")
+        import h5py
+        self.h5file = h5py.File(filename, mode)
+
+    def _group(self, group):
+        return self.h5file.require_group(group)
+
+    def _filter(self, spec):
+        if spec is None or spec['compressor'] is None:
+            return {}
+        if spec['compressor'] == 'zlib':
+            return dict(compression = 'gzip', compression_opts = spec['level'], shuffle = spec['shuffle'])
+        Blosc = hdf5plugin.Blosc
+        return dict(**Blosc(cname = spec['compressor'], clevel = spec['level'],
+                            shuffle = Blosc.SHUFFLE if spec['shuffle'] else Blosc.NOSHUFFLE))
+
+    def create_dimension(self, group, name, size):
+        grp = self._group(group)
+        # netCDF convention for a dimension without coordinate variable, it
+        # is replaced if a coordinate variable of the same name is created
+        scale = grp.create_dataset(name, (size,), 'f4')
+        scale.make_scale('This is a netCDF dimension but not a netCDF variable.')
+
+    def create_variable(self, group, name, dtype, dims, chunksizes = None, attrs = None):
+        grp = self._group(group)
+        dtype = np.dtype(dtype)
+        fill = np.nan if dtype.kind == 'f' else None
+        shape = tuple(grp[dim].shape[0] for dim in dims)
+        if tuple(dims) == (name,):
+            # coordinate variable, replaces the dimension placeholder
+            del grp[name]
+            var = grp.create_dataset(name, shape, dtype, fillvalue = fill)
+            var.make_scale(name)
+        else:
+            var = grp.create_dataset(name, shape, dtype, chunks = chunksizes, fillvalue = fill,
+                                     **self._filter(self.compression_for(name)))
+            for i, dim in enumerate(dims):
+                var.dims[i].attach_scale(grp[dim])
+        for key, val in (attrs or {}).items():
+            var.attrs[key] = val
+
+    def write(self, group, name, key, data):
+        self.h5file[group][name][key] = data
+
+    def read(self, group, name, key = Ellipsis):
+        return self.h5file[group][name][key]
+
+    def dimensions(self, group):
+        grp = self.h5file[group]
+        return {name: dset.shape[0] for name, dset in grp.items()
+                if dset.attrs.get('CLASS') == b'DIMENSION_SCALE'}
+
+    def variables(self, group):
+        return [name for name, dset in self.h5file[group].items() if not self._is_placeholder(dset)]
+
+    def attrs(self):
+        return {name: val.decode() if isinstance(val, bytes) else val
+                for name, val in self.h5file.attrs.items()}
+
+    def set_attr(self, name, value):
+        self.h5file.attrs[name] = value
+
+    @staticmethod
+    def _is_placeholder(dset):
+        name = dset.attrs.get('NAME', b'')
+        if isinstance(name, bytes):
+            name = name.decode()
+        return name.startswith('This is a netCDF dimension')
+
+    def sync(self):
+        self.h5file.flush()
+
+    def close(self):
+        if self.h5file is not None:
+            try:
+                self.h5file.close()
+            finally:
+                self.h5file = None
+
+
+class ZarrBackend(StorageBackend):
+    """
+    Chunked Zarr directory store with blosc compressors (zarr v2 format,
+    readable with xr.open_zarr(filename, group = 'main_data')).
+    """
+    extension = '.zarr'
+    default_compression = dict(compressor = 'lz4', level = 5, shuffle = True)
+
+    def __init__(self, filename, mode = 'w', compression = None):
+        super().__init__(filename, mode, compression)
+        try:
+            import zarr
+            from numcodecs import Blosc
+        except ImportError as e:
+            raise ImportError("The 'zarr' storage backend needs zarr and numcodecs") from e
+        self._Blosc = Blosc
+        self._zarr_v2 = zarr.__version__.startswith('2')
+        if self._zarr_v2:
+            self.root = zarr.open_group(filename, mode = mode)
+        else:
+            self.root = zarr.open_group(filename, mode = mode, zarr_format = 2)
+        self._dims = {}
+
+    def _group(self, group):
+        return self.root.require_group(group)
+
+    def _compressor(self, spec):
+        if spec is None or spec['compressor'] is None:
+            return None
+        return self._Blosc(cname = spec['compressor'], clevel = spec['level'],
+                           shuffle = self._Blosc.SHUFFLE if spec['shuffle'] else self._Blosc.NOSHUFFLE)
+
+    def create_dimension(self, group, name, size):
+        self._dims.setdefault(group, {})[name] = size
+
+    def create_variable(self, group, name, dtype, dims, chunksizes = None, attrs = None):
+        grp = self._group(group)
+        dtype = np.dtype(dtype)
+        shape = tuple(self.dimensions(group)[dim] for dim in dims)
+        fill = np.nan if dtype.kind == 'f' else None
+        compressor = self._compressor(self.compression_for(name))
+        chunks = chunksizes if chunksizes is not None else shape
+        if self._zarr_v2:
+            var = grp.create_dataset(name, shape = shape, chunks = chunks, dtype = dtype,
+                                     compressor = compressor, fill_value = fill)
+        else:
+            var = grp.create_array(name, shape = shape, chunks = chunks, dtype = dtype,
+                                   compressors = compressor, fill_value = fill)
+        var.attrs['_ARRAY_DIMENSIONS'] = list(dims)
+        for key, val in (attrs or {}).items():
+            var.attrs[key] = val.item() if isinstance(val, np.generic) else val
+
+    def write(self, group, name, key, data):
+        self.root[group][name][key] = np.asarray(data)
+
+    def read(self, group, name, key = Ellipsis):
+        return self.root[group][name][key]
+
+    def dimensions(self, group):
+        dims = dict(self._dims.get(group, {}))
+        if group in self.root:
+            for name in self.variables(group):
+                var = self.root[group][name]
+                dims.update(zip(var.attrs.get('_ARRAY_DIMENSIONS', []), var.shape))
+        return dims
+
+    def variables(self, group):
+        return [name for name in self.root[group].array_keys()]
+
+    def attrs(self):
+        return dict(self.root.attrs)
+
+    def set_attr(self, name, value):
+        self.root.attrs[name] = value.item() if isinstance(value, np.generic) else value
+
+    def close(self):
+        if self.root is not None and self.mode != 'r':
+            # single metadata read when the store is reopened
+            import zarr
+            zarr.consolidate_metadata(self.root.store)
+        self.root = None
+
+
+BACKENDS = {
+    'netcdf4': NetCDF4Backend,
+    'hdf5': HDF5BloscBackend,
+    'zarr': ZarrBackend,
+    }
+
+def get_backend(backend):
+    """StorageBackend class from its name (or the class itself)."""
+    if isinstance(backend, str):
+        try:
+            return BACKENDS[backend]
+        except KeyError:
+            raise ValueError('Unknown storage backend {}, choose from {}'.format(backend, list(BACKENDS)))
+    return backend
+
+
+def value_dtype(value, dtype = None):
+    """
+    The dtype a measured value is stored with: dtype if given (Param(...,
+    dtype = ...)), else that of value, e.g. uint16 spectra or numpy integer
+    counts. Python ints and bools are stored as float64, a getter of floats
+    returning a plain 0 first would truncate all later values.
+    """
+    if dtype is not None:
+        return np.dtype(dtype)
+    if isinstance(value, (bool, int)):
+        return np.dtype(np.float64)
+    return np.asarray(value).dtype
+
+def _param_attrs(param):
+    attrs = {}
+    if hasattr(param, 'units'):
+        attrs['units'] = param.units
+    if hasattr(param, 'long_name'):
+        attrs['long_name'] = param.long_name
+    return attrs
+
+def _create_sweep_coords(backend, sweep_params, group):
+    """Dimension and coordinate variable of every sweep parameter, returns the dims."""
+    for sweep_param, sweep_values in sweep_params:
+        sweep_values = np.asarray(sweep_values)
+        backend.create_dimension(group, sweep_param.label, len(sweep_values))
+        backend.create_variable(group, sweep_param.label, sweep_values.dtype, (sweep_param.label,),
+                                attrs = _param_attrs(sweep_param))
+        backend.write(group, sweep_param.label, slice(None), sweep_values)
+    return [sweep_param.label for sweep_param, _ in sweep_params]
+
+def create_variables(backend, sweep_params, meas_params, group = 'main_data',
+                     sweep_order = 'sawtooth'):
+    """
+    Create the main_data group with one dimension per sweep parameter and
+    one variable per measured parameter.
+    The dtype (value_dtype, param.dtype if given) and shape of the
+    measured variables is taken from param.pv.
+    The sweep order is stored in the global attribute sweep_order, for a
+    snake sweep the direction of the fast axis in every line (1 / -1) is
+    stored in sweep_direction.
+    """
+    sweep_lens = [len(sweep_param[1]) for sweep_param in sweep_params]
+    sweep_dims = _create_sweep_coords(backend, sweep_params, group)
+
+    backend.set_attr('sweep_order', sweep_order)
+    if sweep_order != 'sawtooth' and len(sweep_dims) > 1:
+        backend.create_variable(group, 'sweep_direction', np.int8, sweep_dims[:-1],
+                                attrs = dict(long_name = f'Direction of {sweep_dims[-1]} in the scan line'))
+        backend.write(group, 'sweep_direction', Ellipsis, line_directions(sweep_lens, sweep_order))
+
+    # Create variables for measured parameters
+    for meas_param in meas_params:
+        dtype = value_dtype(meas_param.pv, meas_param.dtype)
+        if type(meas_param.pv) == xr.core.dataarray.DataArray:
+            for dim in meas_param.pv.dims:
+                if dim in backend.dimensions(group):
+                    continue # coordinate shared with another parameter
+                coord = meas_param.pv[dim]
+                backend.create_dimension(group, dim, len(coord))
+                backend.create_variable(group, dim, np.array(coord).dtype, (dim,),
+                                        attrs = dict(coord.attrs))
+                backend.write(group, dim, slice(None), np.array(coord))
+            backend.create_variable(group, meas_param.label, dtype,
+                                    sweep_dims + list(meas_param.pv.dims),
+                                    chunksizes = line_chunksizes(sweep_lens, meas_param.pv.shape, dtype.itemsize),
+                                    attrs = _param_attrs(meas_param))
+        else:
+            backend.create_variable(group, meas_param.label, dtype, sweep_dims,
+                                    chunksizes = line_chunksizes(sweep_lens, (), dtype.itemsize),
+                                    attrs = _param_attrs(meas_param))
+
+DIAGNOSTICS_GROUP = 'diagnostics'
+
+def create_diagnostics(backend, sweep_params, point_names, line_names, group = DIAGNOSTICS_GROUP):
+    """
+    Create the diagnostics group with the phase times (s) of meas_scan:
+    point_names over the sweep dims and line_names over the line dim (the
+    index of the scan line, in the order of the outer sweep dims).
+    """
+    sweep_lens = [len(sweep_param[1]) for sweep_param in sweep_params]
+    sweep_dims = _create_sweep_coords(backend, sweep_params, group)
+    backend.create_dimension(group, 'line', int(np.prod(sweep_lens[:-1])))
+    for name in point_names:
+        backend.create_variable(group, name, np.float32, sweep_dims,
+                                chunksizes = line_chunksizes(sweep_lens, (), 4),
+                                attrs = dict(units = 's'))
+    for name in line_names:
+        backend.create_variable(group, name, np.float32, ('line',), attrs = dict(units = 's'))
+
+def _line_slab(sweep_lens, save_index):
+    """Index of the line and range along the fast axis of the points save_index."""
+    index = np.unravel_index(np.atleast_1d(save_index), sweep_lens)
+    line = tuple(int(i[0]) for i in index[:-1])
+    start, stop = int(index[-1][0]), int(index[-1][-1]) + 1
+    if any(np.any(i != i[0]) for i in index[:-1]) or stop - start != len(index[-1]):
+        raise ValueError('save_index must be a contiguous range within one scan line')
+    return line, start, stop
+
+def write_line(backend, meas_params, sweep_lens, measured_data, save_index, group = 'main_data'):
+    """
+    Write the points save_index of one scan line.
+    Only the hyperslab of that line is touched, the rest of the variable is
+    neither read nor rewritten.
+    measured_data holds one line buffer per meas_param, indexed along the
+    fast (last) sweep axis.
+    """
+    line, start, stop = _line_slab(sweep_lens, save_index)
+    for imeas_param, meas_param in enumerate(meas_params):
+        backend.write(group, meas_param.label, line + (slice(start, stop),),
+                      measured_data[imeas_param][start:stop])
+
+def write_diagnostics_line(backend, sweep_lens, diagnostics, save_index, group = DIAGNOSTICS_GROUP):
+    """Write one line of the per point times, diagnostics maps name -> line array."""
+    line, start, stop = _line_slab(sweep_lens, save_index)
+    for name, data in diagnostics.items():
+        backend.write(group, name, line + (slice(start, stop),), data[start:stop])
+
+
+def find_datafile(filedir, name = 'Measdata'):
+    """
+    Data file of a run directory and the name of its backend.
+    Raises FileNotFoundError if there is none.
+    """
+    for backend, backend_cls in BACKENDS.items():
+        filename = os.path.join(filedir, name + backend_cls.extension)
+        if os.path.exists(filename):
+            return filename, backend
+    raise FileNotFoundError('No {} file in {}'.format(name, filedir))
+
+def journal_filename(filename):
+    """Journal of the data file filename (Measdata.journal)."""
+    return os.path.splitext(filename)[0] + '.journal'
+
+
+class LineJournal(object):
+    """
+    Append only text file with the (flat) numbers of the scan lines that are
+    safely on disk, one per line. Entries are added after the data file was
+    synced and are fsynced themselves, so after a crash every journaled
+    line can be trusted. A torn last entry is ignored and cut off before
+    new entries are appended.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = None
+
+    def completed(self):
+        """Set of the completed line numbers."""
+        lines = set()
+        if not os.path.exists(self.filename):
+            return lines
+        with open(self.filename, 'r') as f:
+            for entry in f:
+                if not entry.endswith('\n'):
+                    break # torn write
+                try:
+                    lines.add(int(entry))
+                except ValueError:
+                    continue
+        return lines
+
+    def first_incomplete(self, n_lines):
+        """First line number that is not completed (n_lines if all are)."""
+        completed = self.completed()
+        for line in range(n_lines):
+            if line not in completed:
+                return line
+        return n_lines
+
+    def _open(self):
+        if os.path.exists(self.filename):
+            # cut off a torn last entry
+            with open(self.filename, 'rb+') as f:
+                content = f.read()
+                if content and not content.endswith(b'\n'):
+                    f.truncate(content.rfind(b'\n') + 1)
+        self._file = open(self.filename, 'a')
+
+    def record(self, lines):
+        if not lines:
+            return
+        if self._file is None:
+            self._open()
+        self._file.write(''.join('{}\n'.format(line) for line in lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class StorageSession(object):
+    """
+    Keeps the data file of a scan open from its creation until the end of
+    the scan, instead of reopening it for every saved line.
+
+    The file is flushed to disk according to sync:
+        'line' : after every written line (default, same crash safety as
+                 reopening the file for every line)
+        float  : at most every sync seconds
+        'exit' : only when the session is closed
+    backend is the name of a StorageBackend ('netcdf4', 'zarr', 'hdf5') and
+    compression a dict of per variable compression specs (see above).
+    The session is a context manager and is closed on any exception,
+    including KeyboardInterrupt.
+    If journal is the filename of a LineJournal, every line is recorded
+    there once it has been synced to disk.
+    """
+    def __init__(self, filename, sync = 'line', backend = 'netcdf4', compression = None,
+                 journal = None):
+        if not (sync in ('line', 'exit') or isinstance(sync, (int, float))):
+            raise ValueError("sync must be 'line', 'exit' or a time in seconds, got {}".format(sync))
+        self.filename = filename
+        self.sync_policy = sync
+        self.backend_cls = get_backend(backend)
+        self.compression = compression
+        self.backend = None
+        self.journal = LineJournal(journal) if journal is not None else None
+        self._unjournaled = []
+        self._last_sync = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.backend is not None
+
+    def create(self, sweep_params, meas_params, sweep_order = 'sawtooth', diagnostics = None):
+        """
+        Create the file and its variables, the file is kept open.
+        diagnostics is (point_names, line_names) of the phase times stored
+        in the diagnostics group (see create_diagnostics).
+        """
+        self.backend = self.backend_cls(self.filename, 'w', self.compression)
+        create_variables(self.backend, sweep_params, meas_params, sweep_order = sweep_order)
+        if diagnostics is not None:
+            create_diagnostics(self.backend, sweep_params, *diagnostics)
+        self.sync()
+
+    def has_diagnostics(self):
+        try:
+            return len(self.backend.variables(DIAGNOSTICS_GROUP)) > 0
+        except KeyError:
+            return False
+
+    def write_diagnostics(self, name, key, data):
+        self.backend.write(DIAGNOSTICS_GROUP, name, key, data)
+
+    def read_diagnostics(self, name):
+        """Phase times of name as float array, NaN where nothing was recorded."""
+        return np.ma.filled(np.ma.asarray(self.backend.read(DIAGNOSTICS_GROUP, name), dtype = float), np.nan)
+
+    def reopen(self, sweep_params, start_line, sweep_order = 'sawtooth'):
+        """
+        Reopen the file of an interrupted scan to continue at start_line.
+        The sweep and its order have to match the file. The resume is recorded
+        in the global attributes resume_count and resume_history.
+        Returns the number of resumes of the file including this one.
+        """
+        self.backend = self.backend_cls(self.filename, 'r+', self.compression)
+        dims = self.backend.dimensions('main_data')
+        for sweep_param, sweep_values in sweep_params:
+            if dims.get(sweep_param.label) != len(sweep_values):
+                raise ValueError('Cannot resume {}: sweep of {} has {} points, file has {}'.format(
+                    self.filename, sweep_param.label, len(sweep_values), dims.get(sweep_param.label)))
+        n_lines = int(np.prod([len(values) for _, values in sweep_params[:-1]]))
+        attrs = self.backend.attrs()
+        if attrs.get('sweep_order', 'sawtooth') != sweep_order:
+            raise ValueError('Cannot resume {}: it was scanned in {} order, not {}'.format(
+                self.filename, attrs.get('sweep_order', 'sawtooth'), sweep_order))
+        resume_count = int(attrs.get('resume_count', 0)) + 1
+        entry = '{}: resumed at line {} of {}'.format(
+            datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), start_line, n_lines)
+        history = attrs.get('resume_history', '')
+        self.backend.set_attr('resume_count', resume_count)
+        self.backend.set_attr('resume_history', history + '\n' + entry if history else entry)
+        self.sync()
+        return resume_count
+
+    def write_line(self, meas_params, sweep_lens, measured_data, save_index, release = None,
+                   diagnostics = None):
+        """
+        Write one line. release is called once measured_data is no longer
+        needed (see LineBuffers). diagnostics maps the names of per point
+        times to their line arrays (see create_diagnostics).
+        """
+        try:
+            write_line(self.backend, meas_params, sweep_lens, measured_data, save_index)
+            if diagnostics is not None:
+                write_diagnostics_line(self.backend, sweep_lens, diagnostics, save_index)
+        finally:
+            if release is not None:
+                release()
+        self._unjournaled.append(int(np.atleast_1d(save_index)[0]) // sweep_lens[-1])
+        if self.sync_policy == 'line':
+            self.sync()
+        elif self.sync_policy != 'exit' and time.monotonic() - self._last_sync >= self.sync_policy:
+            self.sync()
+
+    def sync(self):
+        self.backend.sync()
+        self._last_sync = time.monotonic()
+        self._journal_lines()
+
+    def _journal_lines(self):
+        if self.journal is not None:
+            self.journal.record(self._unjournaled)
+        self._unjournaled = []
+
+    def drain(self):
+        """Same interface as AsyncLineWriter.drain, nothing is pending here."""
+        if self.is_open:
+            self.sync()
+
+    def close(self):
+        if self.backend is not None:
+            try:
+                self.backend.close()
+                self._journal_lines()
+            finally:
+                self.backend = None
+                if self.journal is not None:
+                    self.journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncLineWriter(object):
+    """
+    Persists completed scan lines on a background thread so that the
+    acquisition loop does not wait for compression and disk I/O.
+
+    Lines are put on a bounded queue (maxsize lines). When the queue is full
+    write_line blocks until the writer has caught up (backpressure).
+    drain() is a barrier that returns once every queued line is written and
+    the file is synced. Errors of the writer thread are re-raised in the
+    calling thread on the next write_line / drain.
+
+    Metrics are available through stats(): current and maximum queue depth,
+    writer time per line, latency from queuing to on-disk and the time the
+    acquisition loop was blocked by backpressure.
+    """
+    def __init__(self, session, maxsize = 4):
+        self.session = session
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self.lines_written = 0
+        self.max_queue_depth = 0
+        self.write_times = []
+        self.latencies = []
+        self.blocked_time = 0.
+        self._thread = threading.Thread(target = self._run, name = 'AsyncLineWriter', daemon = True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def write_line(self, meas_params, sweep_lens, measured_data, save_index, release = None,
+                   diagnostics = None):
+        """
+        Queue one line. Without release the data is copied since the caller
+        reuses its buffers. With release the arrays are queued as they are
+        and release is called once they are written (see LineBuffers).
+        """
+        self._raise_error()
+        if release is None:
+            measured_data = [np.array(data, copy = True) for data in measured_data]
+            if diagnostics is not None:
+                diagnostics = {name: np.array(data, copy = True) for name, data in diagnostics.items()}
+        t_put = time.monotonic()
+        self._queue.put((meas_params, sweep_lens, measured_data, save_index, release, diagnostics, t_put))
+        self.blocked_time += time.monotonic() - t_put
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                meas_params, sweep_lens, measured_data, save_index, release, diagnostics, t_put = item
+                if self._error is not None:
+                    # drop lines after a failure, error is raised in the scan thread
+                    if release is not None:
+                        release()
+                    continue
+                t_start = time.monotonic()
+                self.session.write_line(meas_params, sweep_lens, measured_data, save_index, release,
+                                        diagnostics)
+                t_end = time.monotonic()
+                self.write_times.append(t_end - t_start)
+                self.latencies.append(t_end - t_put)
+                self.lines_written += 1
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RuntimeError('AsyncLineWriter: writing to {} failed'.format(self.session.filename)) from self._error
+
+    def drain(self):
+        """Wait until all queued lines are written and synced to disk."""
+        self._queue.join()
+        self._raise_error()
+        self.session.sync()
+
+    def stats(self):
+        def _mean(x): return float(np.mean(x)) if len(x) else 0.
+        def _max(x): return float(np.max(x)) if len(x) else 0.
+        return dict(
+            queue_depth = self.queue_depth,
+            max_queue_depth = self.max_queue_depth,
+            lines_written = self.lines_written,
+            mean_write_time = _mean(self.write_times),
+            max_write_time = _max(self.write_times),
+            mean_latency = _mean(self.latencies),
+            max_latency = _max(self.latencies),
+            blocked_time = self.blocked_time,
+            )
+
+    def close(self):
+        """Write the remaining lines and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if exc_type is None:
+            self._raise_error()
+
+
+class LineBuffers(object):
+    """
+    Preallocated line buffers of the measured parameters.
+
+    The buffer of a parameter has shape (line_len,) + point shape and the
+    value_dtype of its first measurement (e.g. uint16 for spectra) or its
+    entry in dtypes if not None, for xarray
+    DataArrays the dims and coords of the first measurement are kept in
+    point_dims and point_coords.
+    There are n_buffers sets of buffers that are used in turn: the scan
+    fills the current set while the writer consumes the previous ones.
+    swap() hands the filled set over together with a release function for
+    the writer and blocks if the next set has not been released yet.
+    """
+    def __init__(self, n_params, line_len, n_buffers = 2, dtypes = None):
+        self.line_len = line_len
+        self.n_buffers = n_buffers
+        self.dtypes = [None] * n_params if dtypes is None else list(dtypes)
+        self.point_dims = [None] * n_params
+        self.point_coords = [None] * n_params
+        self._sets = [[None] * n_params for _ in range(n_buffers)]
+        self._free = [threading.Event() for _ in range(n_buffers)]
+        for event in self._free[1:]:
+            event.set()
+        self._index = 0
+        self.blocked_time = 0.
+
+    @property
+    def current(self):
+        """The set of buffers currently being filled."""
+        return self._sets[self._index]
+
+    @property
+    def nbytes(self):
+        return sum(buf.nbytes for bufs in self._sets for buf in bufs if buf is not None)
+
+    def _allocate(self, i_param, value):
+        if isinstance(value, xr.DataArray):
+            self.point_dims[i_param] = value.dims
+            self.point_coords[i_param] = {dim: value[dim].values for dim in value.dims}
+        dtype = value_dtype(value, self.dtypes[i_param])
+        shape = np.shape(value)
+        for bufs in self._sets:
+            bufs[i_param] = np.empty((self.line_len,) + shape, dtype = dtype)
+
+    def store(self, i_param, position, value):
+        """Store value of parameter i_param at position of the current line."""
+        if self.current[i_param] is None:
+            self._allocate(i_param, value)
+        if isinstance(value, xr.DataArray):
+            value = value.data
+        self.current[i_param][position] = value
+
+    def swap(self):
+        """
+        Start filling the next set of buffers.
+        Returns the filled set and the function that releases it.
+        """
+        filled = self._index
+        self._index = (self._index + 1) % self.n_buffers
+        if self.n_buffers > 1:
+            t0 = time.monotonic()
+            self._free[self._index].wait()
+            self.blocked_time += time.monotonic() - t0
+            self._free[self._index].clear()
+            # buffers of the new set are allocated by the first store
+            for i_param, buf in enumerate(self._sets[self._index]):
+                if buf is None and self._sets[filled][i_param] is not None:
+                    self._sets[self._index][i_param] = np.empty_like(self._sets[filled][i_param])
+        return self._sets[filled], self._free[filled].set
@@ -5,71 +5,268 @@ Created on Thu Apr  4 17:47:52 2024
 @author: eyazici
 """
 import numpy as np
-import datetime, os
+import datetime, os, time
+import socket, shutil, uuid
  
 
-def save_array_with_metadata(array, filename_prefix):
-    # Save array to binary file
-    array.tofile(filename_prefix + ".bin")
+# Arrays are saved as .npy files (header with dtype and shape, then the
+# raw data), which np.load can map into memory without reading them:
+#     spectra = load_array_with_metadata(prefix)      # np.memmap
+#     spectra[1000:1010].mean(axis = 0)               # reads 10 frames
+# Streaming writes append frames to the file, see ArrayAppender. Files of
+# the former format (raw prefix.bin with dtype and shape in prefix.txt)
+# are still read.
+
+def _array_prefix(filename_prefix):
+    return filename_prefix[:-4] if filename_prefix.endswith('.npy') else filename_prefix
 
-    # Save metadata (datatype and shape) to text file
-    with open(filename_prefix + ".txt", "w") as metadata_file:
-        metadata_file.write("Data Type: {}\n".format(array.dtype))
-        metadata_file.write("Shape: {}\n".format(" ".join(map(str, array.shape))))
+def save_array_with_metadata(array, filename_prefix):
+    """Save array as filename_prefix.npy."""
+    np.save(_array_prefix(filename_prefix) + ".npy", np.asarray(array))
 
-def load_array_with_metadata(filename_prefix):
+def load_array_with_metadata(filename_prefix, mmap_mode = 'c'):
+    """
+    The array saved as filename_prefix (.npy, or the former .bin and .txt).
+    With mmap_mode (see np.memmap) the file is mapped and only the parts
+    that are used are read, the default 'c' gives a writable array whose
+    changes stay in memory. mmap_mode = None reads the whole file.
+    """
+    prefix = _array_prefix(filename_prefix)
+    if os.path.exists(prefix + ".npy"):
+        return np.load(prefix + ".npy", mmap_mode = mmap_mode)
 
     # Load metadata from text file
-    with open(filename_prefix + ".txt", "r") as metadata_file:
+    with open(prefix + ".txt", "r") as metadata_file:
         dtype_str = metadata_file.readline().split(": ")[1].strip()
         shape_str = metadata_file.readline().split(": ")[1].strip()
         dtype = np.dtype(dtype_str)
         shape = tuple(map(int, shape_str.split()))
 
-    # Load array from binary file
-    array = np.fromfile(filename_prefix + ".bin", dtype = dtype)
-    # Reshape the array
-    return array.reshape(shape).astype(dtype)
+    if mmap_mode is None:
+        return np.fromfile(prefix + ".bin", dtype = dtype).reshape(shape)
+    return np.memmap(prefix + ".bin", dtype = dtype, mode = mmap_mode, shape = shape)
 
 
-def generate_filename(comment, base_dir):
-    # Create directory for today's date if it doesn't exist
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    today_dir = os.path.join(base_dir, today)
-    os.makedirs(today_dir, exist_ok=True)
+def _npy_header(dtype, shape, size = None):
+    """The .npy (version 1.0) header, padded with spaces to size bytes."""
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                   'shape': tuple(shape)}).encode('latin1')
+    if size is None:
+        # room for the number of frames to grow by 20 digits
+        size = 64 * ((10 + len(header) + 1 + 20 + 63) // 64)
+    if 10 + len(header) + 1 > size:
+        raise ValueError(f"The header of shape {shape} does not fit into {size} bytes")
+    header = header + b' ' * (size - 10 - len(header) - 1) + b'\n'
+    return np.lib.format.MAGIC_PREFIX + bytes([1, 0]) + np.uint16(len(header)).astype('<u2').tobytes() + header
+
+class ArrayAppender(object):
+    """
+    Frames of frame_shape appended to filename_prefix.npy as they come,
+    e.g. the spectra of a long acquisition:
     
-    # Find the latest run number for today
-    run_number = 1
-    if os.path.exists(today_dir):
-        existing_files = [f for f in os.listdir(today_dir)]
-        if existing_files:
-            run_numbers = [int(f.split('_')[1]) for f in existing_files if len(f.split('_'))>1]
-            run_number = max(run_numbers) + 1
+        with ArrayAppender(prefix, (1340,), 'uint16') as appender:
+            for i in range(n):
+                appender.append(ws.get_spectrum())
+                
+    The file is a (n_frames,) + frame_shape array at any time, it can be
+    read with load_array_with_metadata while it is written. An existing
+    file with the same frame shape and dtype is continued.
+    """
+    def __init__(self, filename_prefix, frame_shape, dtype):
+        self.filename = _array_prefix(filename_prefix) + ".npy"
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = self.dtype.itemsize * int(np.prod(self.frame_shape))
+        if os.path.exists(self.filename):
+            self._file = open(self.filename, 'r+b')
+            if np.lib.format.read_magic(self._file) != (1, 0):
+                self._file.close()
+                raise ValueError(f"{self.filename} is not a version 1.0 .npy file, can't append")
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(self._file)
+            if fortran_order or tuple(shape[1:]) != self.frame_shape or dtype != self.dtype:
+                self._file.close()
+                raise ValueError(f"{self.filename} holds {dtype} frames of shape {tuple(shape[1:])}, "
+                                 f"not {self.dtype} frames of shape {self.frame_shape}")
+            self.header_size = self._file.tell()
+            self.n_frames = shape[0]
+            # drop a frame that was only partly written
+            self._file.truncate(self.header_size + self.n_frames * self.frame_bytes)
+        else:
+            self._file = open(self.filename, 'w+b')
+            self.n_frames = 0
+            self._file.write(_npy_header(self.dtype, (0,) + self.frame_shape))
+            self.header_size = self._file.tell()
             
-    datadir = os.path.join(today_dir, f"Run_{run_number:03d}")
-    os.makedirs(datadir, exist_ok=True)
+    def append(self, frames):
+        """Append a frame or an array of frames."""
+        frames = np.ascontiguousarray(frames, dtype = self.dtype)
+        if frames.shape == self.frame_shape:
+            frames = frames[np.newaxis]
+        if frames.shape[1:] != self.frame_shape:
+            raise ValueError(f"Frames of shape {frames.shape[1:]} appended to frames of shape {self.frame_shape}")
+        # the data first, readers only see the frames once they are in the header
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(frames.data)
+        self.n_frames += len(frames)
+        self._file.seek(0)
+        self._file.write(_npy_header(self.dtype, (self.n_frames,) + self.frame_shape, self.header_size))
+        self._file.flush()
+        
+    def close(self):
+        self._file.close()
+        
+    def __enter__(self):
+        return self
     
-    # Generate filename with run number
-    return os.path.join(datadir, comment)
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
+# Run numbers of a day directory: the last one is kept in RUN_COUNTER and
+# allocated under RUN_LOCK (a directory, mkdir is atomic also on network
+# shares). The names have no '_', older versions that parse the run
+# number out of every entry skip them.
+RUN_COUNTER = '.runcounter'
+RUN_LOCK = '.runlock'
+RUN_LOCK_OWNER = 'owner' # file in RUN_LOCK with the token of the holder
+RUN_LOCK_STALE = 10 # s, a lock kept this long by one holder was left by a crashed
+                    # process (allocating takes ms), less than the RunLock timeout
 
-def generate_filedir(suffix, base_dir):
-    # Create directory for today's date if it doesn't exist
+_UNSEEN = object()
+
+class RunLock(object):
+    """
+    Holds the run lock of directory (with RunLock(today_dir): ...).
+    A lock is broken as stale if the same holder (its token in
+    RUN_LOCK_OWNER) kept it for RUN_LOCK_STALE s, measured with the clock
+    of the waiting process, not the mtime of the share. It is moved away
+    before it is removed, and put back if it was taken again meanwhile.
+    """
+    def __init__(self, directory, timeout = 30, poll = 0.01):
+        self.path = os.path.join(directory, RUN_LOCK)
+        self.timeout = timeout
+        self.poll = poll
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        
+    @staticmethod
+    def _owner(path):
+        try:
+            with open(os.path.join(path, RUN_LOCK_OWNER)) as f:
+                return f.read()
+        except OSError:
+            return None # being taken, or left without owner
+        
+    def _break(self, owner):
+        stale = f"{self.path}.stale.{uuid.uuid4().hex}"
+        try:
+            os.rename(self.path, stale)
+        except OSError:
+            return # released (or broken by another process) meanwhile
+        if self._owner(stale) != owner:
+            try:
+                os.rename(stale, self.path)
+                return
+            except OSError:
+                pass
+        shutil.rmtree(stale, ignore_errors = True)
+        
+    def __enter__(self):
+        t0 = time.monotonic()
+        seen, seen_since = _UNSEEN, None
+        while True:
+            try:
+                os.mkdir(self.path)
+                with open(os.path.join(self.path, RUN_LOCK_OWNER), 'w') as f:
+                    f.write(self.token)
+                return self
+            except FileExistsError:
+                pass
+            owner, now = self._owner(self.path), time.monotonic()
+            if owner != seen:
+                seen, seen_since = owner, now
+            elif now - seen_since > RUN_LOCK_STALE:
+                self._break(owner)
+                seen = _UNSEEN
+                continue
+            if now - t0 > self.timeout:
+                raise TimeoutError(f"Run lock {self.path} held for more than {self.timeout} s, "
+                                   "remove it if no other measurement is starting")
+            time.sleep(self.poll)
+            
+    def __exit__(self, exc_type, exc_value, traceback):
+        # not if it was broken as stale and is held by another process now
+        if self._owner(self.path) == self.token:
+            try:
+                os.remove(os.path.join(self.path, RUN_LOCK_OWNER))
+                os.rmdir(self.path)
+            except OSError:
+                pass
+
+def run_numbers(today_dir):
+    """Numbers n of the entries Run_<n> and Run_<n>_... of a day directory."""
+    numbers = set()
+    for f in os.listdir(today_dir):
+        parts = f.split('_')
+        if len(parts) > 1 and parts[0] == 'Run' and parts[1].isdigit():
+            numbers.add(int(parts[1]))
+    return numbers
+
+def last_run_number(today_dir):
+    """Highest number n of the entries Run_<n>... of a day directory, 0 if none."""
+    return max(run_numbers(today_dir), default = 0)
+
+def _read_run_counter(counter):
+    try:
+        with open(counter) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def _write_run_counter(counter, run_number):
+    tmp = counter + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(f"{run_number}\n")
+    os.replace(tmp, counter)
+
+def allocate_run(base_dir, suffix = None):
+    """
+    Create the directory of the next run of today in base_dir,
+    base_dir/<date>/Run_<n>_<suffix> (Run_<n> without suffix).
+    Returns (n, directory). Gives different runs to processes starting at
+    once. The counter keeps numbers of deleted runs from being reused.
+    The day directory is only listed if the counter is missing or corrupt
+    (then no number of an entry Run_<n>... is reused), a run directory
+    made without the counter (e.g. by an older version) is skipped by the
+    exclusive mkdir.
+    """
     today = datetime.datetime.now().strftime("%Y-%m-%d")
     today_dir = os.path.join(base_dir, today)
     os.makedirs(today_dir, exist_ok=True)
-    
-    # Find the latest run number for today
-    run_number = 1
-    if os.path.exists(today_dir):
-        existing_files = [f for f in os.listdir(today_dir)]
-        if existing_files:
-            run_numbers = [int(f.split('_')[1]) for f in existing_files if len(f.split('_'))>1]
-            run_number = max(run_numbers) + 1
-            
-    datadir = os.path.join(today_dir, f"Run_{run_number:03d}_{suffix}")
-    os.makedirs(datadir, exist_ok=True)
-    
+    counter = os.path.join(today_dir, RUN_COUNTER)
+    with RunLock(today_dir):
+        run_number = _read_run_counter(counter)
+        if run_number is None:
+            run_number = last_run_number(today_dir)
+        while True:
+            run_number += 1
+            name = f"Run_{run_number:03d}" if suffix is None else f"Run_{run_number:03d}_{suffix}"
+            datadir = os.path.join(today_dir, name)
+            try:
+                os.mkdir(datadir)
+                break
+            except FileExistsError:
+                continue
+        _write_run_counter(counter, run_number)
+    return run_number, datadir
+
+def generate_filename(comment, base_dir):
+    # Generate filename in the directory of a new run
+    _, datadir = allocate_run(base_dir)
+    return os.path.join(datadir, comment)
+
+
+def generate_filedir(suffix, base_dir):
+    # Directory of a new run
+    _, datadir = allocate_run(base_dir, suffix)
     return datadir
 
 def convert_nm_eV(data):
@@ -79,18 +276,33 @@ def convert_nm_eV(data):
     e = 1.602176634e-19
     return  (1e12*h*c/e) / data
 
-# def zigzag_sweep(x_arr, y_arr, axis):
-#     path = []
-#     if axis == 'y':
-#         for y in y_arr:
-#             if y % 2 == 0: # Left to right
-#                 for x in x_arr: path.append((x, y))
-#             else: # Right to left
-#                 for x in x_arr[::-1]: path.append((x, y))
-#     elif axis == 'x':
-#         for x in x_arr:
-#             if x % 2 == 0:
-#                 for y in y_arr: path.append((x, y))
-#             else:
-#                 for y in y_arr[::-1]: path.append((x, y))
-#     return path
\ No newline at end of file
+SWEEP_ORDERS = ('sawtooth', 'snake')
+
+def line_direction(line, sweep_order = 'sawtooth'):
+    """
+    Direction of the fast axis in scan line number line (flat index over
+    the slow axes): 1 forward, -1 backward. In a snake sweep every odd
+    line runs backwards, so the fast axis never flies back.
+    """
+    if sweep_order not in SWEEP_ORDERS:
+        raise ValueError(f"sweep_order must be one of {SWEEP_ORDERS}, got {sweep_order}")
+    if sweep_order == 'snake' and line % 2 == 1:
+        return -1
+    return 1
+
+def fast_axis_position(sweep_index, line_len, sweep_order = 'sawtooth'):
+    """
+    Index into the fast sweep values of point sweep_index (in the order of
+    the scan). This is also the position of the point in the stored line,
+    the data is always stored in ascending index order.
+    """
+    line, pos = divmod(sweep_index, line_len)
+    if line_direction(line, sweep_order) == -1:
+        return line_len - 1 - pos
+    return pos
+
+def line_directions(sweep_lens, sweep_order = 'sawtooth'):
+    """Direction of every scan line, shape sweep_lens[:-1]."""
+    n_lines = int(np.prod(sweep_lens[:-1]))
+    directions = [line_direction(line, sweep_order) for line in range(n_lines)]
+    return np.array(directions, dtype = np.int8).reshape(sweep_lens[:-1])
@@ -4,6 +4,7 @@ sys.path.append(r'C:\Users\QPG\Documents\zerui_g15\C-hBN\base\experiment_base')
 sys.path.append(r'C:\Users\QPG\Documents\zerui_g15\C-hBN\base\experiment_base\zq_drivers')
 
 from zq_experiment_base import *
+from zq_adaptive import adaptive_scan, regrid, load_points
 from zq_utility import *
 from device_manager import *
 from daq_February2025 import *
@@ -16,6 +17,7 @@ import xarray as xr
 
 '''HP 4142B'''
 
+@point_cached
 def hp_current_getter(SMU):
     '''
     Wrapper to cirumvent HP readout buffer issue
@@ -38,48 +40,84 @@ def hp_current_getter(SMU):
             time.sleep(0.1)
         return np.mean(samples[:])
 
+@point_cached
+def hp_voltage_getter(SMU):
+    '''SMU.get_voltage, queried once per point by all params of the SMU'''
+    return SMU.get_voltage()
+
+def hp_currents_getter(channels):
+    '''
+    hp_current_getter of several SMUs with one HP transaction per sample
+    (HP4142B.get_currents)
+
+    Parameters
+    ----------
+    channels : list of int
+        e.g. [1, 3, 4]
+
+    Returns
+    -------
+    np.ndarray : Currents in A, in the order of channels
+
+    '''
+    with warnings.catch_warnings(action="ignore"):
+        samples = []
+        for i in range(5):
+            if i > 2:
+                samples.append(hp.get_currents(channels))
+            time.sleep(0.1)
+        return np.mean(samples, axis = 0)
+
+# Voltage setters step in voltage_safe_step (set_hp_V_defaults), for dry runs
+HP_RAMP = SafeStepRamp(step = 0.025)
+# get_voltage (*LRN?) returns the setpoint, read back every 10th point and
+# after another param set the SMU (channel)
+HP_READBACK = 10
+
 # Current in nA for the parameters 
 
 # # SMU 1
 # # Check init_settings for safety features
 V1  = Param("V_SMU1", units = 'V', 
-    getter = hp.SMU1.get_voltage,
-    setter = lambda val: hp.SMU1.set_voltage(val)
+    getter = lambda: hp_voltage_getter(hp.SMU1),
+    setter = lambda val: hp.SMU1.set_voltage(val), device = 'hp', ramp = HP_RAMP, channel = 'SMU1',
+    readback = HP_READBACK
     ) if not('hp' not in globals() or hp is None) else None
 
 I1  = Param("I_SMU1", units = 'nA', 
-    getter = lambda: hp_current_getter(hp.SMU1)*1e9) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_current_getter(hp.SMU1)*1e9, device = 'hp') if not('hp' not in globals() or hp is None) else None
 
 # # SMU 3
 # # Check init_settings for safety features
 V3  = Param("V_SMU3", units = 'V', 
-    getter = hp.SMU3.get_voltage,
-    setter = lambda val: hp.SMU3.set_voltage(val)) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_voltage_getter(hp.SMU3),
+    setter = lambda val: hp.SMU3.set_voltage(val), device = 'hp', ramp = HP_RAMP, channel = 'SMU3',
+    readback = HP_READBACK) if not('hp' not in globals() or hp is None) else None
             
 I3  = Param("I_SMU3", units = 'nA', 
-    getter = lambda: hp_current_getter(hp.SMU3)*1e9) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_current_getter(hp.SMU3)*1e9, device = 'hp') if not('hp' not in globals() or hp is None) else None
 
 # # SMU 4
 # # Check init_settings for safety features
 V4  = Param("V_SMU4", units = 'V', 
-    getter = hp.SMU4.get_voltage,
-    setter = lambda val: hp.SMU4.set_voltage(val)) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_voltage_getter(hp.SMU4),
+    setter = lambda val: hp.SMU4.set_voltage(val), device = 'hp', ramp = HP_RAMP, channel = 'SMU4',
+    readback = HP_READBACK) if not('hp' not in globals() or hp is None) else None
             
 I4  = Param("I_SMU4", units = 'nA', 
-    getter = lambda: hp_current_getter(hp.SMU4)*1e9) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_current_getter(hp.SMU4)*1e9, device = 'hp') if not('hp' not in globals() or hp is None) else None
 
 
 def v_134_setter(val):
-    hp.SMU1.set_voltage(val)
-    time.sleep(0.05)
-    hp.SMU3.set_voltage(val)
-    time.sleep(0.05)
-    hp.SMU4.set_voltage(val)
-    time.sleep(0.05)
+    '''SMU1, 3 and 4 to val, 0.05 s apart, in one round trip (pyro_batch)'''
+    b = Batch(hp, delay = 0.05)
+    for smu in ('SMU1', 'SMU3', 'SMU4'):
+        b.call(smu + '.set_voltage', val)
+    b.execute()
 
 Vall = Param("V_134", units = 'V', 
-    getter = hp.SMU3.get_voltage,
-    setter = v_134_setter) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_voltage_getter(hp.SMU3),
+    setter = v_134_setter, device = 'hp', channel = ('SMU1', 'SMU3', 'SMU4')) if not('hp' not in globals() or hp is None) else None
 
 ''' GATE VOLTAGES '''
 
@@ -94,11 +132,12 @@ def Vtg_setter(val):
         hp.SMU1.set_voltage(val)
 
 Vtg  = Param("Vtg", units = 'V', 
-    getter = hp.SMU1.get_voltage,
-    setter = Vtg_setter) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_voltage_getter(hp.SMU1),
+    setter = Vtg_setter, device = 'hp', ramp = HP_RAMP, channel = 'SMU1',
+    readback = HP_READBACK) if not('hp' not in globals() or hp is None) else None
 
 Itg  = Param("Itg", units = 'nA', 
-    getter = lambda: hp_current_getter(hp.SMU1)*1e9) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_current_getter(hp.SMU1)*1e9, device = 'hp') if not('hp' not in globals() or hp is None) else None
 
 
 VL_SAFE_MIN = -14
@@ -111,11 +150,12 @@ def VL_setter(val):
         hp.SMU3.set_voltage(val)
 
 VL  = Param("VL", units = 'V', 
-    getter = hp.SMU3.get_voltage,
-    setter = VL_setter) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_voltage_getter(hp.SMU3),
+    setter = VL_setter, device = 'hp', ramp = HP_RAMP, channel = 'SMU3',
+    readback = HP_READBACK) if not('hp' not in globals() or hp is None) else None
 
 IL  = Param("IL", units = 'nA', 
-    getter = lambda: hp_current_getter(hp.SMU3)*1e9) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_current_getter(hp.SMU3)*1e9, device = 'hp') if not('hp' not in globals() or hp is None) else None
 
 
 VR_SAFE_MIN = -14
@@ -128,11 +168,17 @@ def VR_setter(val):
         hp.SMU4.set_voltage(val)
 
 VR  = Param("VR", units = 'V', 
-    getter = hp.SMU4.get_voltage,
-    setter = VR_setter) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_voltage_getter(hp.SMU4),
+    setter = VR_setter, device = 'hp', ramp = HP_RAMP, channel = 'SMU4',
+    readback = HP_READBACK) if not('hp' not in globals() or hp is None) else None
 
 IR  = Param("IR", units = 'nA', 
-    getter = lambda: hp_current_getter(hp.SMU4)*1e9) if not('hp' not in globals() or hp is None) else None
+    getter = lambda: hp_current_getter(hp.SMU4)*1e9, device = 'hp') if not('hp' not in globals() or hp is None) else None
+
+# SMU currents measured together in meas_scan, one HP query per sample of
+# only the SMUs of the measured params (I1 and Itg are both SMU1, ...)
+I_SMU = ParamGroup([I1, I3, I4, Itg, IL, IR], keys = [1, 3, 4, 1, 3, 4],
+    getter = lambda channels: hp_currents_getter(channels)*1e9, device = 'hp') if not('hp' not in globals() or hp is None) else None
 
 
 ''' Vdiff , Vsum Basis  '''
@@ -325,65 +371,81 @@ if ws is not None:
         return da
     
     def wlen_getter():
-        curr_exp = ExposTime.getter()
-        curr_frames = NumFrames.getter()
-        ExposTime.setter(0.01)
-        NumFrames.setter(1)
-        spectra, wl = ws.get_spectrum(wlen = True)
-        ExposTime.setter(curr_exp)
-        NumFrames.setter(curr_frames)
+        '''short single frame for the wavelengths, two round trips (pyro_batch)'''
+        b = Batch(ws)
+        b.get('exposure_time').get('num_frames')
+        b.set('exposure_time', 0.01).set('num_frames', 1)
+        b.call('get_spectrum', wlen = True)
+        curr_exp, curr_frames, _, _, (spectra, wl) = b.execute()
+        b.set('exposure_time', curr_exp).set('num_frames', curr_frames)
+        b.execute()
         return np.array(wl,dtype = float)
     
         
     Spec = Param("Spec", units = 'counts', long_name = 'Intensity', 
-        getter = spec_getter) if not('ws' not in globals() or ws is None) else None
+        getter = spec_getter, device = 'ws') if not('ws' not in globals() or ws is None) else None
     Wlen = Param("Wlen", units = 'nm', long_name = 'Wavelengths', 
-        getter = wlen_getter) if not('ws' not in globals() or ws is None ) else None
+        getter = wlen_getter, device = 'ws') if not('ws' not in globals() or ws is None ) else None
     
     ExposTime = Param("ExposTime", units = 's', long_name = 'Exposure time', 
         getter = lambda: ws.exposure_time, 
-        setter = (lambda x: setattr(ws,'exposure_time',x))) if not('ws' not in globals() or ws is None ) else None
+        setter = (lambda x: setattr(ws,'exposure_time',x)), device = 'ws') if not('ws' not in globals() or ws is None ) else None
     CentWavelen = Param("CentWavelen", units = 'nm', long_name = 'Center wavelength', 
         getter = lambda: ws.wavelength, 
-        setter = lambda x: setattr(ws,'wavelength',x)) if not('ws' not in globals() or ws is None ) else None
+        setter = lambda x: setattr(ws,'wavelength',x), device = 'ws') if not('ws' not in globals() or ws is None ) else None
     CCD_Temp = Param("CCD_Temperature", units = 'deg', long_name = 'CCD temperature', 
-        getter = lambda: ws.temperature ) if not('ws' not in globals() or ws is None ) else None
+        getter = lambda: ws.temperature, device = 'ws') if not('ws' not in globals() or ws is None ) else None
     Spec_Inten_sum = Param("Intensity_sum", 
         getter = (lambda : np.sum(Spec.pv.data)) if ('Spec' in locals()) else None )
     
     NumFrames = Param("NumFrames", long_name = 'Frame numbers', 
         getter = lambda: ws.num_frames,
-        setter = (lambda x: setattr(ws,'num_frames',x))) if not('ws' not in globals() or ws is None ) else None    
+        setter = (lambda x: setattr(ws,'num_frames',x)), device = 'ws') if not('ws' not in globals() or ws is None ) else None    
 
 
 ''' DAQ Card '''
 
+# hw allows meas_scan to run SCx / SCy lines hardware timed (zq_line_compiler)
 SCx = Param("ScannerX", units = 'V',
             getter = lambda: daq.ao1 * 15,
-            setter = lambda val: daq.set_ao1(val/15))
+            setter = lambda val: daq.set_ao1(val/15),
+            hw = DAQ_AO(daq, 'ao1', scale = 1/15),
+            ramp = RateRamp(rate = 1, scale = 1/15),
+            device = 'daq')
 SCy = Param("ScannerY", units = 'V',
             getter = lambda: daq.ao2 * 15,
-            setter = lambda val: daq.set_ao2(val/15))
+            setter = lambda val: daq.set_ao2(val/15),
+            hw = DAQ_AO(daq, 'ao2', scale = 1/15),
+            ramp = RateRamp(rate = 1, scale = 1/15),
+            device = 'daq')
 
 P_det = Param("Power", units = 'muW',
-            getter = lambda: daq.measure_ai(ai_channel=1)[0])
+            getter = lambda: daq.measure_ai(ai_channel=1)[0],
+            hw = DAQ_AI(daq, 'ai1', dwell = 0.1, sampling_rate = 1000),
+            device = 'daq')
 P_in = Param("Power", units = 'mW',
             getter = lambda: -1.0281913515947234 * np.tanh(1.85999284283525 * (daq.ao0 - 1.7360840044990562)) + 1.0031464148496454,
-            setter = lambda val: daq.set_ao0(0.49528206859044854 * np.arctanh(-0.9949420499964587 * (val - 0.9933539705788575)) + 1.7458937905819318))
+            setter = lambda val: daq.set_ao0(0.49528206859044854 * np.arctanh(-0.9949420499964587 * (val - 0.9933539705788575)) + 1.7458937905819318),
+            device = 'daq')
 
 c_APD = Param("Counts", units = 'counts',
-            getter = lambda: get_one_ctrate(sampling_rate=3e4, acq_time=0.05, channel='ctr2', device = 'Dev1/'))
+            getter = lambda: get_one_ctrate(sampling_rate=3e4, acq_time=0.05, channel='ctr2', device = 'Dev1/'),
+            hw = DAQ_Counter(daq, 'ctr2', dwell = 0.05, sampling_rate = 3e4),
+            device = 'daq')
 
 ''' ELL Angle '''
 ell1_angle = Param("ELL1 Angle", units = 'deg',
             getter = lambda: ell1.angle,
-            setter = lambda val: setattr(ell1, 'angle', val))
+            setter = lambda val: setattr(ell1, 'angle', val),
+            device = 'ell1')
 ell2_angle = Param("ELL2 Angle", units = 'deg',
             getter = lambda: ell2.angle,
-            setter = lambda val: setattr(ell2, 'angle', val))
+            setter = lambda val: setattr(ell2, 'angle', val),
+            device = 'ell2')
 ell3_angle = Param("ELL3 Angle", units = 'deg',
             getter = lambda: ell3.angle,
-            setter = lambda val: setattr(ell3, 'angle', val))
+            setter = lambda val: setattr(ell3, 'angle', val),
+            device = 'ell3')
 
 
 